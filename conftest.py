@@ -6,6 +6,14 @@ from database import Base, get_db
 from main import app
 from models import User, Account, KYCDocument
 from auth import get_password_hash, create_access_token
+import fraud
+import account_directory
+import kyc_previews
+import load_shedding
+import revocation
+import profiling
+import slow_queries
+import versions
 import os
 
 # Test database
@@ -29,6 +37,59 @@ def db_session(db_engine):
     transaction.rollback()
     connection.close()
 
+@pytest.fixture(autouse=True)
+def fresh_fraud_scorer(monkeypatch):
+    # Velocity features are process-wide; give every test a clean slate
+    scorer = fraud.FraudScorer()
+    monkeypatch.setattr(fraud, "scorer", scorer)
+    return scorer
+
+@pytest.fixture(autouse=True)
+def fresh_account_directory(monkeypatch, tmp_path):
+    directory = account_directory.AccountDirectory(str(tmp_path / "accounts.dir"), capacity=1024)
+    monkeypatch.setattr(account_directory, "directory", directory)
+    yield directory
+    directory.close()
+
+@pytest.fixture(autouse=True)
+def fresh_preview_service(monkeypatch, tmp_path):
+    service = kyc_previews.PreviewService(kyc_previews.PreviewCache(str(tmp_path / "previews"), max_bytes=1 << 20), workers=1)
+    monkeypatch.setattr(kyc_previews, "previews", service)
+    yield service
+    service.shutdown()
+
+@pytest.fixture(autouse=True)
+def fresh_revocation_list(monkeypatch):
+    revocations = revocation.RevocationList(capacity=64)
+    monkeypatch.setattr(revocation, "revocations", revocations)
+    return revocations
+
+@pytest.fixture(autouse=True)
+def fresh_version_counters(monkeypatch, tmp_path):
+    counters = versions.VersionCounters(str(tmp_path / "versions"), slots=1024)
+    monkeypatch.setattr(versions, "versions", counters)
+    yield counters
+    counters.close()
+
+@pytest.fixture(autouse=True)
+def fresh_profile_store(monkeypatch, tmp_path):
+    store = profiling.ProfileStore(str(tmp_path / "profiles"))
+    monkeypatch.setattr(profiling, "profiles", store)
+    return store
+
+@pytest.fixture(autouse=True)
+def fresh_slow_query_log(monkeypatch):
+    recorder = slow_queries.SlowQueryLog()
+    monkeypatch.setattr(slow_queries, "recorder", recorder)
+    yield recorder
+    recorder.shutdown()
+
+@pytest.fixture(autouse=True)
+def fresh_limiter(monkeypatch):
+    limiter = load_shedding.AdaptiveLimiter()
+    monkeypatch.setattr(load_shedding, "limiter", limiter)
+    return limiter
+
 @pytest.fixture
 def client(db_session):
     def override_get_db():
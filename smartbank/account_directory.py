@@ -0,0 +1,288 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.orm import Session
+
+from database import engine
+from models import Account, AccountType
+
+# Shared by every worker process on the host; /dev/shm keeps it in RAM
+DIRECTORY_PATH = os.environ.get(
+    "SMARTBANK_DIRECTORY_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "smartbank-accounts.dir")
+)
+DIRECTORY_CAPACITY = int(os.environ.get("SMARTBANK_DIRECTORY_CAPACITY", str(1 << 20)))
+
+MAGIC = b"SBDIR002"
+# magic, capacity, version (odd while a write is in progress), entry count,
+# database identity, highest account id published
+HEADER = struct.Struct("<8sQQQQQ")
+HEADER_SIZE = 64
+# account_number, id, user_id, is_active, account_type, stripe_count, used
+SLOT = struct.Struct("<20sqqBBBB")
+SLOT_SIZE = 48
+VERSION_OFFSET = 16
+COUNT_OFFSET = 24
+MAX_ID_OFFSET = 40
+MAX_PROBES = 64
+# Reads seeing a write in progress retry this often, then fall back to the database
+READ_RETRIES = 100
+
+# A file written for another database must not be trusted; the password is not part of it
+DATABASE_IDENTITY = int.from_bytes(
+    hashlib.blake2b(engine.url.render_as_string(hide_password=True).encode(), digest_size=8).digest(), "little"
+)
+
+ACCOUNT_TYPES = list(AccountType)
+
+DirectoryEntry = namedtuple("DirectoryEntry", ["id", "user_id", "is_active", "account_type", "stripe_count"])
+
+# A miss reads only the published columns, as a Core row
+ACCOUNT_BY_NUMBER = select(
+    Account.account_number, Account.id, Account.user_id, Account.is_active, Account.account_type, Account.stripe_count
+).where(Account.account_number == bindparam("account_number"))
+
+class AccountDirectory:
+    """account_number -> (id, user_id, is_active, account_type) in shared memory.
+
+    The table is a fixed-capacity, linear-probing hash table in a memory-mapped
+    file, so all uvicorn workers on a host read the same copy. Writers take an
+    exclusive flock and bump the header version to odd while they write and back
+    to even afterwards; readers retry a bounded number of times if the version
+    moved under them, then report a miss. A version still odd when the lock is
+    next taken belongs to a writer that died mid-write, and the table is wiped.
+    Each process also keeps a plain dict of resolved entries that it throws
+    away whenever the shared version changes.
+
+    The file outlives the processes, so its header records which database it
+    was filled from and the highest account id in it; see `check`.
+    """
+
+    def __init__(self, path=DIRECTORY_PATH, capacity=DIRECTORY_CAPACITY, identity=DATABASE_IDENTITY):
+        if capacity & (capacity - 1):
+            raise ValueError("Directory capacity must be a power of two")
+        self.path = path
+        self.capacity = capacity
+        self.identity = identity
+        self._mm = None
+        self._fd = None
+        self._open_lock = threading.Lock()
+        self._local = {}
+        self._local_version = -1
+
+    def _open(self):
+        with self._open_lock:
+            if self._mm is not None:
+                return
+            size = HEADER_SIZE + self.capacity * SLOT_SIZE
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size != size:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                mm = mmap.mmap(fd, size)
+                magic, capacity, version, _, identity, _ = HEADER.unpack_from(mm, 0)
+                if magic != MAGIC or capacity != self.capacity or identity != self.identity:
+                    mm[:size] = bytes(size)
+                    HEADER.pack_into(mm, 0, MAGIC, self.capacity, 0, 0, self.identity, 0)
+                elif version & 1:
+                    self._wipe(mm, version + 1)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._fd = fd
+            self._mm = mm
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            os.close(self._fd)
+            self._mm = None
+            self._fd = None
+
+    @property
+    def version(self):
+        if self._mm is None:
+            self._open()
+        return struct.unpack_from("<Q", self._mm, VERSION_OFFSET)[0]
+
+    def __len__(self):
+        if self._mm is None:
+            self._open()
+        return HEADER.unpack_from(self._mm, 0)[3]
+
+    # Reads
+
+    def get(self, account_number):
+        """Entry for `account_number`, or None if the directory doesn't hold it."""
+        mm = self._mm
+        if mm is None:
+            self._open()
+            mm = self._mm
+        version = struct.unpack_from("<Q", mm, VERSION_OFFSET)[0]
+        if version == self._local_version:
+            entry = self._local.get(account_number)
+            if entry is not None:
+                return entry
+        else:
+            self._local = {}
+            self._local_version = version
+
+        key = account_number.encode()
+        for attempt in range(READ_RETRIES):
+            before = struct.unpack_from("<Q", mm, VERSION_OFFSET)[0]
+            if not before & 1:
+                entry = self._probe(mm, key)
+                if struct.unpack_from("<Q", mm, VERSION_OFFSET)[0] == before:
+                    break
+            # Let the writer run; it may be on this CPU
+            time.sleep(0 if attempt < 10 else 0.0001)
+        else:
+            return None
+        if entry is not None and before == self._local_version:
+            self._local[account_number] = entry
+        return entry
+
+    def lookup(self, account_number, db: Session = None):
+        # Directory first; on a miss, read the account once and remember it
+        entry = self.get(account_number)
+        if entry is not None or db is None:
+            return entry
+        account = db.connection().execute(ACCOUNT_BY_NUMBER, {"account_number": account_number}).first()
+        if account is None:
+            return None
+        return self.publish(account)
+
+    def _probe(self, mm, key):
+        index = zlib.crc32(key) & (self.capacity - 1)
+        for _ in range(MAX_PROBES):
+            number, account_id, user_id, is_active, account_type, stripes, used = SLOT.unpack_from(
+                mm, HEADER_SIZE + index * SLOT_SIZE
+            )
+            if not used:
+                return None
+            if number.rstrip(b"\0") == key:
+                return DirectoryEntry(account_id, user_id, bool(is_active), ACCOUNT_TYPES[account_type], stripes)
+            index = (index + 1) & (self.capacity - 1)
+        return None
+
+    # Writes
+
+    def publish(self, account):
+        """Insert or refresh an Account or account row; call after the change is committed."""
+        account_type = account.account_type
+        if not isinstance(account_type, AccountType):
+            account_type = AccountType[str(account_type).upper()]
+        entry = DirectoryEntry(
+            account.id, account.user_id, account.is_active is not False,
+            account_type, account.stripe_count or 0
+        )
+        self._write([(account.account_number, entry)])
+        return entry
+
+    def load(self, db: Session, batch_size=10000):
+        """Fill the directory from `accounts`; used to warm it at startup."""
+        rows = db.query(
+            Account.account_number, Account.id, Account.user_id, Account.is_active,
+            Account.account_type, Account.stripe_count
+        ).yield_per(batch_size)
+        batch = []
+        loaded = 0
+        for number, account_id, user_id, is_active, account_type, stripes in rows:
+            batch.append((number, DirectoryEntry(account_id, user_id, is_active is not False, account_type, stripes or 0)))
+            if len(batch) >= batch_size:
+                loaded += self._write(batch)
+                batch = []
+        if batch:
+            loaded += self._write(batch)
+        return loaded
+
+    def clear(self):
+        # Used after bulk loads that bypass publish(); entries refill lazily
+        if self._mm is None:
+            self._open()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            version = self._begin_write()
+            self._wipe(self._mm, version)
+            self._end_write(version)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def check(self, db: Session):
+        """Clear the directory if it names accounts newer than any in `db`.
+
+        That happens when the database was restored from a backup while the
+        file survived, and account ids are about to be reused. Returns True if
+        the directory was cleared.
+        """
+        if self._mm is None:
+            self._open()
+        highest = db.execute(select(func.max(Account.id))).scalar() or 0
+        if struct.unpack_from("<Q", self._mm, MAX_ID_OFFSET)[0] <= highest:
+            return False
+        self.clear()
+        return True
+
+    def _write(self, items):
+        if self._mm is None:
+            self._open()
+        mm = self._mm
+        written = 0
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            version = self._begin_write()
+            count, _, highest = struct.unpack_from("<QQQ", mm, COUNT_OFFSET)
+            for account_number, entry in items:
+                key = account_number.encode()
+                index = zlib.crc32(key) & (self.capacity - 1)
+                for _ in range(MAX_PROBES):
+                    offset = HEADER_SIZE + index * SLOT_SIZE
+                    number, *_, used = SLOT.unpack_from(mm, offset)
+                    if not used or number.rstrip(b"\0") == key:
+                        SLOT.pack_into(
+                            mm, offset, key, entry.id, entry.user_id, int(entry.is_active),
+                            ACCOUNT_TYPES.index(entry.account_type), entry.stripe_count, 1
+                        )
+                        count += 0 if used else 1
+                        highest = max(highest, entry.id)
+                        written += 1
+                        break
+                    index = (index + 1) & (self.capacity - 1)
+                # A full probe run leaves the account out; lookups fall back to the DB
+            struct.pack_into("<Q", mm, COUNT_OFFSET, count)
+            struct.pack_into("<Q", mm, MAX_ID_OFFSET, highest)
+            self._end_write(version)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return written
+
+    def _begin_write(self):
+        version = struct.unpack_from("<Q", self._mm, VERSION_OFFSET)[0] + 1
+        if not version & 1:
+            # Odd under the lock: the last writer died mid-write and its slots may be torn
+            self._wipe(self._mm, version)
+            version += 1
+        struct.pack_into("<Q", self._mm, VERSION_OFFSET, version)
+        return version
+
+    def _wipe(self, mm, version):
+        # Caller holds the lock; an odd version keeps readers off the slots meanwhile
+        struct.pack_into("<Q", mm, VERSION_OFFSET, version | 1)
+        mm[HEADER_SIZE:] = bytes(self.capacity * SLOT_SIZE)
+        HEADER.pack_into(mm, 0, MAGIC, self.capacity, version | 1, 0, self.identity, 0)
+        struct.pack_into("<Q", mm, VERSION_OFFSET, version)
+
+    def _end_write(self, version):
+        struct.pack_into("<Q", self._mm, VERSION_OFFSET, version + 1)
+
+directory = AccountDirectory()
@@ -0,0 +1,130 @@
+"""Daily interest accrual for SAVINGS and FD accounts.
+
+    python accrue_interest.py [--date 2025-01-31] [--chunk-size 5000] [--sleep-ratio 0.5]
+
+Works through `accounts` in primary-key ranges. Each range is one transaction
+that posts INTEREST ledger rows with INSERT ... SELECT, credits the balances
+with a single UPDATE and advances the checkpoint, so a crashed run resumes
+after the last finished range and never pays interest twice.
+"""
+import argparse
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import String, and_, case, cast, func, insert, literal, or_, select, update
+
+from database import SessionLocal
+from models import Account, AccountType, BatchCheckpoint, Transaction, TransactionType
+import versions
+
+JOB_NAME = "accrue_interest"
+
+# Annual rates; interest accrues daily at rate / 365
+INTEREST_RATES = {
+    AccountType.SAVINGS: Decimal("0.035"),
+    AccountType.FD: Decimal("0.0675"),
+}
+DAYS_IN_YEAR = 365
+
+def daily_interest():
+    # Interest for one day on the pre-update balance, rounded to paise
+    daily_rate = case(
+        *[(Account.account_type == account_type, literal(rate / DAYS_IN_YEAR))
+          for account_type, rate in INTEREST_RATES.items()],
+        else_=literal(Decimal("0"))
+    )
+    return func.round(Account.balance * daily_rate, 2)
+
+def eligible(low, high):
+    return and_(
+        Account.id >= low,
+        Account.id < high,
+        Account.account_type.in_(list(INTEREST_RATES)),
+        Account.is_active == True,
+        Account.balance > 0,
+        # Striped balances live in account_balance_stripes and are not accrued here
+        or_(Account.stripe_count == None, Account.stripe_count == 0),
+        daily_interest() > 0
+    )
+
+def load_checkpoint(db, run_key):
+    checkpoint = db.query(BatchCheckpoint).filter(
+        BatchCheckpoint.job_name == JOB_NAME,
+        BatchCheckpoint.run_key == run_key
+    ).first()
+    if checkpoint is None:
+        checkpoint = BatchCheckpoint(job_name=JOB_NAME, run_key=run_key, last_id=0)
+        db.add(checkpoint)
+        db.commit()
+    return checkpoint
+
+def accrue_interest(session_factory=SessionLocal, run_date=None, chunk_size=5000, sleep_ratio=0.5, log=print):
+    run_date = run_date or date.today()
+    run_key = run_date.isoformat()
+    posted_at = datetime.combine(run_date, datetime.min.time())
+    db = session_factory()
+    try:
+        checkpoint = load_checkpoint(db, run_key)
+        if checkpoint.completed_at is not None:
+            log(f"Interest for {run_key} already accrued")
+            return 0
+
+        max_id = db.query(func.max(Account.id)).scalar() or 0
+        low = checkpoint.last_id + 1
+        if low > 1:
+            log(f"Resuming {run_key} after account id {checkpoint.last_id}")
+
+        credited = 0
+        started = time.monotonic()
+        while low <= max_id:
+            high = low + chunk_size
+            chunk_started = time.monotonic()
+
+            # Ledger rows first, computed from the balances before the credit
+            db.execute(insert(Transaction).from_select(
+                ["transaction_id", "to_account_id", "amount", "transaction_type", "description", "status", "created_at"],
+                select(
+                    literal(f"INT{run_date:%Y%m%d}-") + cast(Account.id, String),
+                    Account.id,
+                    daily_interest(),
+                    literal(TransactionType.INTEREST, Transaction.__table__.c.transaction_type.type),
+                    literal("Daily interest"),
+                    literal("completed"),
+                    literal(posted_at)
+                ).where(eligible(low, high))
+            ))
+            result = db.execute(
+                update(Account)
+                .where(eligible(low, high))
+                .values(balance=Account.balance + daily_interest())
+                .execution_options(synchronize_session=False)
+            )
+            checkpoint.last_id = high - 1
+            versions.bump_after_commit(db, versions.ACCOUNTS_ALL)
+            db.commit()
+            credited += result.rowcount
+
+            elapsed = time.monotonic() - chunk_started
+            rate = credited / max(time.monotonic() - started, 1e-9)
+            log(f"{run_key}: ids < {high} done, {credited} accounts credited ({rate:.0f}/s)")
+            low = high
+
+            # Yield the database to online traffic in proportion to our own work
+            if sleep_ratio > 0 and low <= max_id:
+                time.sleep(elapsed * sleep_ratio)
+
+        checkpoint.completed_at = datetime.utcnow()
+        db.commit()
+        log(f"Interest for {run_key} accrued on {credited} accounts")
+        return credited
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accrue daily interest on SAVINGS and FD accounts")
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="Accrual date (default: today)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Account ids per transaction")
+    parser.add_argument("--sleep-ratio", type=float, default=0.5, help="Pause after each chunk, as a fraction of its run time")
+    args = parser.parse_args()
+    accrue_interest(run_date=args.date, chunk_size=args.chunk_size, sleep_ratio=args.sleep_ratio)
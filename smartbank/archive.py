@@ -0,0 +1,239 @@
+"""Cold storage for old months of `transactions` and `audit_logs`.
+
+    python archive.py [--retention-months 12] [--chunk-size 10000]
+
+Each table is split into calendar months by its timestamp column. Months
+older than the retention window are written, oldest first, to one
+compressed NumPy file per month under SMARTBANK_ARCHIVE_DIR. Files are
+columnar: integers as int64, money as int64 paise, times as datetime64[us]
+and text as UTF-8 bytes, with a `<column>__null` mask for nullable
+columns. Then the month's rows are deleted from the hot table, so the table
+and its indexes only ever hold the retention window.
+
+An `archived_partitions` row is committed after the file is durable and
+before any delete. Readers therefore treat everything before the first
+unarchived month (`archive_boundary`) as archived and everything from it
+on as hot. That split is correct even while an archive run is halfway
+through deleting a month. An interrupted run finishes its deletes on the
+next run.
+
+MySQL's native partitioning is not used. A partitioned InnoDB table cannot
+have foreign keys, and every unique key would have to include the date.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+import numpy as np
+from sqlalchemy import DateTime, Enum, Integer, Numeric, and_, delete, func, or_, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import ArchivedPartition, AuditLog, Transaction
+
+ARCHIVE_DIR = os.environ.get("SMARTBANK_ARCHIVE_DIR", "archive")
+ARCHIVE_RETENTION_MONTHS = int(os.environ.get("SMARTBANK_ARCHIVE_RETENTION_MONTHS", "12"))
+ARCHIVE_CACHE_MONTHS = 13  # account/time columns of the months a 366-day statement spans
+KEY_COLUMNS = ("from_account_id", "to_account_id", "created_at")
+
+# Archived tables and the column that puts a row in its month
+TABLES = {
+    "transactions": (Transaction, Transaction.created_at),
+    "audit_logs": (AuditLog, AuditLog.timestamp),
+}
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def month_key(month):
+    return f"{month:%Y-%m}"
+
+def parse_month(key):
+    return datetime.strptime(key, "%Y-%m")
+
+def encode(column, values):
+    """{name: array}, plus a null mask for nullable columns."""
+    type_ = column.type
+    if isinstance(type_, Enum):
+        values = [value.value if hasattr(value, "value") else value for value in values]
+    if isinstance(type_, Integer):
+        array = np.array([value or 0 for value in values], dtype=np.int64)
+    elif isinstance(type_, Numeric):
+        array = np.array([int((Decimal(value) * 100).to_integral_value()) if value is not None else 0
+                          for value in values], dtype=np.int64)
+    elif isinstance(type_, DateTime):
+        array = np.array(values, dtype="datetime64[us]")
+    else:
+        # Bytes are a quarter the size of NumPy's UCS-4 strings
+        array = np.array([b"" if value is None else str(value).encode() for value in values], dtype=bytes)
+    arrays = {column.name: array}
+    if column.nullable:
+        arrays[column.name + "__null"] = np.array([value is None for value in values], dtype=bool)
+    return arrays
+
+def decode(column, arrays, index):
+    if column.nullable and arrays[column.name + "__null"][index]:
+        return None
+    value = arrays[column.name][index]
+    type_ = column.type
+    if isinstance(type_, Integer):
+        return int(value)
+    if isinstance(type_, Numeric):
+        return Decimal(int(value)) / 100
+    if isinstance(type_, DateTime):
+        return value.astype(datetime)
+    return value.decode()
+
+def as_row(instance):
+    # A hot ORM row in the same shape as decode_rows gives archived ones
+    row = {}
+    for column in instance.__table__.columns:
+        value = getattr(instance, column.name)
+        row[column.name] = value.value if hasattr(value, "value") else value
+    return row
+
+def read_partition(path, columns=None):
+    # Members of an .npz decompress independently, so unread columns cost nothing
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in (columns or data.files)}
+
+@lru_cache(maxsize=ARCHIVE_CACHE_MONTHS)
+def load_keys(path):
+    # Archived months never change, so a path identifies its contents
+    return read_partition(path, KEY_COLUMNS)
+
+def decode_rows(table_name, arrays, indices):
+    columns = list(TABLES[table_name][0].__table__.columns)
+    return [{column.name: decode(column, arrays, i) for column in columns} for i in indices]
+
+def archive_boundary(db: Session, table_name):
+    """Start of the first month still in the hot table, or None if nothing is archived."""
+    newest = db.query(func.max(ArchivedPartition.month)).filter(ArchivedPartition.table_name == table_name).scalar()
+    return add_months(parse_month(newest), 1) if newest else None
+
+def partitions(db: Session, table_name, start=None, end=None):
+    # Archived months overlapping [start, end)
+    query = db.query(ArchivedPartition).filter(ArchivedPartition.table_name == table_name)
+    if start is not None:
+        query = query.filter(ArchivedPartition.month >= month_key(month_start(start)))
+    if end is not None:
+        query = query.filter(ArchivedPartition.month <= month_key(end - timedelta(microseconds=1)))
+    return query.order_by(ArchivedPartition.month).all()
+
+class Archiver:
+    """Moves months older than `retention_months` out of the hot tables."""
+
+    def __init__(self, session_factory=SessionLocal, directory=ARCHIVE_DIR,
+                 retention_months=ARCHIVE_RETENTION_MONTHS, chunk_size=10000, log=print, now=None):
+        self.session_factory = session_factory
+        self.directory = directory
+        self.retention_months = retention_months
+        self.chunk_size = chunk_size
+        self.log = log
+        self.now = now
+
+    def run(self):
+        return {table_name: self.archive_table(table_name) for table_name in TABLES}
+
+    def archive_table(self, table_name):
+        model, column = TABLES[table_name]
+        cutoff = add_months(month_start(self.now or datetime.utcnow()), -self.retention_months)
+        db = self.session_factory()
+        try:
+            for partition in db.query(ArchivedPartition).filter(
+                ArchivedPartition.table_name == table_name,
+                ArchivedPartition.completed_at == None
+            ).order_by(ArchivedPartition.month).all():
+                self._purge(db, model, column, partition)
+
+            archived = []
+            boundary = archive_boundary(db, table_name)
+            while True:
+                oldest = db.query(func.min(column)).scalar()
+                if oldest is None:
+                    break
+                month = month_start(oldest)
+                if boundary is not None and month < boundary:
+                    raise RuntimeError(f"{table_name} has rows dated {oldest}, inside the already archived {month_key(month)}")
+                if add_months(month, 1) > cutoff:
+                    break
+                partition = self._write_month(db, table_name, model, column, month)
+                self._purge(db, model, column, partition)
+                archived.append(partition.month)
+                boundary = add_months(month, 1)
+            return archived
+        finally:
+            db.close()
+
+    def _write_month(self, db, table_name, model, column, month):
+        started = time.monotonic()
+        end = add_months(month, 1)
+        columns = list(model.__table__.columns)
+        chunks = {}
+        rows_written = 0
+        last = None
+        while True:
+            # Keyset on (timestamp, id) so every chunk is one index range scan
+            query = select(*columns).where(column >= month, column < end)
+            if last is not None:
+                query = query.where(or_(column > last[0], and_(column == last[0], model.id > last[1])))
+            rows = db.execute(query.order_by(column, model.id).limit(self.chunk_size)).all()
+            if not rows:
+                break
+            for index, c in enumerate(columns):
+                for name, array in encode(c, [row[index] for row in rows]).items():
+                    chunks.setdefault(name, []).append(array)
+            rows_written += len(rows)
+            last = (getattr(rows[-1], column.name), rows[-1].id)
+
+        key = month_key(month)
+        folder = os.path.join(self.directory, table_name)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{key}.npz")
+        fd, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        with os.fdopen(fd, "wb") as output:
+            np.savez_compressed(output, **{name: np.concatenate(parts) for name, parts in chunks.items()})
+            output.flush()
+            os.fsync(output.fileno())  # the hot rows are deleted next
+        os.replace(temp_path, path)
+
+        partition = ArchivedPartition(table_name=table_name, month=key, path=path, row_count=rows_written)
+        db.add(partition)
+        db.commit()
+        self.log(f"{table_name} {key}: {rows_written} rows archived to {path} in {time.monotonic() - started:.1f}s")
+        return partition
+
+    def _purge(self, db, model, column, partition):
+        month = parse_month(partition.month)
+        end = add_months(month, 1)
+        deleted = 0
+        while True:
+            ids = [row_id for (row_id,) in db.execute(
+                select(model.id).where(column >= month, column < end).limit(self.chunk_size)
+            )]
+            if not ids:
+                break
+            db.execute(delete(model).where(model.id.in_(ids)))
+            db.commit()
+            deleted += len(ids)
+        partition.completed_at = datetime.utcnow()
+        db.commit()
+        self.log(f"{partition.table_name} {partition.month}: {deleted} hot rows deleted")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old months of transactions and audit logs to the archive")
+    parser.add_argument("--retention-months", type=int, default=ARCHIVE_RETENTION_MONTHS,
+                        help="Whole months to keep in the hot tables before the current one")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows read or deleted per statement")
+    args = parser.parse_args()
+    result = Archiver(retention_months=args.retention_months, chunk_size=args.chunk_size).run()
+    for table_name, months in result.items():
+        print(f"{table_name}: {', '.join(months) if months else 'nothing to archive'}")
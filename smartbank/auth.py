@@ -2,20 +2,57 @@ from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 import hashlib
+import uuid
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
 from database import get_db
 from models import User
+import revocation
 import schemas
 
 # Security configuration
 SECRET_KEY = "your-secret-key-here-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = 7
+STREAM_TICKET_EXPIRE_SECONDS = 30
 
 security = HTTPBearer()
 
+class UserRecord:
+    """A user as a Core row mapped onto slots, instead of an ORM instance.
+
+    Every authenticated request looks its user up. A plain record skips the
+    ORM's per-row instrumentation and identity map, which cost more than the
+    indexed lookup itself. It carries what the routes read, including every
+    UserResponse field, so it serialises as the profile like a User would.
+    """
+    __slots__ = ("id", "email", "phone", "first_name", "last_name", "date_of_birth", "address", "role",
+                 "is_active", "created_at", "password_hash")
+
+    def __init__(self, id, email, phone, first_name, last_name, date_of_birth, address, role, is_active,
+                 created_at, password_hash):
+        self.id = id
+        self.email = email
+        self.phone = phone
+        self.first_name = first_name
+        self.last_name = last_name
+        self.date_of_birth = date_of_birth
+        self.address = address
+        self.role = role
+        self.is_active = is_active
+        self.created_at = created_at
+        self.password_hash = password_hash
+
+# Built once; the compiled form is reused from SQLAlchemy's statement cache
+USER_BY_EMAIL = select(*[getattr(User, name) for name in UserRecord.__slots__]).where(User.email == bindparam("email"))
+
+def user_by_email(db: Session, email: str):
+    row = db.connection().execute(USER_BY_EMAIL, {"email": email}).first()
+    return UserRecord(*row) if row is not None else None
+
 def verify_password(plain_password, hashed_password):
     return get_password_hash(plain_password) == hashed_password
 
@@ -28,34 +65,64 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # jti identifies the token for revocation
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex, "type": "access"})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
+    to_encode = data.copy()
+    expire = datetime.utcnow() + (expires_delta or timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex, "type": "refresh"})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def create_stream_ticket(data: dict):
+    # Travels in a URL, where it may be logged: short-lived, only good for /api/events, redeemed once
+    to_encode = data.copy()
+    expire = datetime.utcnow() + timedelta(seconds=STREAM_TICKET_EXPIRE_SECONDS)
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex, "type": "stream"})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
 def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(User).filter(User.email == email).first()
+    user = user_by_email(db, email)
     if not user:
         return False
     if not verify_password(password, user.password_hash):
         return False
     return user
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+def decode_token(token: str, db: Session, token_type: str = "access"):
+    """Validated, unrevoked claims of a token of the given type, or 401."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(email=email)
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.email == token_data.email).first()
-    if user is None:
+    # Tokens issued before refresh tokens existed carry no type and are access tokens
+    if payload.get("sub") is None or payload.get("type", "access") != token_type:
         raise credentials_exception
+    jti = payload.get("jti")
+    if jti is not None and revocation.revocations.is_revoked(db, jti):
+        raise credentials_exception
+    return payload
+
+def get_user_from_claims(payload: dict, db: Session):
+    token_data = schemas.TokenData(email=payload["sub"])
+    user = user_by_email(db, token_data.email)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
+
+def get_user_from_token(token: str, db: Session, token_type: str = "access"):
+    return get_user_from_claims(decode_token(token, db, token_type), db)
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+    return get_user_from_token(credentials.credentials, db)
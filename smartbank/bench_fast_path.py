@@ -0,0 +1,149 @@
+"""CPU per call of the hot lookups: ORM queries versus prebuilt Core statements.
+
+    python bench_fast_path.py --iterations 5000 [--url sqlite:///bench.db]
+
+"orm" is how these paths used to run: the token user lookup and login
+through `db.query(User)`, an account directory miss through
+`db.query(Account)`, and a transfer's balance updates and ledger row built
+per call, with the ledger row added as an ORM instance and flushed. "core"
+is the current code: `auth.user_by_email`, the directory's
+`ACCOUNT_BY_NUMBER`, and `transfers.debit`/`credit` with
+`INSERT_TRANSACTION`. Both run the same statements against the same rows.
+The report shows process CPU time per call and what an authenticated
+transfer request saves. The difference is SQLAlchemy overhead, so a local
+SQLite file (the default) shows it best.
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, User, Account, Transaction, TransactionType
+import account_directory
+import auth
+import transfers
+
+AMOUNT = Decimal("0.01")
+
+def setup(session_factory):
+    db = session_factory()
+    suffix = uuid.uuid4().hex[:10]
+    user = User(
+        email=f"bench-{suffix}@example.com",
+        phone=f"8{int(suffix, 16) % 10**9:09d}",
+        password_hash=auth.get_password_hash("bench"),
+        first_name="Bench",
+        last_name="Payer",
+        date_of_birth=datetime(1990, 1, 1),
+        address="Benchmark"
+    )
+    db.add(user)
+    db.flush()
+    accounts = [
+        Account(account_number=f"BF{suffix}{i}", user_id=user.id, account_type="CURRENT", balance=10**9,
+                daily_limit=10**6)
+        for i in range(2)
+    ]
+    db.add_all(accounts)
+    db.commit()
+    ids = (user.id, user.email, [(account.id, account.account_number) for account in accounts])
+    db.close()
+    return ids
+
+def teardown(session_factory, user_id, account_ids):
+    db = session_factory()
+    db.query(Transaction).filter(Transaction.from_account_id.in_(account_ids)).delete()
+    db.query(Account).filter(Account.user_id == user_id).delete()
+    db.query(User).filter(User.id == user_id).delete()
+    db.commit()
+    db.close()
+
+def orm_user(db, email):
+    return db.query(User).filter(User.email == email).first()
+
+def orm_login(db, email):
+    user = db.query(User).filter(User.email == email).first()
+    return user if auth.verify_password("bench", user.password_hash) else False
+
+def orm_account(db, account_number):
+    return db.query(Account).filter(Account.account_number == account_number).first()
+
+def orm_transfer(db, sender_id, receiver_id):
+    debited = db.execute(
+        update(Account).where(Account.id == sender_id, Account.balance >= AMOUNT, Account.daily_limit >= AMOUNT)
+        .values(balance=Account.balance - AMOUNT).execution_options(synchronize_session=False)
+    ).rowcount
+    db.execute(select(Account.balance).where(Account.id == sender_id)).scalar_one()
+    db.execute(
+        update(Account).where(Account.id == receiver_id).values(balance=Account.balance + AMOUNT)
+        .execution_options(synchronize_session=False)
+    )
+    db.add(Transaction(transaction_id=f"TXN{uuid.uuid4().hex}", from_account_id=sender_id,
+                       to_account_id=receiver_id, amount=AMOUNT, transaction_type=TransactionType.TRANSFER))
+    db.flush()
+    return debited
+
+def core_transfer(db, sender_id, receiver_id):
+    new_balance = transfers.debit(db, sender_id, AMOUNT)
+    transfers.credit(db, receiver_id, AMOUNT)
+    db.connection().execute(transfers.INSERT_TRANSACTION, {
+        "transaction_id": f"TXN{uuid.uuid4().hex}", "from_account_id": sender_id, "to_account_id": receiver_id,
+        "amount": AMOUNT, "transaction_type": TransactionType.TRANSFER, "description": ""
+    })
+    return new_balance
+
+def measure(session_factory, call, iterations):
+    """CPU microseconds per call, each call in its own session like a request."""
+    for _ in range(min(iterations, 100)):
+        db = session_factory()
+        call(db)
+        db.rollback()
+        db.close()
+    started = time.process_time()
+    for _ in range(iterations):
+        db = session_factory()
+        call(db)
+        db.rollback()
+        db.close()
+    return (time.process_time() - started) / iterations * 1e6
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=None, help="Database URL (default: a temporary SQLite file)")
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    user_id, email, ((sender_id, sender_number), (receiver_id, _)) = setup(session_factory)
+    cases = (
+        ("token user", lambda db: orm_user(db, email), lambda db: auth.user_by_email(db, email)),
+        ("login", lambda db: orm_login(db, email), lambda db: auth.authenticate_user(db, email, "bench")),
+        ("account miss", lambda db: orm_account(db, sender_number),
+         lambda db: db.connection().execute(account_directory.ACCOUNT_BY_NUMBER,
+                                            {"account_number": sender_number}).first()),
+        ("transfer", lambda db: orm_transfer(db, sender_id, receiver_id),
+         lambda db: core_transfer(db, sender_id, receiver_id)),
+    )
+    try:
+        saved = {}
+        print(f"{'path':14s} {'orm us':>9s} {'core us':>9s} {'saved':>7s}")
+        for name, orm_call, core_call in cases:
+            orm_us = measure(session_factory, orm_call, args.iterations)
+            core_us = measure(session_factory, core_call, args.iterations)
+            saved[name] = orm_us - core_us
+            print(f"{name:14s} {orm_us:9.1f} {core_us:9.1f} {saved[name] / orm_us:6.0%}")
+        # A transfer request authenticates, may miss the directory once, then transfers
+        print(f"Authenticated transfer request: {saved['token user'] + saved['transfer']:.1f} us CPU saved "
+              f"({saved['account miss']:.1f} us more per directory miss)")
+    finally:
+        teardown(session_factory, user_id, [sender_id, receiver_id])
@@ -0,0 +1,103 @@
+"""Credit throughput on one hot account as the stripe count grows.
+
+    python bench_striping.py --threads 32 --seconds 10 --stripes 1,2,4,8,16
+
+Run it against MySQL (the default URL from database.py); SQLite takes a
+database-wide write lock, so it cannot show row-lock contention going away.
+"""
+import argparse
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import SQLALCHEMY_DATABASE_URL
+from models import Base, User, Account, AccountBalanceStripe
+import striping
+
+def setup_hot_account(session_factory):
+    db = session_factory()
+    suffix = uuid.uuid4().hex[:10]
+    user = User(
+        email=f"bench-{suffix}@example.com",
+        phone=f"8{int(suffix, 16) % 10**9:09d}",
+        password_hash="-",
+        first_name="Bench",
+        last_name="Merchant",
+        date_of_birth=datetime(1990, 1, 1),
+        address="Benchmark"
+    )
+    db.add(user)
+    db.flush()
+    account = Account(account_number=f"BN{suffix}", user_id=user.id, account_type="CURRENT", balance=0)
+    db.add(account)
+    db.commit()
+    ids = (user.id, account.id)
+    db.close()
+    return ids
+
+def teardown_hot_account(session_factory, user_id, account_id):
+    db = session_factory()
+    db.query(AccountBalanceStripe).filter(AccountBalanceStripe.account_id == account_id).delete()
+    db.query(Account).filter(Account.id == account_id).delete()
+    db.query(User).filter(User.id == user_id).delete()
+    db.commit()
+    db.close()
+
+def run(session_factory, account_id, stripes, threads, seconds):
+    db = session_factory()
+    account = db.get(Account, account_id)
+    striping.set_stripe_count(db, account, stripes if stripes > 1 else 0)
+    db.close()
+
+    counts = [0] * threads
+    stop = threading.Event()
+
+    def worker(index):
+        session = session_factory()
+        hot = session.get(Account, account_id)
+        session.expunge(hot)
+        while not stop.is_set():
+            if hot.stripe_count:
+                striping.credit(session, hot, 1)
+            else:
+                session.query(Account).filter(Account.id == account_id).update(
+                    {Account.balance: Account.balance + 1}, synchronize_session=False
+                )
+            session.commit()
+            counts[index] += 1
+        session.close()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    return sum(counts) / seconds
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--stripes", default="1,2,4,8,16")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url, pool_size=args.threads, max_overflow=0)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    user_id, account_id = setup_hot_account(session_factory)
+    try:
+        baseline = None
+        for stripes in [int(k) for k in args.stripes.split(",")]:
+            rate = run(session_factory, account_id, stripes, args.threads, args.seconds)
+            baseline = baseline or rate
+            print(f"K={stripes:3d}  {rate:10.0f} credits/s  x{rate / baseline:.2f}")
+    finally:
+        teardown_hot_account(session_factory, user_id, account_id)
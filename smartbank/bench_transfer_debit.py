@@ -0,0 +1,126 @@
+"""Sender debit: read-modify-write versus one conditional UPDATE.
+
+    python bench_transfer_debit.py --threads 16 --seconds 10 --accounts 64
+
+"rmw" is the old transfer path: SELECT ... FOR UPDATE, compare the balance as a
+float in Python and write it back. "conditional" is `transfers.debit`, which
+checks and debits inside a single UPDATE. Both run the same number of threads
+against the same accounts; the report shows debits/s, mean latency and SQL
+statements per debit. Run it against MySQL (the default URL from database.py)
+to see row-lock hold times; SQLite serialises all writers.
+"""
+import argparse
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from database import SQLALCHEMY_DATABASE_URL
+from models import Base, User, Account
+import transfers
+
+def setup_accounts(session_factory, count):
+    db = session_factory()
+    suffix = uuid.uuid4().hex[:10]
+    user = User(
+        email=f"bench-{suffix}@example.com",
+        phone=f"8{int(suffix, 16) % 10**9:09d}",
+        password_hash="-",
+        first_name="Bench",
+        last_name="Payer",
+        date_of_birth=datetime(1990, 1, 1),
+        address="Benchmark"
+    )
+    db.add(user)
+    db.flush()
+    accounts = [
+        Account(account_number=f"BD{suffix}{i:04d}", user_id=user.id, account_type="CURRENT",
+                balance=10**9, daily_limit=100000)
+        for i in range(count)
+    ]
+    db.add_all(accounts)
+    db.commit()
+    ids = (user.id, [account.id for account in accounts])
+    db.close()
+    return ids
+
+def teardown_accounts(session_factory, user_id):
+    db = session_factory()
+    db.query(Account).filter(Account.user_id == user_id).delete()
+    db.query(User).filter(User.id == user_id).delete()
+    db.commit()
+    db.close()
+
+def rmw_debit(db, account_id, amount):
+    account = db.query(Account).filter(Account.id == account_id).with_for_update().one()
+    if float(account.balance) < amount or amount > float(account.daily_limit):
+        raise transfers.TransferError(400, "Insufficient funds")
+    account.balance = float(account.balance) - amount
+    db.flush()
+    return account.balance
+
+def conditional_debit(db, account_id, amount):
+    return transfers.debit(db, account_id, Decimal(str(amount)))
+
+def run(engine, session_factory, account_ids, strategy, threads, seconds):
+    statements = [0]
+    counter_lock = threading.Lock()
+
+    def count_statement(*args):
+        with counter_lock:
+            statements[0] += 1
+
+    counts = [0] * threads
+    latency = [0.0] * threads
+    stop = threading.Event()
+
+    def worker(index):
+        session = session_factory()
+        rng = random.Random(index)
+        while not stop.is_set():
+            started = time.perf_counter()
+            strategy(session, rng.choice(account_ids), 1.25)
+            session.commit()
+            latency[index] += time.perf_counter() - started
+            counts[index] += 1
+        session.close()
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in workers:
+            thread.join()
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+
+    total = max(sum(counts), 1)
+    return sum(counts) / seconds, sum(latency) / total * 1000, statements[0] / total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--accounts", type=int, default=64, help="Fewer accounts means more lock contention")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url, pool_size=args.threads, max_overflow=0)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    user_id, account_ids = setup_accounts(session_factory, args.accounts)
+    try:
+        for name, strategy in (("rmw", rmw_debit), ("conditional", conditional_debit)):
+            rate, mean_ms, per_debit = run(engine, session_factory, account_ids, strategy, args.threads, args.seconds)
+            print(f"{name:12s} {rate:10.0f} debits/s  {mean_ms:7.2f} ms/debit  {per_debit:4.1f} statements/debit")
+    finally:
+        teardown_accounts(session_factory, user_id)
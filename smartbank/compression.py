@@ -0,0 +1,39 @@
+import os
+
+from starlette.middleware.gzip import GZipMiddleware
+
+# Optional: brotli-asgi adds br for clients that accept it, gzip otherwise
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+# Small bodies are not worth the CPU or the extra header bytes
+COMPRESSION_MIN_BYTES = int(os.environ.get("SMARTBANK_COMPRESSION_MIN_BYTES", "1024"))
+
+class CompressionMiddleware:
+    """Brotli or gzip for responses over `minimum_size` bytes.
+
+    Server-sent event streams pass through untouched: the compressors buffer
+    output, which would hold events back until the buffer fills.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_BYTES):
+        self.app = app
+        if BrotliMiddleware is not None:
+            self.compressed = BrotliMiddleware(app, quality=4, minimum_size=minimum_size, gzip_fallback=True)
+        else:
+            self.compressed = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=6)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not self._is_event_stream(scope):
+            await self.compressed(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    @staticmethod
+    def _is_event_stream(scope):
+        for name, value in scope.get("headers", ()):
+            if name == b"accept" and b"text/event-stream" in value:
+                return True
+        return scope.get("path") == "/api/events"
@@ -0,0 +1,99 @@
+"""Everything the dashboard page shows, in a fixed number of queries.
+
+Accounts, KYC documents, recent transactions and today's count are four
+statements (five when an account is striped) however many accounts or
+transactions the user has. Recent transactions come from the per-side
+(account, created_at) indexes: the newest N sent and the newest N received
+are merged, so the ledger is never scanned.
+"""
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import func, select, union
+from sqlalchemy.orm import Session, aliased
+
+from models import Account, KYCDocument, KYCStatus, Transaction, User
+import striping
+
+RECENT_TRANSACTIONS = 10
+
+def _newest_ids(account_ids, limit, since=None):
+    # One indexed, limited select per side of the transfer
+    sides = []
+    for column in (Transaction.from_account_id, Transaction.to_account_id):
+        side = select(Transaction.id, Transaction.created_at).where(column.in_(account_ids))
+        if since is not None:
+            side = side.where(Transaction.created_at >= since)
+        if limit is not None:
+            side = side.order_by(Transaction.created_at.desc()).limit(limit)
+        sides.append(select(side.subquery()))
+    return union(*sides).subquery()
+
+def kyc_summary_status(documents):
+    if not documents:
+        return "not_started"
+    statuses = {document.status for document in documents}
+    for status in (KYCStatus.APPROVED, KYCStatus.PENDING):
+        if status in statuses:
+            return status.value
+    return KYCStatus.REJECTED.value
+
+def load_dashboard(db: Session, user: User, recent=RECENT_TRANSACTIONS):
+    accounts = db.query(Account).filter(Account.user_id == user.id).order_by(Account.id).all()
+    balances = {account.id: account.balance for account in accounts}
+    # Row plus stripes, as striping.balance_of counts them
+    for account_id, total in striping.striped_balances(db, [a.id for a in accounts if a.stripe_count]).items():
+        balances[account_id] = Decimal(balances[account_id] or 0) + total
+
+    documents = db.query(KYCDocument).filter(KYCDocument.user_id == user.id).order_by(KYCDocument.id).all()
+
+    account_ids = list(balances)
+    transactions = []
+    transactions_today = 0
+    if account_ids:
+        newest = _newest_ids(account_ids, recent)
+        sender, receiver = aliased(Account), aliased(Account)
+        transactions = db.query(Transaction, sender.account_number, receiver.account_number).join(
+            newest, newest.c.id == Transaction.id
+        ).outerjoin(
+            sender, sender.id == Transaction.from_account_id
+        ).outerjoin(
+            receiver, receiver.id == Transaction.to_account_id
+        ).order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(recent).all()
+
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        transactions_today = db.execute(
+            select(func.count()).select_from(_newest_ids(account_ids, None, since=today))
+        ).scalar()
+
+    own = set(account_ids)
+    recent_transactions = []
+    for transaction, from_account, to_account in transactions:
+        debit, credit = transaction.from_account_id in own, transaction.to_account_id in own
+        recent_transactions.append({
+            "transaction_id": transaction.transaction_id,
+            "transaction_type": transaction.transaction_type.value,
+            "direction": "internal" if debit and credit else ("debit" if debit else "credit"),
+            "from_account": from_account,
+            "to_account": to_account,
+            "amount": float(transaction.amount),
+            "description": transaction.description,
+            "status": transaction.status,
+            "created_at": transaction.created_at
+        })
+
+    return {
+        "profile": user,
+        "accounts": [{
+            "id": account.id,
+            "account_number": account.account_number,
+            "account_type": account.account_type.value,
+            "balance": float(balances[account.id]),
+            "daily_limit": float(account.daily_limit),
+            "is_active": account.is_active
+        } for account in accounts],
+        "total_balance": float(sum(balances.values())),
+        "recent_transactions": recent_transactions,
+        "transactions_today": transactions_today,
+        "kyc": {"status": kyc_summary_status(documents), "documents": documents}
+    }
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Events buffered per connection; a slow client loses its oldest events first
+CLIENT_QUEUE_SIZE = 32
+HEARTBEAT_SECONDS = 25
+
+class EventBroker:
+    """In-process pub/sub fan-out of per-user events to open SSE connections.
+
+    Each connection owns a small bounded asyncio.Queue, so an idle client costs
+    one suspended coroutine and no thread. `publish` may be called from the
+    event loop or from worker threads.
+    """
+
+    def __init__(self, queue_size=CLIENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def subscribe(self, user_id):
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, user_id, event_type, data):
+        with self._lock:
+            if user_id not in self._subscribers:
+                return
+        message = {"type": event_type, "data": data}
+        loop = self._loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(user_id, message)
+        elif loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._deliver, user_id, message)
+
+    def _deliver(self, user_id, message):
+        with self._lock:
+            queues = list(self._subscribers.get(user_id, ()))
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def stream(self, user_id, heartbeat=HEARTBEAT_SECONDS):
+        # Server-sent events body for one connection
+        queue = self.subscribe(user_id)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message['data'], default=str)}\n\n"
+        finally:
+            self.unsubscribe(user_id, queue)
+
+broker = EventBroker()
+
+def publish_after_commit(db: Session, user_id, event_type, data):
+    # Queue an event on the session; it is only published if the commit succeeds
+    db.info.setdefault("pending_events", []).append((user_id, event_type, data))
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending_events(session):
+    for user_id, event_type, data in session.info.pop("pending_events", ()):
+        broker.publish(user_id, event_type, data)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_events(session):
+    session.info.pop("pending_events", None)
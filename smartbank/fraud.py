@@ -0,0 +1,211 @@
+import calendar
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from models import Transaction, TransactionType
+
+class FraudRules:
+    """Thresholds and weights for the in-line transfer checks.
+
+    Override any of them with a JSON object in SMARTBANK_FRAUD_RULES, e.g.
+    SMARTBANK_FRAUD_RULES='{"burst_max_transfers": 10}'.
+
+    A burst alone stays under block_score, so payroll runs and busy merchants
+    are not stopped for volume; it blocks together with an unusual amount or
+    a large new payee. Set burst_weight to 1.0 to block bursts outright.
+    """
+
+    def __init__(
+        self,
+        enabled=True,
+        amount_half_life_seconds=7 * 24 * 3600,
+        burst_window_seconds=60,
+        burst_max_transfers=5,
+        burst_weight=0.5,
+        amount_zscore=4.0,
+        amount_min_history=5,
+        amount_weight=0.6,
+        new_payee_min_amount=25000.0,
+        new_payee_weight=0.5,
+        payee_memory=64,
+        block_score=1.0,
+        rebuild_days=30
+    ):
+        self.enabled = enabled
+        self.amount_half_life_seconds = amount_half_life_seconds
+        self.burst_window_seconds = burst_window_seconds
+        self.burst_max_transfers = burst_max_transfers
+        self.burst_weight = burst_weight
+        self.amount_zscore = amount_zscore
+        self.amount_min_history = amount_min_history
+        self.amount_weight = amount_weight
+        self.new_payee_min_amount = new_payee_min_amount
+        self.new_payee_weight = new_payee_weight
+        self.payee_memory = payee_memory
+        self.block_score = block_score
+        self.rebuild_days = rebuild_days
+
+    @classmethod
+    def from_env(cls):
+        return cls(**json.loads(os.environ.get("SMARTBANK_FRAUD_RULES", "{}")))
+
+class FraudDecision:
+    __slots__ = ("blocked", "score", "reasons")
+
+    def __init__(self, blocked, score, reasons):
+        self.blocked = blocked
+        self.score = score
+        self.reasons = reasons
+
+class AccountFeatures:
+    """Per-sender features; every update is O(1) in time and memory."""
+
+    __slots__ = (
+        "last_seen", "weight", "mean", "spread", "count",
+        "window_start", "window_count", "previous_window_count",
+        "payees", "previous_payees"
+    )
+
+    def __init__(self):
+        self.last_seen = None
+        # Exponentially decayed amount statistics (weighted Welford)
+        self.weight = 0.0
+        self.mean = 0.0
+        self.spread = 0.0
+        self.count = 0
+        # Sliding-window transfer counter built from two fixed windows
+        self.window_start = 0.0
+        self.window_count = 0
+        self.previous_window_count = 0
+        # Two generations of recently paid accounts, each capped in size
+        self.payees = set()
+        self.previous_payees = set()
+
+    def amount_stats(self):
+        if not self.weight:
+            return 0.0, 0.0
+        return self.mean, math.sqrt(max(self.spread / self.weight, 0.0))
+
+    def transfers_in_window(self, now, window):
+        self._roll(now, window)
+        # Weight the previous window by how much of it still overlaps
+        overlap = 1.0 - (now - self.window_start) / window
+        return self.window_count + self.previous_window_count * max(overlap, 0.0)
+
+    def knows_payee(self, payee):
+        return payee in self.payees or payee in self.previous_payees
+
+    def update(self, payee, amount, now, rules):
+        if self.last_seen is not None and now > self.last_seen:
+            decay = 0.5 ** ((now - self.last_seen) / rules.amount_half_life_seconds)
+            self.weight *= decay
+            self.spread *= decay
+        self.weight += 1.0
+        delta = amount - self.mean
+        self.mean += delta / self.weight
+        self.spread += delta * (amount - self.mean)
+        self.count += 1
+        self.last_seen = max(now, self.last_seen or now)
+
+        self._roll(now, rules.burst_window_seconds)
+        self.window_count += 1
+
+        if payee not in self.payees:
+            if len(self.payees) >= rules.payee_memory:
+                self.previous_payees = self.payees
+                self.payees = set()
+            self.payees.add(payee)
+
+    def _roll(self, now, window):
+        elapsed = now - self.window_start
+        if elapsed >= 2 * window:
+            self.previous_window_count = 0
+            self.window_count = 0
+            self.window_start = now - (elapsed % window)
+        elif elapsed >= window:
+            self.previous_window_count = self.window_count
+            self.window_count = 0
+            self.window_start += window
+
+class FraudScorer:
+    """Scores transfers against in-memory per-account features.
+
+    Features are rebuilt from recent `transactions` at startup and then kept
+    current by `record()` after each committed transfer, so `evaluate()` never
+    touches the database.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = rules or FraudRules()
+        self._features = {}
+        self._lock = threading.Lock()
+
+    def evaluate(self, from_account_id, to_account_id, amount, now=None):
+        rules = self.rules
+        if not rules.enabled:
+            return FraudDecision(False, 0.0, [])
+        now = time.time() if now is None else now
+        amount = float(amount)
+
+        with self._lock:
+            features = self._features.get(from_account_id)
+            if features is None:
+                recent = 0.0
+                known_payee = False
+                mean = std = 0.0
+                count = 0
+            else:
+                recent = features.transfers_in_window(now, rules.burst_window_seconds)
+                known_payee = features.knows_payee(to_account_id)
+                mean, std = features.amount_stats()
+                count = features.count
+
+        score = 0.0
+        reasons = []
+        if recent + 1 > rules.burst_max_transfers:
+            score += rules.burst_weight
+            reasons.append("too many transfers in a short period")
+        if count >= rules.amount_min_history and amount > mean + rules.amount_zscore * max(std, 1.0):
+            score += rules.amount_weight
+            reasons.append("unusual amount")
+        if not known_payee and amount >= rules.new_payee_min_amount:
+            score += rules.new_payee_weight
+            reasons.append("large amount to a new payee")
+
+        return FraudDecision(score >= rules.block_score, score, reasons)
+
+    def record(self, from_account_id, to_account_id, amount, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            features = self._features.get(from_account_id)
+            if features is None:
+                features = self._features[from_account_id] = AccountFeatures()
+            features.update(to_account_id, float(amount), now, self.rules)
+
+    def rebuild(self, db: Session, batch_size=10000):
+        """Replay recent transfers from the ledger into fresh features."""
+        since = datetime.utcnow() - timedelta(days=self.rules.rebuild_days)
+        rows = db.query(
+            Transaction.from_account_id, Transaction.to_account_id,
+            Transaction.amount, Transaction.created_at
+        ).filter(
+            Transaction.transaction_type == TransactionType.TRANSFER,
+            Transaction.created_at >= since
+        ).order_by(Transaction.created_at).yield_per(batch_size)
+
+        fresh = FraudScorer(self.rules)
+        replayed = 0
+        for from_account_id, to_account_id, amount, created_at in rows:
+            fresh.record(from_account_id, to_account_id, amount, calendar.timegm(created_at.utctimetuple()))
+            replayed += 1
+        with self._lock:
+            self._features = fresh._features
+        return replayed
+
+scorer = FraudScorer(FraudRules.from_env())
@@ -0,0 +1,285 @@
+"""Deterministic synthetic data for scale testing.
+
+    python generate_dataset.py --url sqlite:///./scale.db --users 1000000 --accounts 2000000 --transactions 50000000 --seed 42
+
+Generates users, accounts, KYC documents and a transaction ledger directly into
+empty tables. Columns are drawn with NumPy in fixed blocks, each seeded from
+(seed, table, block), so the same seed and sizes always produce the same rows
+regardless of --batch-size. Rows are written with driver-level executemany.
+
+Shape of the data:
+  * every user owns at least one account; the rest are spread at random
+  * a small set of hot accounts receives a large share of incoming transfers
+  * KYC statuses are skewed (mostly approved, some pending, few rejected)
+  * every account is funded by an opening DEPOSIT so that balances always
+    equal credits minus debits in `transactions`
+
+All synthetic users share the password "password123".
+"""
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+from database import SQLALCHEMY_DATABASE_URL
+from models import Base
+from auth import get_password_hash
+import account_directory
+import user_search
+import versions
+
+BLOCK_SIZE = 100_000
+EPOCH = np.datetime64("2024-01-01T00:00:00", "us")
+HISTORY_DAYS = 365
+US_PER_DAY = 86_400_000_000
+
+ACCOUNT_TYPES = np.array(["SAVINGS", "CURRENT", "FD"])
+ACCOUNT_TYPE_WEIGHTS = [0.70, 0.22, 0.08]
+DAILY_LIMITS = np.array([50000.0, 100000.0, 50000.0])
+KYC_STATUSES = np.array(["APPROVED", "PENDING", "REJECTED"])
+KYC_STATUS_WEIGHTS = [0.80, 0.15, 0.05]
+DOCUMENT_TYPES = np.array(["aadhar", "pan", "passport", "driving_license"])
+FIRST_NAMES = np.array(["Aarav", "Vivaan", "Aditya", "Ananya", "Diya", "Isha", "Rohan", "Kavya", "Arjun", "Meera"])
+LAST_NAMES = np.array(["Sharma", "Verma", "Iyer", "Reddy", "Patel", "Gupta", "Nair", "Singh", "Das", "Khan"])
+DESCRIPTIONS = np.array(["Rent", "Groceries", "Salary", "EMI", "Utilities", "Shopping", "Transfer", ""])
+
+TABLE_CODES = {"users": 1, "accounts": 2, "kyc": 3, "transactions": 4, "hot": 5, "opening": 6}
+
+def block_rng(seed, table, block):
+    return np.random.default_rng([seed, TABLE_CODES[table], block])
+
+def blocks(total):
+    for block, start in enumerate(range(0, total, BLOCK_SIZE)):
+        yield block, start, min(start + BLOCK_SIZE, total)
+
+def timestamps(us_offsets):
+    values = np.datetime_as_string(EPOCH + us_offsets.astype("timedelta64[us]"), unit="us")
+    return np.char.replace(values, "T", " ")
+
+class DatasetGenerator:
+    def __init__(self, engine, seed=42, users=10_000, accounts=20_000, transactions=500_000,
+                 kyc_per_user=1.2, hot_accounts=50, hot_share=0.3, batch_size=10_000, log=print):
+        self.engine = engine
+        self.seed = seed
+        self.users = users
+        self.accounts = max(accounts, users)
+        self.transactions = transactions
+        self.kyc_per_user = kyc_per_user
+        self.hot_accounts = min(hot_accounts, self.accounts)
+        self.hot_share = hot_share
+        self.batch_size = min(batch_size, BLOCK_SIZE)
+        self.log = log
+        self.password_hash = get_password_hash("password123")
+        self.hot_ids = np.sort(
+            block_rng(seed, "hot", 0).choice(self.accounts, size=self.hot_accounts, replace=False) + 1
+        )
+
+    # Column generators; each returns a dict of equal-length arrays for one block
+
+    def user_block(self, block, start, end):
+        rng = block_rng(self.seed, "users", block)
+        n = end - start
+        ids = np.arange(start + 1, end + 1)
+        id_text = ids.astype(str)
+        return {
+            "id": ids,
+            "email": np.char.add(np.char.add("user", id_text), "@synthetic.smartbank"),
+            "phone": (7_000_000_000 + ids).astype(str),
+            "password_hash": np.full(n, self.password_hash),
+            "first_name": FIRST_NAMES[rng.integers(len(FIRST_NAMES), size=n)],
+            "last_name": LAST_NAMES[rng.integers(len(LAST_NAMES), size=n)],
+            "date_of_birth": timestamps(-rng.integers(18 * 365, 70 * 365, size=n) * US_PER_DAY),
+            "address": np.char.add("Synthetic Street ", id_text),
+            "role": np.full(n, "CUSTOMER"),
+            "is_active": np.ones(n, dtype=np.int64),
+            "created_at": timestamps(np.zeros(n, dtype=np.int64)),
+            "updated_at": timestamps(np.zeros(n, dtype=np.int64))
+        }
+
+    def account_block(self, block, start, end):
+        rng = block_rng(self.seed, "accounts", block)
+        n = end - start
+        ids = np.arange(start + 1, end + 1)
+        # The first `users` accounts give every user one account
+        owners = np.where(ids <= self.users, ids, rng.integers(1, self.users + 1, size=n))
+        types = rng.choice(len(ACCOUNT_TYPES), size=n, p=ACCOUNT_TYPE_WEIGHTS)
+        types[np.isin(ids, self.hot_ids)] = 1  # hot accounts are merchant CURRENT accounts
+        return {
+            "id": ids,
+            "account_number": np.char.add("SB", (100_000_000_000 + ids).astype(str)),
+            "user_id": owners,
+            "account_type": ACCOUNT_TYPES[types],
+            "daily_limit": DAILY_LIMITS[types],
+            "stripe_count": np.zeros(n, dtype=np.int64),
+            "is_active": np.ones(n, dtype=np.int64),
+            "created_at": timestamps(np.zeros(n, dtype=np.int64))
+        }
+
+    def kyc_block(self, block, start, end):
+        rng = block_rng(self.seed, "kyc", block)
+        n = end - start
+        ids = np.arange(start + 1, end + 1)
+        statuses = KYC_STATUSES[rng.choice(len(KYC_STATUSES), size=n, p=KYC_STATUS_WEIGHTS)]
+        created = rng.integers(0, HISTORY_DAYS * US_PER_DAY, size=n)
+        return {
+            "id": ids,
+            # Users 1..N get one document each; the extra documents go to random users
+            "user_id": np.where(ids <= self.users, ids, rng.integers(1, self.users + 1, size=n)),
+            "document_type": DOCUMENT_TYPES[rng.integers(len(DOCUMENT_TYPES), size=n)],
+            "document_number": rng.integers(10**11, 10**12, size=n).astype(str),
+            "status": statuses,
+            "created_at": timestamps(created)
+        }
+
+    def transfer_block(self, block, start, end):
+        # Transfers in time order: block b covers the b-th slice of the history window
+        rng = block_rng(self.seed, "transactions", block)
+        n = end - start
+        window = HISTORY_DAYS * US_PER_DAY
+        slice_start = window * start // max(self.transactions, 1)
+        slice_end = window * end // max(self.transactions, 1)
+        senders = rng.integers(1, self.accounts + 1, size=n)
+        receivers = rng.integers(1, self.accounts + 1, size=n)
+        hot = rng.random(n) < self.hot_share
+        receivers[hot] = self.hot_ids[rng.integers(len(self.hot_ids), size=int(hot.sum()))]
+        same = senders == receivers
+        receivers[same] = senders[same] % self.accounts + 1
+        # Log-normal amounts in paise, median around Rs 1,500
+        amounts = np.maximum(np.round(rng.lognormal(np.log(150_000), 1.0, size=n)), 100).astype(np.int64)
+        return {
+            "id": np.arange(start + 1, end + 1),
+            "from_account_id": senders,
+            "to_account_id": receivers,
+            "amount_paise": amounts,
+            "description": DESCRIPTIONS[rng.integers(len(DESCRIPTIONS), size=n)],
+            "created_at_us": np.sort(rng.integers(slice_start, max(slice_end, slice_start + 1), size=n))
+        }
+
+    # Writing
+
+    def write(self, conn, table, columns, data):
+        marker = "?" if conn.dialect.paramstyle == "qmark" else "%s"
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join([marker] * len(columns))})"
+        values = [data[column].tolist() for column in columns]
+        n = len(values[0])
+        for offset in range(0, n, self.batch_size):
+            rows = list(zip(*(column[offset:offset + self.batch_size] for column in values)))
+            conn.exec_driver_sql(sql, rows)
+
+    def net_flows(self):
+        # First pass over the transfers: credits minus debits per account, in paise
+        net = np.zeros(self.accounts + 1, dtype=np.int64)
+        for block, start, end in blocks(self.transactions):
+            data = self.transfer_block(block, start, end)
+            net += np.bincount(data["to_account_id"], weights=data["amount_paise"], minlength=self.accounts + 1).astype(np.int64)
+            net -= np.bincount(data["from_account_id"], weights=data["amount_paise"], minlength=self.accounts + 1).astype(np.int64)
+        return net
+
+    def run(self):
+        started = time.monotonic()
+        Base.metadata.create_all(bind=self.engine)
+        with self.engine.begin() as conn:
+            for table in ("users", "accounts", "kyc_documents", "transactions"):
+                if conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar():
+                    raise SystemExit(f"Table {table} is not empty; generate into an empty database")
+            if conn.dialect.name == "mysql":
+                conn.exec_driver_sql("SET unique_checks = 0")
+                conn.exec_driver_sql("SET foreign_key_checks = 0")
+            # The user search index is rebuilt once at the end instead of row by row
+            user_search.drop_index(conn)
+
+            for block, start, end in blocks(self.users):
+                data = self.user_block(block, start, end)
+                self.write(conn, "users", list(data), data)
+            self._progress("users", self.users, started)
+
+            # Opening deposits cover each account's net outflow plus a random float
+            net = self.net_flows()
+            float_paise = np.round(block_rng(self.seed, "opening", 0).lognormal(np.log(2_000_000), 1.0, size=self.accounts + 1)).astype(np.int64)
+            opening = np.maximum(-net, 0) + float_paise
+            balances = opening + net
+            for block, start, end in blocks(self.accounts):
+                data = self.account_block(block, start, end)
+                data["balance"] = balances[start + 1:end + 1] / 100
+                self.write(conn, "accounts", list(data), data)
+            self._progress("accounts", self.accounts, started)
+
+            kyc_total = int(self.users * self.kyc_per_user)
+            for block, start, end in blocks(kyc_total):
+                data = self.kyc_block(block, start, end)
+                self.write(conn, "kyc_documents", list(data), data)
+            self._progress("kyc_documents", kyc_total, started)
+
+            # Ledger: one opening DEPOSIT per account, then the transfers
+            columns = ["id", "transaction_id", "from_account_id", "to_account_id", "amount",
+                       "transaction_type", "description", "status", "created_at"]
+            for block, start, end in blocks(self.accounts):
+                ids = np.arange(start + 1, end + 1)
+                n = end - start
+                self.write(conn, "transactions", columns, {
+                    "id": ids,
+                    "transaction_id": np.char.add("SYNDEP", ids.astype(str)),
+                    "from_account_id": np.full(n, None, dtype=object),
+                    "to_account_id": ids,
+                    "amount": opening[start + 1:end + 1] / 100,
+                    "transaction_type": np.full(n, "DEPOSIT"),
+                    "description": np.full(n, "Opening balance"),
+                    "status": np.full(n, "completed"),
+                    "created_at": timestamps(np.zeros(n, dtype=np.int64))
+                })
+            for block, start, end in blocks(self.transactions):
+                data = self.transfer_block(block, start, end)
+                ids = data["id"] + self.accounts
+                n = end - start
+                self.write(conn, "transactions", columns, {
+                    "id": ids,
+                    "transaction_id": np.char.add("SYN", ids.astype(str)),
+                    "from_account_id": data["from_account_id"],
+                    "to_account_id": data["to_account_id"],
+                    "amount": data["amount_paise"] / 100,
+                    "transaction_type": np.full(n, "TRANSFER"),
+                    "description": data["description"],
+                    "status": np.full(n, "completed"),
+                    "created_at": timestamps(data["created_at_us"])
+                })
+                if block % 10 == 9:
+                    self._progress("transactions", self.accounts + end, started)
+            self._progress("transactions", self.accounts + self.transactions, started)
+            user_search.ensure_index(conn, rebuild=True)
+
+        # Directory entries and ETags from an earlier dataset would now be wrong
+        account_directory.directory.clear()
+        versions.versions.bump(versions.ACCOUNTS_ALL, versions.KYC_ALL, versions.KYC_PENDING)
+
+    def _progress(self, table, rows, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.log(f"{table}: {rows} rows ({elapsed:.1f}s elapsed)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic SmartBank dataset")
+    parser.add_argument("--url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--accounts", type=int, default=20_000)
+    parser.add_argument("--transactions", type=int, default=500_000)
+    parser.add_argument("--kyc-per-user", type=float, default=1.2)
+    parser.add_argument("--hot-accounts", type=int, default=50)
+    parser.add_argument("--hot-share", type=float, default=0.3, help="Fraction of transfers that go to hot accounts")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    started = datetime.now()
+    DatasetGenerator(
+        create_engine(args.url),
+        seed=args.seed,
+        users=args.users,
+        accounts=args.accounts,
+        transactions=args.transactions,
+        kyc_per_user=args.kyc_per_user,
+        hot_accounts=args.hot_accounts,
+        hot_share=args.hot_share,
+        batch_size=args.batch_size
+    ).run()
+    print(f"Finished in {datetime.now() - started}")
@@ -0,0 +1,266 @@
+"""Bulk import of customers from the legacy core.
+
+    python import_customers.py customers.csv [--chunk-size 2000] [--workers 8] [--rejects rejects.ndjson]
+
+Input is CSV (with a header row) or NDJSON, one customer per row/line, using
+the `/api/register` fields plus optional account and KYC columns:
+
+    email, phone, password, first_name, last_name, date_of_birth, address,
+    account_number, account_type, opening_balance,
+    document_type, document_number, kyc_status
+
+Rows are validated with `schemas.UserRegistration`, passwords are hashed in a
+process pool, and each chunk is written with multi-row inserts in a single
+transaction. Rows that fail validation or clash with existing users are
+written to the reject file together with the reason.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+
+from database import SessionLocal
+from models import Account, AccountType, KYCDocument, KYCStatus, Transaction, TransactionType, User
+from auth import get_password_hash
+from kyc_duplicates import document_number_hash
+import schemas
+import versions
+
+USER_FIELDS = ["email", "phone", "password", "first_name", "last_name", "date_of_birth", "address"]
+DAILY_LIMITS = {"SAVINGS": 50000.00, "CURRENT": 100000.00, "FD": 50000.00}
+
+def read_rows(path):
+    # Yields (line_number, row) without loading the whole file
+    with open(path, newline="", encoding="utf-8") as source:
+        if path.endswith((".ndjson", ".jsonl", ".json")):
+            for line_number, line in enumerate(source, start=1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except json.JSONDecodeError as e:
+                        yield line_number, {"_error": f"Invalid JSON: {e}"}
+        else:
+            for line_number, row in enumerate(csv.DictReader(source), start=2):
+                yield line_number, row
+
+def validate_row(row):
+    """Returns (customer, errors) for one input row."""
+    if "_error" in row:
+        return None, [row["_error"]]
+    try:
+        user = schemas.UserRegistration(**{field: row.get(field) for field in USER_FIELDS})
+    except ValidationError as e:
+        return None, [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()]
+
+    errors = []
+    customer = {"user": user, "account": None, "kyc": None}
+
+    account_type = (row.get("account_type") or "").strip().upper()
+    if account_type:
+        if account_type not in AccountType.__members__:
+            errors.append(f"account_type: must be one of {', '.join(AccountType.__members__)}")
+        try:
+            opening_balance = Decimal(str(row.get("opening_balance") or "0")).quantize(Decimal("0.01"))
+            if opening_balance < 0:
+                errors.append("opening_balance: must not be negative")
+        except InvalidOperation:
+            errors.append("opening_balance: not a number")
+            opening_balance = None
+        customer["account"] = {
+            "account_number": (row.get("account_number") or "").strip() or None,
+            "account_type": account_type,
+            "opening_balance": opening_balance
+        }
+
+    document_type = (row.get("document_type") or "").strip()
+    if document_type:
+        try:
+            kyc = schemas.KYCDocumentCreate(document_type=document_type, document_number=row.get("document_number") or "")
+        except ValidationError as e:
+            errors.extend(f"document_type: {err['msg']}" for err in e.errors())
+            kyc = None
+        kyc_status = (row.get("kyc_status") or "pending").strip().upper()
+        if kyc_status not in KYCStatus.__members__:
+            errors.append(f"kyc_status: must be one of {', '.join(KYCStatus.__members__)}")
+        if kyc is not None:
+            customer["kyc"] = {
+                "document_type": kyc.document_type,
+                "document_number": kyc.document_number,
+                "status": kyc_status
+            }
+
+    return (None, errors) if errors else (customer, [])
+
+class CustomerImporter:
+    def __init__(self, session_factory=SessionLocal, chunk_size=2000, workers=None, rejects=None, log=print):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 1
+        self.rejects = rejects
+        self.log = log
+        self.imported = 0
+        self.rejected = 0
+        self._seen_emails = set()
+        self._seen_phones = set()
+
+    def reject(self, line_number, row, errors):
+        self.rejected += 1
+        if self.rejects is not None:
+            safe_row = {key: value for key, value in row.items() if key != "password"}
+            self.rejects.write(json.dumps({"line": line_number, "errors": errors, "row": safe_row}, default=str) + "\n")
+
+    def run(self, rows):
+        started = time.monotonic()
+        chunk = []
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for line_number, row in rows:
+                customer, errors = validate_row(row)
+                if errors:
+                    self.reject(line_number, row, errors)
+                    continue
+                chunk.append((line_number, row, customer))
+                if len(chunk) >= self.chunk_size:
+                    self._write_chunk(chunk, pool)
+                    chunk = []
+                    self._progress(started)
+            if chunk:
+                self._write_chunk(chunk, pool)
+        self._progress(started, done=True)
+        return self.imported, self.rejected
+
+    def _progress(self, started, done=False):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        total = self.imported + self.rejected
+        prefix = "Done" if done else "Progress"
+        self.log(f"{prefix}: {self.imported} imported, {self.rejected} rejected, {total / elapsed:.0f} rows/s")
+
+    def _write_chunk(self, chunk, pool):
+        db = self.session_factory()
+        try:
+            chunk = self._drop_duplicates(db, chunk)
+            if not chunk:
+                return
+
+            hashes = pool.map(
+                get_password_hash,
+                [customer["user"].password for _, _, customer in chunk],
+                chunksize=max(1, len(chunk) // (self.workers * 4))
+            )
+            db.execute(insert(User), [
+                {
+                    "email": customer["user"].email,
+                    "phone": customer["user"].phone,
+                    "password_hash": password_hash,
+                    "first_name": customer["user"].first_name,
+                    "last_name": customer["user"].last_name,
+                    "date_of_birth": customer["user"].date_of_birth,
+                    "address": customer["user"].address
+                }
+                for (_, _, customer), password_hash in zip(chunk, hashes)
+            ])
+            user_ids = dict(db.query(User.email, User.id).filter(
+                User.email.in_([customer["user"].email for _, _, customer in chunk])
+            ).all())
+
+            accounts = []
+            kyc_documents = []
+            for _, _, customer in chunk:
+                user_id = user_ids[customer["user"].email]
+                if customer["account"]:
+                    account = customer["account"]
+                    accounts.append({
+                        "account_number": account["account_number"] or f"SB{random.randint(100000000000, 999999999999)}",
+                        "user_id": user_id,
+                        "account_type": AccountType[account["account_type"]],
+                        "balance": account["opening_balance"],
+                        "daily_limit": DAILY_LIMITS[account["account_type"]]
+                    })
+                if customer["kyc"]:
+                    kyc_documents.append({
+                        "user_id": user_id,
+                        "document_type": customer["kyc"]["document_type"],
+                        "document_number": customer["kyc"]["document_number"],
+                        "document_number_hash": document_number_hash(
+                            customer["kyc"]["document_type"], customer["kyc"]["document_number"]
+                        ),
+                        "status": KYCStatus[customer["kyc"]["status"]]
+                    })
+
+            if accounts:
+                db.execute(insert(Account), accounts)
+                self._post_opening_balances(db, accounts)
+            if kyc_documents:
+                db.execute(insert(KYCDocument), kyc_documents)
+                versions.bump_after_commit(db, versions.KYC_PENDING)
+            db.commit()
+            self.imported += len(chunk)
+        except Exception as e:
+            db.rollback()
+            # The chunk shares one transaction; report every row in it
+            for line_number, row, _ in chunk:
+                self.reject(line_number, row, [f"Chunk insert failed: {e}"])
+        finally:
+            db.close()
+
+    def _drop_duplicates(self, db, chunk):
+        # Existing users and repeats within the file are rejected, not retried
+        emails = [customer["user"].email for _, _, customer in chunk]
+        phones = [customer["user"].phone for _, _, customer in chunk]
+        taken_emails = {email for (email,) in db.query(User.email).filter(User.email.in_(emails))}
+        taken_phones = {phone for (phone,) in db.query(User.phone).filter(User.phone.in_(phones))}
+
+        kept = []
+        for line_number, row, customer in chunk:
+            email, phone = customer["user"].email, customer["user"].phone
+            if email in taken_emails or email in self._seen_emails:
+                self.reject(line_number, row, ["email: already registered"])
+            elif phone in taken_phones or phone in self._seen_phones:
+                self.reject(line_number, row, ["phone: already registered"])
+            else:
+                self._seen_emails.add(email)
+                self._seen_phones.add(phone)
+                kept.append((line_number, row, customer))
+        return kept
+
+    def _post_opening_balances(self, db, accounts):
+        # Opening balances become DEPOSIT ledger rows so the ledger stays complete
+        funded = {acc["account_number"]: acc["balance"] for acc in accounts if acc["balance"]}
+        if not funded:
+            return
+        account_ids = db.query(Account.account_number, Account.id).filter(
+            Account.account_number.in_(list(funded))
+        ).all()
+        db.execute(insert(Transaction), [
+            {
+                "transaction_id": f"DEP{uuid.uuid4().hex}",
+                "to_account_id": account_id,
+                "amount": funded[account_number],
+                "transaction_type": TransactionType.DEPOSIT,
+                "description": "Opening balance (import)"
+            }
+            for account_number, account_id in account_ids
+        ])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import customers from CSV or NDJSON")
+    parser.add_argument("path", help="Input file (.csv or .ndjson)")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Rows per insert transaction")
+    parser.add_argument("--workers", type=int, default=None, help="Password hashing processes")
+    parser.add_argument("--rejects", default="rejects.ndjson", help="Where to write rejected rows")
+    args = parser.parse_args()
+
+    with open(args.rejects, "w", encoding="utf-8") as rejects:
+        importer = CustomerImporter(chunk_size=args.chunk_size, workers=args.workers, rejects=rejects)
+        imported, rejected = importer.run(read_rows(args.path))
+    if rejected:
+        print(f"{rejected} rows rejected, see {args.rejects}")
+    sys.exit(0 if imported or not rejected else 1)
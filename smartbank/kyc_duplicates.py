@@ -0,0 +1,206 @@
+"""Duplicate and near-duplicate KYC documents across users.
+
+    python kyc_duplicates.py backfill    # hash document numbers of older uploads
+
+Three indexed signals, each checked with index lookups only:
+  * document_number_hash: keyed hash of the normalized document number
+  * content_hash: sha256 of the uploaded file (exact copies)
+  * dhash bands: 64-bit difference hash of the image in four 16-bit bands;
+    rows sharing any band are candidates, confirmed by Hamming distance
+"""
+import hashlib
+import hmac
+import logging
+import os
+import re
+import sys
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import KYCDocument, KYCDuplicateFlag
+from auth import SECRET_KEY
+import kyc_previews
+import versions
+
+logger = logging.getLogger(__name__)
+
+# A separate key lets the JWT secret rotate without re-hashing every document.
+# Without one the JWT secret is used, which startup warns about.
+DOCUMENT_HASH_KEY = os.environ.get("SMARTBANK_DOCUMENT_HASH_KEY", SECRET_KEY).encode()
+NEAR_DUPLICATE_DISTANCE = 6  # of 64 bits
+DHASH_BANDS = 4
+
+def check_document_hash_key():
+    """Warn if document numbers are hashed with the JWT secret; returns whether a key is set."""
+    if os.environ.get("SMARTBANK_DOCUMENT_HASH_KEY"):
+        return True
+    logger.warning(
+        "SMARTBANK_DOCUMENT_HASH_KEY is not set; KYC document numbers are hashed with the JWT secret. "
+        "Rotating that secret will stop duplicate detection matching older documents until they are "
+        "re-hashed. Set a dedicated key before storing real documents."
+    )
+    return False
+
+def normalize_document_number(document_type, document_number):
+    # "abcde 1234-f" and "ABCDE1234F" are the same PAN
+    return f"{document_type.lower()}:{re.sub(r'[^0-9A-Za-z]', '', document_number).upper()}"
+
+def document_number_hash(document_type, document_number):
+    # Keyed, because Aadhaar and PAN numbers are too guessable for a bare sha256
+    normalized = normalize_document_number(document_type, document_number)
+    return hmac.new(DOCUMENT_HASH_KEY, normalized.encode(), hashlib.sha256).hexdigest()
+
+def dhash_of(path, size=8):
+    """64-bit difference hash of an image (or the first page of a PDF).
+
+    Runs in the preview worker pool. Returns None when the file cannot be read.
+    """
+    Image = kyc_previews.Image
+    try:
+        if path.lower().endswith(".pdf"):
+            document = kyc_previews.fitz.open(path)
+            try:
+                pixmap = document[0].get_pixmap(matrix=kyc_previews.fitz.Matrix(0.5, 0.5))
+                image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+            finally:
+                document.close()
+        else:
+            image = Image.open(path)
+        pixels = list(image.convert("L").resize((size + 1, size), Image.LANCZOS).getdata())
+    except Exception:
+        return None
+
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def can_hash(path):
+    # Same decoders as the previews, plus Pillow for PDFs
+    return kyc_previews.Image is not None and kyc_previews.can_render(path)
+
+def dhash_bands(value):
+    return [(value >> (16 * band)) & 0xFFFF for band in range(DHASH_BANDS)]
+
+def _add_flag(db, document, duplicate_of_id, reason, distance=None):
+    db.add(KYCDuplicateFlag(document_id=document.id, duplicate_of_id=duplicate_of_id, reason=reason, distance=distance))
+
+def flag_exact_duplicates(db: Session, document: KYCDocument):
+    """Hash the document number and flag matches by number or file. Caller commits."""
+    document.document_number_hash = document_number_hash(document.document_type, document.document_number)
+    db.flush()
+
+    flagged = []
+    for reason, column, value in (
+        ("document_number", KYCDocument.document_number_hash, document.document_number_hash),
+        ("content", KYCDocument.content_hash, document.content_hash)
+    ):
+        if not value:
+            continue
+        matches = db.query(KYCDocument.id).filter(
+            column == value,
+            KYCDocument.user_id != document.user_id
+        ).all()
+        for (match_id,) in matches:
+            _add_flag(db, document, match_id, reason)
+            flagged.append((match_id, reason))
+    return flagged
+
+def record_dhash(db: Session, document_id: int, value: int):
+    """Store a document's dhash and flag near-duplicates from other users."""
+    document = db.get(KYCDocument, document_id)
+    if document is None:
+        return []
+    bands = dhash_bands(value)
+    document.dhash = f"{value:016x}"
+    for band, band_value in enumerate(bands):
+        setattr(document, f"dhash_band_{band}", band_value)
+
+    candidates = db.query(KYCDocument.id, KYCDocument.dhash).filter(
+        or_(*[getattr(KYCDocument, f"dhash_band_{band}") == band_value for band, band_value in enumerate(bands)]),
+        KYCDocument.user_id != document.user_id,
+        KYCDocument.id != document.id
+    ).all()
+    already_flagged = {flag_id for (flag_id,) in db.query(KYCDuplicateFlag.duplicate_of_id).filter(
+        KYCDuplicateFlag.document_id == document.id,
+        KYCDuplicateFlag.reason == "perceptual"
+    )}
+
+    flagged = []
+    for candidate_id, candidate_hash in candidates:
+        distance = bin(value ^ int(candidate_hash, 16)).count("1")
+        if distance <= NEAR_DUPLICATE_DISTANCE and candidate_id not in already_flagged:
+            _add_flag(db, document, candidate_id, "perceptual", distance)
+            flagged.append((candidate_id, distance))
+    if flagged:
+        versions.bump_after_commit(db, versions.KYC_PENDING)
+    db.commit()
+    return flagged
+
+def schedule_dhash(document_id, path, session_factory=SessionLocal):
+    """Hash the image in the preview worker pool; flags land when it finishes."""
+    if not can_hash(path):
+        return None
+
+    def store(future):
+        value = future.result()
+        if value is None:
+            return
+        db = session_factory()
+        try:
+            record_dhash(db, document_id, value)
+        finally:
+            db.close()
+
+    future = kyc_previews.previews.submit(dhash_of, path)
+    future.add_done_callback(store)
+    return future
+
+def flags_for(db: Session, document_ids):
+    """{document_id: [flag, ...]} from the point of view of each document, in one query."""
+    if not document_ids:
+        return {}
+    flags = db.query(KYCDuplicateFlag).filter(or_(
+        KYCDuplicateFlag.document_id.in_(document_ids),
+        KYCDuplicateFlag.duplicate_of_id.in_(document_ids)
+    )).all()
+    wanted = set(document_ids)
+    result = {document_id: [] for document_id in document_ids}
+    for flag in flags:
+        for own, other in ((flag.document_id, flag.duplicate_of_id), (flag.duplicate_of_id, flag.document_id)):
+            if own in wanted:
+                result[own].append({"document_id": other, "reason": flag.reason, "distance": flag.distance})
+    return result
+
+def backfill_document_number_hashes(session_factory=SessionLocal, chunk_size=5000, log=print):
+    # Older uploads predate document_number_hash; hash them in id order
+    db = session_factory()
+    try:
+        last_id = 0
+        updated = 0
+        while True:
+            documents = db.query(KYCDocument).filter(
+                KYCDocument.id > last_id,
+                KYCDocument.document_number_hash == None
+            ).order_by(KYCDocument.id).limit(chunk_size).all()
+            if not documents:
+                break
+            for document in documents:
+                document.document_number_hash = document_number_hash(document.document_type, document.document_number)
+            last_id = documents[-1].id
+            db.commit()
+            updated += len(documents)
+            log(f"{updated} document numbers hashed")
+        return updated
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python kyc_duplicates.py backfill")
+    backfill_document_number_hashes()
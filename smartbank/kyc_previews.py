@@ -0,0 +1,173 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+# Optional renderers: Pillow for images, PyMuPDF for the first page of PDFs
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+PREVIEW_DIR = os.environ.get("SMARTBANK_PREVIEW_DIR", "previews")
+PREVIEW_CACHE_BYTES = int(os.environ.get("SMARTBANK_PREVIEW_CACHE_BYTES", str(256 * 1024 * 1024)))
+PREVIEW_WORKERS = int(os.environ.get("SMARTBANK_PREVIEW_WORKERS", "2"))
+PREVIEW_MAX_SIZE = 800  # longest edge in pixels
+PREVIEW_MEDIA_TYPES = {".jpg": "image/jpeg", ".png": "image/png"}
+
+def content_hash_of(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def can_render(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".pdf":
+        return fitz is not None
+    return Image is not None and extension in (".jpg", ".jpeg", ".png")
+
+def render_preview(path, max_size=PREVIEW_MAX_SIZE):
+    """Returns (bytes, extension) for a downscaled preview of `path`.
+
+    Runs in a worker process: decoding multi-MB scans and rasterising PDFs is
+    CPU-bound and must not block the event loop or hold the GIL.
+    """
+    if path.lower().endswith(".pdf"):
+        document = fitz.open(path)
+        try:
+            page = document[0]
+            scale = max_size / max(page.rect.width, page.rect.height)
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(scale, scale))
+            return pixmap.tobytes("png"), ".png"
+        finally:
+            document.close()
+
+    with Image.open(path) as image:
+        image.draft("RGB", (max_size, max_size))  # lets JPEG decode at reduced size
+        image = image.convert("RGB")
+        image.thumbnail((max_size, max_size))
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=80, optimize=True)
+        return output.getvalue(), ".jpg"
+
+class PreviewCache:
+    """Content-addressed previews on disk, evicted least recently used first.
+
+    Recency is the file mtime, bumped on every hit, so all worker processes
+    sharing the directory agree on it without any coordination.
+    """
+
+    def __init__(self, path=PREVIEW_DIR, max_bytes=PREVIEW_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def get(self, content_hash):
+        for extension in PREVIEW_MEDIA_TYPES:
+            path = os.path.join(self.path, content_hash + extension)
+            try:
+                os.utime(path)
+                return path
+            except FileNotFoundError:
+                continue
+        return None
+
+    def put(self, content_hash, data, extension):
+        os.makedirs(self.path, exist_ok=True)
+        final_path = os.path.join(self.path, content_hash + extension)
+        fd, temp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as output:
+            output.write(data)
+        os.replace(temp_path, final_path)
+        self.evict()
+        return final_path
+
+    def size(self):
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def evict(self):
+        with self._lock:
+            entries = sorted(
+                ((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in self._entries()),
+                reverse=True
+            )
+            total = 0
+            for _, size, path in entries:
+                total += size
+                if total > self.max_bytes:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def _entries(self):
+        try:
+            with os.scandir(self.path) as scan:
+                return [entry for entry in scan if entry.is_file() and not entry.name.endswith(".tmp")]
+        except FileNotFoundError:
+            return []
+
+class PreviewService:
+    """Renders previews in a process pool and stores them in a PreviewCache."""
+
+    def __init__(self, cache=None, workers=PREVIEW_WORKERS, renderer=render_preview):
+        self.cache = cache or PreviewCache()
+        self.workers = workers
+        self.renderer = renderer
+        self._pool = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def ensure(self, content_hash, source_path):
+        """Future resolving to the cached preview path, or None if it cannot be rendered."""
+        cached = self.cache.get(content_hash)
+        if cached:
+            future = Future()
+            future.set_result(cached)
+            return future
+
+        with self._lock:
+            pending = self._pending.get(content_hash)
+            if pending is not None:
+                return pending
+            result = Future()
+            if self.renderer is render_preview and not can_render(source_path):
+                result.set_result(None)
+                return result
+            self._pending[content_hash] = result
+
+        def store(rendered):
+            try:
+                data, extension = rendered.result()
+                result.set_result(self.cache.put(content_hash, data, extension))
+            except Exception as e:
+                result.set_exception(e)
+            finally:
+                with self._lock:
+                    self._pending.pop(content_hash, None)
+
+        self.submit(self.renderer, source_path).add_done_callback(store)
+        return result
+
+    def submit(self, fn, *args):
+        # Other CPU-bound document work (e.g. perceptual hashing) shares the pool
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool.submit(fn, *args)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+previews = PreviewService()
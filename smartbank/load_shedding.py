@@ -0,0 +1,288 @@
+"""Adaptive concurrency limits, load shedding and request deadlines.
+
+Each process admits at most `limit` requests at a time. Beyond that they
+wait in a short queue or get a fast `503` with `Retry-After`, instead of
+piling up behind the database pool until every request, logins included,
+times out. Requests have priorities:
+- Critical: login, token refresh and transfers. They may use the whole
+  limit and queue longest.
+- Normal: everything else. It may use 80% of the limit.
+- Low: admin listings and statement exports. They may use half the limit
+  and never queue.
+So when the server is saturated, the cheap, important requests are the
+last to be turned away.
+
+The limit adapts to latency, as in the gradient limiters. A short-term
+latency average is compared with a long-term baseline. While recent
+requests stay within LIMIT_TOLERANCE times the baseline, the limit grows by
+about its square root. When they get slower, it shrinks in proportion, down
+to halving. So the limit settles where the database still answers quickly.
+
+Every request also gets a deadline, REQUEST_TIMEOUT_MS from arrival. A
+client can ask for a shorter one with `X-Request-Timeout-Ms`. Time spent
+queued counts. A statement issued after the deadline fails before it
+reaches the database. A running one is cut off by MySQL's MAX_EXECUTION_TIME
+hint on SELECTs, or by SQLite's progress handler. The request then gets a
+`503`, and its connection goes back to the pool instead of working for a
+client that has given up.
+"""
+import asyncio
+import json
+import math
+import os
+import re
+import sqlite3
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LOAD_SHEDDING = os.environ.get("SMARTBANK_LOAD_SHEDDING", "1") == "1"
+CONCURRENCY_LIMIT = int(os.environ.get("SMARTBANK_CONCURRENCY_LIMIT", "32"))
+CONCURRENCY_LIMIT_MIN = int(os.environ.get("SMARTBANK_CONCURRENCY_LIMIT_MIN", "4"))
+CONCURRENCY_LIMIT_MAX = int(os.environ.get("SMARTBANK_CONCURRENCY_LIMIT_MAX", "256"))
+SHED_MAX_QUEUE = int(os.environ.get("SMARTBANK_SHED_MAX_QUEUE", "100"))
+REQUEST_TIMEOUT_MS = int(os.environ.get("SMARTBANK_REQUEST_TIMEOUT_MS", "10000"))
+# Recent latency may reach this multiple of the baseline before the limit shrinks
+LIMIT_TOLERANCE = 2.0
+LIMIT_SMOOTHING = 0.2
+RETRY_AFTER_MAX_SECONDS = 30
+# SQLite VM instructions between deadline checks
+SQLITE_PROGRESS_OPS = 10000
+
+CRITICAL, NORMAL, LOW = 0, 1, 2
+PRIORITY_NAMES = ("critical", "normal", "low")
+# Share of the limit each priority may fill, and how long it may queue for a slot
+PRIORITY_SHARES = (1.0, 0.8, 0.5)
+PRIORITY_QUEUE_SECONDS = (2.0, 0.5, 0.0)
+# Matched against "METHOD /path"; the first match wins, else NORMAL
+ROUTE_PRIORITIES = (
+    (re.compile(r"POST /api/(login|token/refresh|transfers?)$"), CRITICAL),
+    (re.compile(r"GET /api/admin/load$"), CRITICAL),
+    (re.compile(r"\w+ /api/admin/"), LOW),
+    (re.compile(r"GET /api/accounts/[^/]+/statement/export$"), LOW),
+)
+# Streams live for as long as the client is connected and would pin a slot
+UNLIMITED_PATHS = ("/api/events",)
+
+_deadline = ContextVar("smartbank_deadline", default=None)
+
+class DeadlineExceeded(Exception):
+    pass
+
+def priority_of(method, path):
+    route = f"{method} {path}"
+    for pattern, priority in ROUTE_PRIORITIES:
+        if pattern.match(route):
+            return priority
+    return NORMAL
+
+def remaining():
+    """Seconds left before the current request's deadline, or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def cut_short(error):
+    """True if `error` is the current deadline stopping a statement, whatever the driver called it."""
+    if isinstance(error, DeadlineExceeded):
+        return True
+    left = remaining()
+    return left is not None and left <= 0
+
+@contextmanager
+def deadline(seconds):
+    """Run the block under a deadline `seconds` from now, or the current one if sooner."""
+    current = _deadline.get()
+    token = _deadline.set(min(time.monotonic() + seconds, current if current is not None else math.inf))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+class AdaptiveLimiter:
+    """Concurrency limit for one event loop, adjusted from observed latency."""
+
+    def __init__(self, initial=CONCURRENCY_LIMIT, minimum=CONCURRENCY_LIMIT_MIN, maximum=CONCURRENCY_LIMIT_MAX,
+                 max_queue=SHED_MAX_QUEUE):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.short_latency = None
+        self.long_latency = None
+        self.admitted = 0
+        self.shed = [0] * len(PRIORITY_NAMES)
+        self._waiters = [deque() for _ in PRIORITY_NAMES]
+
+    def allowed(self, priority):
+        return max(1, int(self.limit * PRIORITY_SHARES[priority]))
+
+    def queued(self):
+        return sum(len(waiters) for waiters in self._waiters)
+
+    async def acquire(self, priority, timeout=math.inf):
+        """True once a slot is held; False if the request should be shed."""
+        ahead = any(self._waiters[p] for p in range(priority + 1))
+        if not ahead and self.in_flight < self.allowed(priority):
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        wait = min(PRIORITY_QUEUE_SECONDS[priority], timeout)
+        if wait <= 0 or self.queued() >= self.max_queue:
+            self.shed[priority] += 1
+            return False
+
+        slot = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(slot)
+        try:
+            await asyncio.wait_for(asyncio.shield(slot), wait)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if slot.done():
+                self.release()
+            else:
+                self._waiters[priority].remove(slot)
+            raise
+        if slot.done():
+            # Handed over by release(), possibly just as the wait timed out
+            self.admitted += 1
+            return True
+        self._waiters[priority].remove(slot)
+        slot.cancel()
+        self.shed[priority] += 1
+        return False
+
+    def release(self, latency=None):
+        self.in_flight -= 1
+        if latency is not None:
+            self._observe(latency)
+        # Free slots go to the most important waiters first
+        for priority, waiters in enumerate(self._waiters):
+            while waiters and self.in_flight < self.allowed(priority):
+                self.in_flight += 1
+                waiters.popleft().set_result(None)
+
+    def _observe(self, latency):
+        if self.short_latency is None:
+            self.short_latency = self.long_latency = latency
+            return
+        self.short_latency += 0.2 * (latency - self.short_latency)
+        self.long_latency += 0.01 * (latency - self.long_latency)
+        if self.long_latency > LIMIT_TOLERANCE * self.short_latency:
+            # Load has dropped; let the baseline come down with it
+            self.long_latency *= 0.95
+        gradient = max(0.5, min(1.0, LIMIT_TOLERANCE * self.long_latency / max(self.short_latency, 1e-9)))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        if target > self.limit and self.in_flight + 1 < self.limit / 2:
+            # Not using the limit we have; raising it proves nothing
+            return
+        self.limit = min(self.maximum, max(self.minimum,
+                                           self.limit * (1 - LIMIT_SMOOTHING) + target * LIMIT_SMOOTHING))
+
+    def retry_after(self):
+        """Seconds until a retry is likely to find a free slot."""
+        latency = self.short_latency or 0.0
+        seconds = math.ceil(latency * (self.queued() + 1) / max(self.limit, 1))
+        return min(RETRY_AFTER_MAX_SECONDS, max(1, seconds))
+
+    def snapshot(self):
+        return {
+            "limit": round(self.limit, 1),
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "queued": {name: len(self._waiters[p]) for p, name in enumerate(PRIORITY_NAMES)},
+            "shed": {name: self.shed[p] for p, name in enumerate(PRIORITY_NAMES)},
+            "latency_ms": round((self.short_latency or 0.0) * 1000, 3),
+            "baseline_latency_ms": round((self.long_latency or 0.0) * 1000, 3)
+        }
+
+limiter = AdaptiveLimiter()
+
+def request_timeout(scope):
+    for name, value in scope.get("headers", ()):
+        if name == b"x-request-timeout-ms":
+            try:
+                return min(int(value), REQUEST_TIMEOUT_MS) / 1000
+            except ValueError:
+                break
+    return REQUEST_TIMEOUT_MS / 1000
+
+async def unavailable(send, detail, retry_after):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(retry_after).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+class LoadSheddingMiddleware:
+    """Admits requests through `limiter` and runs them under a deadline."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in UNLIMITED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        timeout = request_timeout(scope)
+        token = _deadline.set(time.monotonic() + timeout)
+        current = limiter
+        try:
+            if not await current.acquire(priority_of(scope["method"], scope["path"]), timeout):
+                await unavailable(send, "Server is busy, please retry", current.retry_after())
+                return
+            response_started = False
+
+            async def send_tracking(message):
+                nonlocal response_started
+                response_started = response_started or message["type"] == "http.response.start"
+                await send(message)
+
+            started = time.monotonic()
+            try:
+                await self.app(scope, receive, send_tracking)
+            except Exception:
+                if response_started or remaining() > 0:
+                    raise
+                # The deadline cut the request short; its own error is not the story
+                await unavailable(send, "Request deadline exceeded", current.retry_after())
+            finally:
+                current.release(time.monotonic() - started)
+        finally:
+            _deadline.reset(token)
+
+def _sqlite_deadline_passed():
+    # Called by SQLite on the executing thread, so the request's context is current
+    deadline = _deadline.get()
+    return deadline is not None and time.monotonic() > deadline
+
+def _apply_deadline(conn, cursor, statement, parameters, context, executemany):
+    deadline = _deadline.get()
+    if deadline is None:
+        return statement, parameters
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    if conn.dialect.name == "mysql":
+        stripped = statement.lstrip()
+        if stripped[:6].upper() == "SELECT":
+            statement = f"SELECT /*+ MAX_EXECUTION_TIME({max(1, int(left * 1000))}) */{stripped[6:]}"
+    elif conn.dialect.name == "sqlite" and not conn.info.get("deadline_handler"):
+        dbapi_connection = conn.connection.dbapi_connection
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            dbapi_connection.set_progress_handler(_sqlite_deadline_passed, SQLITE_PROGRESS_OPS)
+            conn.info["deadline_handler"] = True
+    return statement, parameters
+
+def install():
+    if not event.contains(Engine, "before_cursor_execute", _apply_deadline):
+        event.listen(Engine, "before_cursor_execute", _apply_deadline, retval=True)
@@ -1,22 +1,59 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Form, File, UploadFile, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import asyncio
+import hashlib
+import logging
 import os
-import shutil
-from typing import List
+import uuid
+from typing import List, Optional
 
 from database import SessionLocal, engine, get_db
-from models import Base, User, KYCDocument, KYCStatus, UserRole, Account
+from models import Base, User, KYCDocument, KYCStatus, UserRole, Account, Transaction, TransactionType, QueuedTransfer, AuditLog, RevokedToken, StandingInstruction, InstructionStatus
 import schemas
-from auth import get_password_hash, authenticate_user, create_access_token, get_current_user
+from auth import (
+    STREAM_TICKET_EXPIRE_SECONDS, get_password_hash, authenticate_user, create_access_token, create_refresh_token,
+    create_stream_ticket, decode_token, get_current_user, get_user_from_claims, security
+)
+from sharding import SHARD_DATABASE_URLS, ShardedSessionFactory
+from transfers import TransferError, perform_transfer
+import striping
+import fraud
+import events
+import account_directory
+import kyc_previews
+import kyc_duplicates
+import load_shedding
+import user_search
+import revocation
+import dashboard
+import notifications
+import profiling
+import rollups
+import slow_queries
+import standing_instructions
+import statements
+import versions
+from versions import accounts_key, kyc_key
+from compression import CompressionMiddleware
+from transfer_queue import TRANSFER_QUEUE_WORKERS, TransferWorkerPool, enqueue_transfer, queue_depth, metrics as transfer_queue_metrics
+
+logger = logging.getLogger(__name__)
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="SmartBank API", version="1.0.0")
+app.add_middleware(CompressionMiddleware)
+if load_shedding.LOAD_SHEDDING:
+    app.add_middleware(load_shedding.LoadSheddingMiddleware)
 
 # Create directories for static files and uploads
 os.makedirs("static", exist_ok=True)
@@ -26,6 +63,156 @@ os.makedirs("uploads", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+@app.on_event("startup")
+def recover_cross_shard_transfers():
+    # Finish or compensate cross-shard transfers that writers using
+    # ShardedSessionFactory left in doubt; the API itself does not write to
+    # the shards. Failures are logged; `python sharding.py recover` or the
+    # next start retries.
+    if SHARD_DATABASE_URLS:
+        try:
+            outcomes = ShardedSessionFactory(SHARD_DATABASE_URLS).recover_in_doubt_transfers()
+        except Exception:
+            logger.exception("Cross-shard transfer recovery failed")
+        else:
+            if outcomes.get("error"):
+                logger.warning("Cross-shard transfers left in doubt: %s", outcomes)
+
+@app.on_event("startup")
+def check_document_hash_key():
+    kyc_duplicates.check_document_hash_key()
+
+@app.on_event("startup")
+def ensure_user_search_index():
+    # Tables created by create_all get the index immediately; this covers older databases
+    with engine.begin() as conn:
+        user_search.ensure_index(conn)
+
+def add_missing_columns(bind, tables):
+    """ALTER in the model columns an existing table lacks; returns their names.
+
+    create_all never alters a table that already exists. Added columns are
+    nullable, so rows written before the upgrade read as NULL.
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with bind.begin() as conn:
+        for table in tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+                    ))
+                    added.append(f"{table.name}.{column.name}")
+    return added
+
+@app.on_event("startup")
+def ensure_added_columns():
+    # Runs before the index hook below, which indexes some of these columns
+    added = add_missing_columns(engine, Base.metadata.sorted_tables)
+    if added:
+        logger.warning("Added columns missing from existing tables: %s", ", ".join(added))
+
+@app.on_event("startup")
+def ensure_transaction_indexes():
+    # create_all skips indexes on tables that already exist
+    for table in (Transaction.__table__, AuditLog.__table__, RevokedToken.__table__, KYCDocument.__table__):
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+@app.on_event("startup")
+def purge_revoked_tokens():
+    # The first sync deletes rows for tokens past their expiry; later ones
+    # repeat it every REVOCATION_PURGE_SECONDS
+    db = SessionLocal()
+    try:
+        revocation.revocations.sync(db, rebuild=True)
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def warm_account_directory():
+    # The first worker to start fills the shared directory; the rest reuse it.
+    # A file left over from before a database restore is cleared first.
+    db = SessionLocal()
+    try:
+        account_directory.directory.check(db)
+        if len(account_directory.directory) == 0:
+            account_directory.directory.load(db)
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def rebuild_fraud_features():
+    # Replay recent transfers so velocity checks survive restarts
+    if fraud.scorer.rules.enabled:
+        db = SessionLocal()
+        try:
+            fraud.scorer.rebuild(db)
+        finally:
+            db.close()
+
+transfer_worker_pool = TransferWorkerPool(workers=TRANSFER_QUEUE_WORKERS)
+
+@app.on_event("startup")
+def start_transfer_workers():
+    if TRANSFER_QUEUE_WORKERS > 0:
+        transfer_worker_pool.start()
+
+@app.on_event("shutdown")
+def stop_transfer_workers():
+    if transfer_worker_pool.running:
+        transfer_worker_pool.stop()
+
+notification_dispatcher = notifications.NotificationDispatcher()
+
+@app.on_event("startup")
+def start_notification_dispatcher():
+    if notifications.NOTIFICATION_DISPATCHER:
+        notification_dispatcher.start()
+
+@app.on_event("shutdown")
+def stop_notification_dispatcher():
+    if notification_dispatcher.running:
+        notification_dispatcher.stop()
+
+@app.on_event("startup")
+def enforce_request_deadlines():
+    # Statements run for a request stop at its deadline
+    if load_shedding.LOAD_SHEDDING:
+        load_shedding.install()
+
+@app.on_event("startup")
+def start_slow_query_log():
+    if slow_queries.SLOW_QUERY_LOG:
+        slow_queries.install()
+
+@app.on_event("shutdown")
+def stop_slow_query_explainer():
+    slow_queries.recorder.shutdown()
+
+@app.on_event("shutdown")
+def stop_preview_workers():
+    kyc_previews.previews.shutdown()
+
+def conditional_get(request: Request, response: Response, name: str, *keys):
+    """304 if the client's copy is current, else None after setting the ETag.
+
+    Call before querying: the ETag must not be newer than the data it labels.
+    """
+    if not versions.ETAGS:
+        return None
+    etag = versions.versions.etag(name, *keys)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if versions.matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
 # API Routes
 @app.post("/api/register", response_model=schemas.UserResponse)
 async def register_user(user: schemas.UserRegistration, db: Session = Depends(get_db)):
@@ -73,9 +260,47 @@ async def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_d
     return {
         "access_token": access_token, 
         "token_type": "bearer",
+        "refresh_token": create_refresh_token(data={"sub": user.email}),
         "user_role": user.role.value
     }
 
+@app.post("/api/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(request: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    payload = decode_token(request.refresh_token, db, token_type="refresh")
+    user = get_user_from_claims(payload, db)
+    # Refresh tokens are single use: the old one is revoked as the new pair is issued.
+    # Losing the race to revoke it means another request already spent it.
+    if not revocation.revocations.revoke(db, payload["jti"], user.id, datetime.utcfromtimestamp(payload["exp"])):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {
+        "access_token": create_access_token(data={"sub": user.email}, expires_delta=timedelta(minutes=30)),
+        "token_type": "bearer",
+        "refresh_token": create_refresh_token(data={"sub": user.email})
+    }
+
+@app.post("/api/logout")
+async def logout(
+    request: schemas.LogoutRequest = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    payload = decode_token(credentials.credentials, db)
+    user = get_user_from_claims(payload, db)
+    tokens = [payload]
+    if request is not None and request.refresh_token:
+        refresh = decode_token(request.refresh_token, db, token_type="refresh")
+        if refresh["sub"] != user.email:
+            raise HTTPException(status_code=400, detail="Refresh token belongs to another user")
+        tokens.append(refresh)
+    for claims in tokens:
+        if claims.get("jti"):
+            revocation.revocations.revoke(db, claims["jti"], user.id, datetime.utcfromtimestamp(claims["exp"]))
+    return {"message": "Logged out"}
+
 @app.post("/api/kyc/upload")
 async def upload_kyc_document(
     document_type: str = Form(...),
@@ -93,30 +318,73 @@ async def upload_kyc_document(
             detail="Only JPG, PNG, and PDF files are allowed"
         )
     
-    # Save file
+    # Save file, hashing it on the way so previews can be cached by content
     file_path = f"uploads/{current_user.id}_{document_type}_{document_file.filename}"
+    digest = hashlib.sha256()
     with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(document_file.file, buffer)
+        for chunk in iter(lambda: document_file.file.read(1024 * 1024), b""):
+            digest.update(chunk)
+            buffer.write(chunk)
     
     # Save KYC document record
     kyc_doc = KYCDocument(
         user_id=current_user.id,
         document_type=document_type,
         document_number=document_number,
-        document_path=file_path
+        document_path=file_path,
+        content_hash=digest.hexdigest()
     )
     
     db.add(kyc_doc)
+    db.flush()
+    kyc_duplicates.flag_exact_duplicates(db, kyc_doc)
+    versions.bump_after_commit(db, kyc_key(current_user.id), versions.KYC_PENDING)
     db.commit()
     db.refresh(kyc_doc)
     
+    # Render the review preview and the perceptual hash in the background;
+    # nothing waits for them here
+    kyc_previews.previews.ensure(kyc_doc.content_hash, file_path)
+    kyc_duplicates.schedule_dhash(kyc_doc.id, file_path)
+    
     return {"message": "KYC document uploaded successfully", "document_id": kyc_doc.id}
 
+@app.post("/api/events/ticket")
+async def create_events_ticket(current_user: User = Depends(get_current_user)):
+    # EventSource cannot send headers, so it authenticates with a ticket in the URL instead of the JWT
+    return {
+        "ticket": create_stream_ticket(data={"sub": current_user.email}),
+        "expires_in": STREAM_TICKET_EXPIRE_SECONDS
+    }
+
+@app.get("/api/events")
+async def stream_events(ticket: str, db: Session = Depends(get_db)):
+    payload = decode_token(ticket, db, token_type="stream")
+    user = get_user_from_claims(payload, db)
+    # Single use: a ticket replayed from a log or a proxy finds its jti already revoked
+    if not revocation.revocations.revoke(db, payload["jti"], user.id, datetime.utcfromtimestamp(payload["exp"])):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    db.close()  # Don't hold a pooled connection for the life of the stream
+    return StreamingResponse(
+        events.broker.stream(user.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/kyc/status", response_model=List[schemas.KYCDocumentResponse])
 async def get_kyc_status(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    not_modified = conditional_get(request, response, f"kyc-{current_user.id}", versions.KYC_ALL, kyc_key(current_user.id))
+    if not_modified:
+        return not_modified
     kyc_docs = db.query(KYCDocument).filter(KYCDocument.user_id == current_user.id).all()
     return kyc_docs
 
@@ -137,6 +405,20 @@ async def get_auditor_user(current_user: User = Depends(get_current_user)):
         )
     return current_user
 
+async def authorize_profiling(scope):
+    # The admin check of the routes, run before routing; the override keeps tests on their database
+    sessions = app.dependency_overrides.get(get_db, get_db)()
+    try:
+        credentials = await security(Request(scope))
+        await get_admin_user(await get_current_user(credentials, next(sessions)))
+        return True
+    except HTTPException:
+        return False
+    finally:
+        sessions.close()
+
+app.add_middleware(profiling.ProfilingMiddleware, authorize=authorize_profiling)
+
 @app.post("/api/admin/create", response_model=schemas.UserResponse)
 async def create_admin(
     email: str = Form(...),
@@ -181,6 +463,29 @@ async def get_all_users(
     users = db.query(User).all()
     return users
 
+@app.get("/api/admin/users/search", response_model=schemas.UserSearchResponse)
+async def search_users(
+    q: str,
+    page: int = 1,
+    page_size: int = 20,
+    admin_user: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Search query must not be empty")
+    if page < 1 or not 1 <= page_size <= 100:
+        raise HTTPException(status_code=400, detail="page must be >= 1 and page_size between 1 and 100")
+
+    # One extra row tells us whether there is a next page without counting
+    matches = user_search.search_users(db, q, limit=page_size + 1, offset=(page - 1) * page_size)
+    return {
+        "query": q,
+        "page": page,
+        "page_size": page_size,
+        "has_more": len(matches) > page_size,
+        "results": [{"user": user, "score": score} for user, score in matches[:page_size]]
+    }
+
 @app.put("/api/admin/kyc/{document_id}/approve")
 async def approve_kyc_document(
     document_id: int,
@@ -194,6 +499,15 @@ async def approve_kyc_document(
     kyc_doc.status = KYCStatus.APPROVED
     kyc_doc.verified_by = admin_user.id
     kyc_doc.verified_at = datetime.utcnow()
+    events.publish_after_commit(db, kyc_doc.user_id, "kyc", {
+        "document_id": kyc_doc.id,
+        "status": kyc_doc.status.value
+    })
+    versions.bump_after_commit(db, kyc_key(kyc_doc.user_id), versions.KYC_PENDING)
+    notifications.notify(db, kyc_doc.user_id, "kyc.approved", {
+        "document_id": kyc_doc.id,
+        "document_type": kyc_doc.document_type
+    })
     
     db.commit()
     return {"message": "KYC document approved"}
@@ -211,19 +525,75 @@ async def reject_kyc_document(
     kyc_doc.status = KYCStatus.REJECTED
     kyc_doc.verified_by = admin_user.id
     kyc_doc.verified_at = datetime.utcnow()
+    events.publish_after_commit(db, kyc_doc.user_id, "kyc", {
+        "document_id": kyc_doc.id,
+        "status": kyc_doc.status.value
+    })
+    versions.bump_after_commit(db, kyc_key(kyc_doc.user_id), versions.KYC_PENDING)
+    notifications.notify(db, kyc_doc.user_id, "kyc.rejected", {
+        "document_id": kyc_doc.id,
+        "document_type": kyc_doc.document_type
+    })
     
     db.commit()
     return {"message": "KYC document rejected"}
 
 @app.get("/api/admin/kyc/pending")
 async def get_pending_kyc_documents(
+    request: Request,
+    response: Response,
     admin_user: User = Depends(get_admin_user),
     db: Session = Depends(get_db)
 ):
+    not_modified = conditional_get(request, response, "kyc-pending", versions.KYC_ALL, versions.KYC_PENDING)
+    if not_modified:
+        return not_modified
     pending_docs = db.query(KYCDocument).filter(
         KYCDocument.status == KYCStatus.PENDING
     ).all()
-    return pending_docs
+    # Duplicate flags for the whole page in one query
+    flags = kyc_duplicates.flags_for(db, [doc.id for doc in pending_docs])
+    return [
+        {
+            **{column.name: getattr(doc, column.name) for column in KYCDocument.__table__.columns},
+            "duplicate_flags": flags[doc.id]
+        }
+        for doc in pending_docs
+    ]
+
+@app.get("/api/admin/kyc/{document_id}/preview")
+async def get_kyc_preview(
+    document_id: int,
+    request: Request,
+    admin_user: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    kyc_doc = db.query(KYCDocument).filter(KYCDocument.id == document_id).first()
+    if not kyc_doc:
+        raise HTTPException(status_code=404, detail="KYC document not found")
+    if not kyc_doc.document_path or not os.path.exists(kyc_doc.document_path):
+        raise HTTPException(status_code=404, detail="Document file not found")
+    if not kyc_doc.content_hash:
+        # Uploaded before previews existed
+        kyc_doc.content_hash = await run_in_threadpool(kyc_previews.content_hash_of, kyc_doc.document_path)
+        db.commit()
+
+    # Previews are content-addressed, so the browser may keep them forever
+    etag = f'"{kyc_doc.content_hash}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        preview_path = await asyncio.wrap_future(
+            kyc_previews.previews.ensure(kyc_doc.content_hash, kyc_doc.document_path)
+        )
+        with open(preview_path, "rb") as preview:
+            content = preview.read()
+    except Exception:
+        raise HTTPException(status_code=404, detail="Preview not available")
+    media_type = kyc_previews.PREVIEW_MEDIA_TYPES[os.path.splitext(preview_path)[1]]
+    return Response(content=content, media_type=media_type, headers=headers)
 
 @app.post("/api/accounts/create")
 async def create_account(
@@ -249,8 +619,23 @@ async def create_account(
     )
     
     db.add(new_account)
+    db.flush()
+    # The opening deposit is a ledger posting like any other credit
+    if initial_deposit > 0:
+        db.add(Transaction(
+            transaction_id=f"DEP{uuid.uuid4().hex}",
+            to_account_id=new_account.id,
+            amount=initial_deposit,
+            transaction_type=TransactionType.DEPOSIT,
+            description="Initial deposit"
+        ))
+    # Opens the account's history at its first balance
+    rollups.record(db, new_account.id, credits=initial_deposit, closing_balance=initial_deposit,
+                   count=1 if initial_deposit > 0 else 0)
+    versions.bump_after_commit(db, accounts_key(current_user.id))
     db.commit()
     db.refresh(new_account)
+    account_directory.directory.publish(new_account)
     
     return {
         "message": "Account created successfully",
@@ -263,55 +648,180 @@ async def create_account(
 async def transfer_money(
     from_account: str = Form(...),
     to_account: str = Form(...),
-    amount: float = Form(...),
+    amount: Decimal = Form(...),
     description: str = Form(""),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Validate amount
-    if amount <= 0:
-        raise HTTPException(status_code=400, detail="Amount must be greater than 0")
-    
-    # Get sender account
-    sender_account = db.query(Account).filter(
-        Account.account_number == from_account,
-        Account.user_id == current_user.id
+    try:
+        return perform_transfer(db, current_user.id, from_account, to_account, amount, description)
+    except TransferError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.post("/api/transfers", status_code=status.HTTP_202_ACCEPTED)
+async def submit_transfer(
+    from_account: str = Form(...),
+    to_account: str = Form(...),
+    amount: Decimal = Form(...),
+    description: str = Form(""),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if not transfer_worker_pool.running:
+        raise HTTPException(status_code=503, detail="Asynchronous transfers are disabled")
+    try:
+        queued = enqueue_transfer(db, current_user.id, from_account, to_account, amount, description)
+    except TransferError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {"transfer_id": queued.id, "status": queued.status.value}
+
+@app.get("/api/transfers/{transfer_id}")
+async def get_transfer_status(
+    transfer_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    queued = db.query(QueuedTransfer).filter(
+        QueuedTransfer.id == transfer_id,
+        QueuedTransfer.user_id == current_user.id
     ).first()
-    
-    if not sender_account:
-        raise HTTPException(status_code=404, detail="Sender account not found")
-    
-    # Get receiver account
-    receiver_account = db.query(Account).filter(Account.account_number == to_account).first()
-    if not receiver_account:
-        raise HTTPException(status_code=404, detail="Receiver account not found")
-    
-    # Validate sender balance
-    if float(sender_account.balance) < amount:
-        raise HTTPException(status_code=400, detail="Insufficient funds")
-    
-    # Simple daily limit check
-    if amount > float(sender_account.daily_limit):
-        raise HTTPException(status_code=400, detail="Amount exceeds daily limit")
-    
+    if not queued:
+        raise HTTPException(status_code=404, detail="Transfer not found")
+    return {
+        "transfer_id": queued.id,
+        "status": queued.status.value,
+        "amount": float(queued.amount),
+        "from_account": queued.from_account,
+        "to_account": queued.to_account,
+        "new_balance": float(queued.new_balance) if queued.new_balance is not None else None,
+        "error": queued.error,
+        "created_at": queued.created_at,
+        "completed_at": queued.completed_at
+    }
+
+def instruction_response(instruction: StandingInstruction):
+    return {
+        "instruction_id": instruction.id,
+        "from_account": instruction.from_account,
+        "to_account": instruction.to_account,
+        "amount": float(instruction.amount),
+        "description": instruction.description,
+        "frequency": instruction.frequency.value,
+        "status": instruction.status.value,
+        "next_due_at": instruction.due_at,
+        "end_at": instruction.end_at,
+        "runs": instruction.runs,
+        "last_run_at": instruction.last_run_at,
+        "last_error": instruction.last_error
+    }
+
+@app.post("/api/standing-instructions", status_code=status.HTTP_201_CREATED)
+async def create_standing_instruction(
+    from_account: str = Form(...),
+    to_account: str = Form(...),
+    amount: Decimal = Form(...),
+    frequency: str = Form(...),
+    start_date: date = Form(...),
+    end_date: Optional[date] = Form(None),
+    description: str = Form(""),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if start_date < datetime.utcnow().date():
+        raise HTTPException(status_code=400, detail="Start date must not be in the past")
     try:
-        # Update balances
-        sender_account.balance = float(sender_account.balance) - amount
-        receiver_account.balance = float(receiver_account.balance) + amount
-        
-        db.commit()
-        
-        return {
-            "message": "Transfer successful",
-            "amount": amount,
-            "from_account": from_account,
-            "to_account": to_account,
-            "new_balance": float(sender_account.balance)
-        }
-        
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Transfer failed: {str(e)}")
+        instruction = standing_instructions.create_instruction(
+            db, current_user.id, from_account, to_account, amount, frequency,
+            datetime.combine(start_date, datetime.min.time()),
+            datetime.combine(end_date, datetime.min.time()) if end_date else None,
+            description
+        )
+    except TransferError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return instruction_response(instruction)
+
+@app.get("/api/standing-instructions")
+async def list_standing_instructions(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    instructions = db.query(StandingInstruction).filter(
+        StandingInstruction.user_id == current_user.id
+    ).order_by(StandingInstruction.id).all()
+    return [instruction_response(instruction) for instruction in instructions]
+
+@app.delete("/api/standing-instructions/{instruction_id}")
+async def cancel_standing_instruction(
+    instruction_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    instruction = db.query(StandingInstruction).filter(
+        StandingInstruction.id == instruction_id,
+        StandingInstruction.user_id == current_user.id
+    ).first()
+    if not instruction:
+        raise HTTPException(status_code=404, detail="Standing instruction not found")
+    instruction.status = InstructionStatus.CANCELLED
+    db.commit()
+    return {"message": "Standing instruction cancelled"}
+
+@app.get("/api/admin/transfers/metrics")
+async def get_transfer_queue_metrics(
+    admin_user: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    return {**transfer_queue_metrics.snapshot(), "queue_depth": queue_depth(db)}
+
+@app.get("/api/admin/notifications/metrics")
+async def get_notification_metrics(
+    admin_user: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    return notifications.outbox_counts(db)
+
+@app.get("/api/admin/profiles")
+async def list_profiles(admin_user: User = Depends(get_admin_user)):
+    return profiling.profiles.list()
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    format: str = "json",
+    admin_user: User = Depends(get_admin_user)
+):
+    profile = profiling.profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return Response(content=profile["folded"], media_type="text/plain")
+    return profile
+
+@app.get("/api/admin/load")
+async def get_load(admin_user: User = Depends(get_admin_user)):
+    return load_shedding.limiter.snapshot()
+
+@app.get("/api/admin/slow-queries")
+async def get_slow_queries(
+    order: str = "total_ms",
+    limit: int = 20,
+    admin_user: User = Depends(get_admin_user)
+):
+    try:
+        fingerprints = slow_queries.recorder.top(order, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "threshold_ms": slow_queries.recorder.threshold_ms,
+        "tracked": len(slow_queries.recorder),
+        "evicted": slow_queries.recorder.evicted,
+        "fingerprints": fingerprints
+    }
+
+@app.delete("/api/admin/slow-queries")
+async def reset_slow_queries(admin_user: User = Depends(get_admin_user)):
+    slow_queries.recorder.reset()
+    return {"message": "Slow-query log cleared"}
 
 @app.get("/api/transactions")
 async def get_transactions(
@@ -329,6 +839,24 @@ async def get_transactions(
     ).order_by(Transaction.created_at.desc()).limit(10).all()
     
     return transactions
+
+@app.get("/api/dashboard", response_model=schemas.DashboardResponse)
+async def get_dashboard(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Profile, accounts, recent transactions and KYC in one request. The date
+    # is in the ETag because "transactions today" changes at midnight.
+    not_modified = conditional_get(
+        request, response, f"dashboard-{current_user.id}-{datetime.utcnow():%Y%m%d}",
+        versions.ACCOUNTS_ALL, accounts_key(current_user.id), versions.KYC_ALL, kyc_key(current_user.id)
+    )
+    if not_modified:
+        return not_modified
+    return dashboard.load_dashboard(db, current_user)
+
 async def get_user_accounts(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -389,65 +917,126 @@ async def create_account(
 
 @app.get("/api/accounts")
 async def get_user_accounts(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    not_modified = conditional_get(request, response, f"accounts-{current_user.id}", versions.ACCOUNTS_ALL, accounts_key(current_user.id))
+    if not_modified:
+        return not_modified
     accounts = db.query(Account).filter(Account.user_id == current_user.id).all()
+    
+    # Striped accounts report their row balance plus their stripes, as balance_of does
+    striped = striping.striped_balances(db, [acc.id for acc in accounts if acc.stripe_count])
+    for account in accounts:
+        if account.id in striped:
+            db.expunge(account)
+            account.balance = Decimal(account.balance or 0) + striped[account.id]
     return accounts
 
-@app.post("/api/transfer")
-async def transfer_money(
-    from_account: str = Form(...),
-    to_account: str = Form(...),
-    amount: float = Form(...),
-    description: str = Form(""),
+def get_statement_account(db: Session, account_number: str, user: User):
+    account = db.query(Account).filter(Account.account_number == account_number).first()
+    # Auditors and admins may read any statement; customers only their own
+    if not account or (account.user_id != user.id and user.role not in (UserRole.ADMIN, UserRole.AUDITOR)):
+        raise HTTPException(status_code=404, detail="Account not found")
+    return account
+
+@app.get("/api/accounts/{account_number}/statement")
+async def get_statement(
+    account_number: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Validate amount
-    if amount <= 0:
-        raise HTTPException(status_code=400, detail="Amount must be greater than 0")
-    
-    # Get sender account
-    sender_account = db.query(Account).filter(
-        Account.account_number == from_account,
-        Account.user_id == current_user.id
-    ).first()
-    
-    if not sender_account:
-        raise HTTPException(status_code=404, detail="Sender account not found")
-    
-    # Get receiver account
-    receiver_account = db.query(Account).filter(Account.account_number == to_account).first()
-    if not receiver_account:
-        raise HTTPException(status_code=404, detail="Receiver account not found")
-    
-    # Validate sender balance
-    if sender_account.balance < amount:
-        raise HTTPException(status_code=400, detail="Insufficient funds")
-    
-    # Check daily limit (simplified - just check current balance for now)
-    if amount > float(sender_account.daily_limit):
-        raise HTTPException(status_code=400, detail="Amount exceeds daily limit")
+    try:
+        start_at, end_at = statements.statement_range(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    account = get_statement_account(db, account_number, current_user)
+    return {
+        "account_number": account_number,
+        "start": start_at,
+        "end": end_at,
+        "transactions": statements.statement_rows(db, account, start_at, end_at)
+    }
+
+@app.get("/api/accounts/{account_number}/statement/export")
+async def export_statement(
+    account_number: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    try:
+        start_at, end_at = statements.statement_range(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    account = get_statement_account(db, account_number, current_user)
+    entries = statements.statement_rows(db, account, start_at, end_at)
+    filename = f"{account_number}_{start_at:%Y%m%d}_{end_at - timedelta(microseconds=1):%Y%m%d}.csv"
+    return StreamingResponse(
+        statements.to_csv(entries),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/api/accounts/{account_number}/history")
+async def get_account_history(
+    account_number: str,
+    granularity: str = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    account = get_statement_account(db, account_number, current_user)
+    try:
+        points = rollups.history(db, account, granularity, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"account_number": account_number, "granularity": granularity, "points": points}
+
+@app.put("/api/admin/accounts/{account_number}/deactivate")
+async def deactivate_account(
+    account_number: str,
+    admin_user: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    account = db.query(Account).filter(Account.account_number == account_number).first()
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
     
+    account.is_active = False
+    versions.bump_after_commit(db, accounts_key(account.user_id))
+    db.commit()
+    account_directory.directory.publish(account)
+    return {"message": "Account deactivated", "account_number": account_number}
+
+@app.put("/api/admin/accounts/{account_number}/striping")
+async def set_account_striping(
+    account_number: str,
+    stripes: int = Form(...),
+    admin_user: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    account = db.query(Account).filter(Account.account_number == account_number).first()
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
     try:
-        # Update balances
-        sender_account.balance -= amount
-        receiver_account.balance += amount
-        
-        db.commit()
-        
-        return {
-            "message": "Transfer successful",
-            "amount": amount,
-            "from_account": from_account,
-            "to_account": to_account,
-            "new_balance": float(sender_account.balance)
-        }
-        
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Transfer failed: {str(e)}")
+        balance = striping.set_stripe_count(db, account, stripes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    account_directory.directory.publish(account)
+    versions.versions.bump(accounts_key(account.user_id))
+    return {
+        "message": "Account striping updated",
+        "account_number": account_number,
+        "stripes": stripes,
+        "balance": float(balance)
+    }
 
 # Web Routes for UI
 @app.get("/", response_class=HTMLResponse)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Enum, Numeric
+from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, Text, ForeignKey, Enum, Numeric, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -25,6 +25,37 @@ class TransactionType(enum.Enum):
     DEPOSIT = "deposit"
     WITHDRAWAL = "withdrawal"
     TRANSFER = "transfer"
+    INTEREST = "interest"
+
+class QueuedTransferStatus(enum.Enum):
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class OutboxStatus(enum.Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+class InstructionFrequency(enum.Enum):
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+
+class InstructionStatus(enum.Enum):
+    ACTIVE = "active"
+    PAUSED = "paused"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
+
+class ShardTransferStatus(enum.Enum):
+    PENDING = "pending"
+    DEBITED = "debited"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    COMPENSATED = "compensated"
 
 class User(Base):
     __tablename__ = "users"
@@ -54,6 +85,14 @@ class KYCDocument(Base):
     document_type = Column(String(50), nullable=False)  # aadhar, pan, passport, etc.
     document_number = Column(String(100), nullable=False)
     document_path = Column(String(500))  # File path for uploaded document
+    content_hash = Column(String(64), index=True)  # sha256 of the uploaded file
+    document_number_hash = Column(String(64), index=True)  # keyed hash of the normalized number
+    dhash = Column(String(16))  # 64-bit perceptual hash of the image, hex
+    # The dhash split into 16-bit bands; a near-duplicate shares at least one
+    dhash_band_0 = Column(Integer, index=True)
+    dhash_band_1 = Column(Integer, index=True)
+    dhash_band_2 = Column(Integer, index=True)
+    dhash_band_3 = Column(Integer, index=True)
     status = Column(Enum(KYCStatus), default=KYCStatus.PENDING)
     verified_by = Column(Integer, ForeignKey("users.id"))
     verified_at = Column(DateTime)
@@ -62,6 +101,18 @@ class KYCDocument(Base):
     # Relationships
     user = relationship("User", back_populates="kyc_documents", foreign_keys=[user_id])
 
+class KYCDuplicateFlag(Base):
+    # `document_id` looks like a copy of `duplicate_of_id`, submitted by another user
+    __tablename__ = "kyc_duplicate_flags"
+    __table_args__ = (UniqueConstraint("document_id", "duplicate_of_id", "reason"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("kyc_documents.id"), nullable=False, index=True)
+    duplicate_of_id = Column(Integer, ForeignKey("kyc_documents.id"), nullable=False, index=True)
+    reason = Column(String(20), nullable=False)  # document_number, content, perceptual
+    distance = Column(Integer)  # Hamming distance for perceptual matches
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Account(Base):
     __tablename__ = "accounts"
     
@@ -71,6 +122,7 @@ class Account(Base):
     account_type = Column(Enum(AccountType), nullable=False)
     balance = Column(Numeric(15, 2), default=0.00)
     daily_limit = Column(Numeric(10, 2), default=50000.00)
+    stripe_count = Column(Integer, default=0)  # > 0 when the balance lives in account_balance_stripes
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -79,8 +131,25 @@ class Account(Base):
     transactions_from = relationship("Transaction", foreign_keys="Transaction.from_account_id")
     transactions_to = relationship("Transaction", foreign_keys="Transaction.to_account_id")
 
+class AccountBalanceStripe(Base):
+    # Sub-balances of a hot account; the account's balance is the sum of its stripes
+    __tablename__ = "account_balance_stripes"
+    __table_args__ = (UniqueConstraint("account_id", "stripe"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False, index=True)
+    stripe = Column(Integer, nullable=False)
+    balance = Column(Numeric(15, 2), default=0.00, nullable=False)
+
 class Transaction(Base):
     __tablename__ = "transactions"
+    # An account's newest transactions, per side, without scanning the ledger
+    __table_args__ = (
+        Index("ix_transactions_from_account_created", "from_account_id", "created_at"),
+        Index("ix_transactions_to_account_created", "to_account_id", "created_at"),
+        # Month ranges for the archiver
+        Index("ix_transactions_created_at", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     transaction_id = Column(String(50), unique=True, index=True, nullable=False)
@@ -101,5 +170,145 @@ class AuditLog(Base):
     resource = Column(String(100))
     ip_address = Column(String(45))
     user_agent = Column(String(500))
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     details = Column(Text)
+
+class ShardTransfer(Base):
+    # Coordinator log for cross-shard transfers, kept on shard 0
+    __tablename__ = "shard_transfers"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    transfer_id = Column(String(50), unique=True, index=True, nullable=False)
+    from_account = Column(String(20), nullable=False)
+    to_account = Column(String(20), nullable=False)
+    amount = Column(Numeric(15, 2), nullable=False)
+    description = Column(String(255))
+    user_id = Column(Integer)
+    status = Column(Enum(ShardTransferStatus), default=ShardTransferStatus.PENDING, index=True)
+    error = Column(String(255))
+    # The process driving the transfer; no other process touches it before claimed_until
+    claimed_by = Column(String(64))
+    claimed_until = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ShardTransferLeg(Base):
+    # One row per balance change applied on a shard; makes each step idempotent
+    __tablename__ = "shard_transfer_legs"
+    __table_args__ = (UniqueConstraint("transfer_id", "leg"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    transfer_id = Column(String(50), nullable=False)
+    leg = Column(String(10), nullable=False)  # debit, credit, refund
+    account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False)
+    amount = Column(Numeric(15, 2), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class QueuedTransfer(Base):
+    # Durable queue behind the asynchronous /api/transfers endpoint
+    __tablename__ = "queued_transfers"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    from_account = Column(String(20), nullable=False)
+    to_account = Column(String(20), nullable=False)
+    amount = Column(Numeric(15, 2), nullable=False)
+    description = Column(String(255))
+    status = Column(Enum(QueuedTransferStatus), default=QueuedTransferStatus.QUEUED, index=True)
+    error = Column(String(255))
+    new_balance = Column(Numeric(15, 2))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    # Worker pool processing the row, and when it last confirmed it is alive
+    claimed_by = Column(String(64))
+    heartbeat_at = Column(DateTime)
+    completed_at = Column(DateTime)
+
+class BatchCheckpoint(Base):
+    # Progress marker for resumable batch jobs; last_id is the highest finished primary key
+    __tablename__ = "batch_checkpoints"
+    __table_args__ = (UniqueConstraint("job_name", "run_key"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_name = Column(String(50), nullable=False)
+    run_key = Column(String(50), nullable=False)
+    last_id = Column(Integer, default=0, nullable=False)
+    completed_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class RevokedToken(Base):
+    # Logged-out or rotated JWTs, by their jti claim, until they would have expired anyway
+    __tablename__ = "revoked_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String(32), unique=True, nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class ArchivedPartition(Base):
+    # A month of a table moved to a compressed file; its hot rows are deleted once completed_at is set
+    __tablename__ = "archived_partitions"
+    __table_args__ = (UniqueConstraint("table_name", "month"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    table_name = Column(String(50), nullable=False)
+    month = Column(String(7), nullable=False)  # YYYY-MM
+    path = Column(String(500), nullable=False)
+    row_count = Column(Integer, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+
+class OutboxMessage(Base):
+    # A notification committed with the change that caused it; sent later by the dispatcher
+    __tablename__ = "outbox_messages"
+    __table_args__ = (Index("ix_outbox_messages_status_next_attempt", "status", "next_attempt_at"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    channel = Column(String(20), nullable=False)  # email, sms or webhook
+    event_type = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    status = Column(Enum(OutboxStatus), default=OutboxStatus.PENDING, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(String(255))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
+class StandingInstruction(Base):
+    # A recurring transfer; due_at is the occurrence being paid, next_run_at when it is next tried
+    __tablename__ = "standing_instructions"
+    __table_args__ = (Index("ix_standing_instructions_status_next_run", "status", "next_run_at"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    from_account = Column(String(20), nullable=False)
+    to_account = Column(String(20), nullable=False)
+    amount = Column(Numeric(15, 2), nullable=False)
+    description = Column(String(255))
+    frequency = Column(Enum(InstructionFrequency), nullable=False)
+    start_at = Column(DateTime, nullable=False)
+    end_at = Column(DateTime)
+    due_at = Column(DateTime, nullable=False)
+    next_run_at = Column(DateTime, nullable=False)
+    status = Column(Enum(InstructionStatus), default=InstructionStatus.ACTIVE, nullable=False)
+    retries = Column(Integer, default=0, nullable=False)  # failed tries of the current occurrence
+    runs = Column(Integer, default=0, nullable=False)
+    last_run_at = Column(DateTime)
+    last_error = Column(String(255))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AccountRollup(Base):
+    # An account's debits, credits and closing balance for one day or one month, for charts
+    __tablename__ = "account_rollups"
+    __table_args__ = (UniqueConstraint("account_id", "period", "period_start"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False)
+    period = Column(String(5), nullable=False)  # day or month
+    period_start = Column(Date, nullable=False)
+    debits = Column(Numeric(15, 2), default=0, nullable=False)
+    credits = Column(Numeric(15, 2), default=0, nullable=False)
+    transaction_count = Column(Integer, default=0, nullable=False)
+    closing_balance = Column(Numeric(15, 2))
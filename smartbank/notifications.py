@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, insert
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import OutboxMessage, OutboxStatus, User
+
+logger = logging.getLogger(__name__)
+
+# Run the dispatcher in this process; any number of processes may
+NOTIFICATION_DISPATCHER = os.environ.get("SMARTBANK_NOTIFICATION_DISPATCHER", "0") == "1"
+# Channels every notification is sent on
+NOTIFICATION_CHANNELS = [c for c in os.environ.get("SMARTBANK_NOTIFICATION_CHANNELS", "email,sms").split(",") if c]
+NOTIFICATION_BATCH_SIZE = 100
+NOTIFICATION_POLL_INTERVAL = 0.5
+NOTIFICATION_MAX_ATTEMPTS = 8
+# Retry delay doubles from the base per failed attempt, up to the cap (seconds)
+NOTIFICATION_RETRY_BASE = 5
+NOTIFICATION_RETRY_MAX = 3600
+# A claimed row that is neither sent nor rescheduled within this is claimed again
+NOTIFICATION_CLAIM_SECONDS = 300
+
+# User attribute each channel delivers to; webhook senders know their own URL
+RECIPIENT_FIELDS = {"email": "email", "sms": "phone"}
+
+def notify(db: Session, user_id, event_type, payload, channels=None):
+    """Queue one outbox row per channel in the caller's transaction.
+
+    Nothing is sent here. The rows are inserted just before the commit, in
+    one statement for the whole transaction, so they commit or roll back with
+    the change that caused them. The dispatcher picks them up afterwards.
+    """
+    channels = NOTIFICATION_CHANNELS if channels is None else channels
+    body = json.dumps(payload, default=str)
+    db.info.setdefault("pending_outbox", []).extend(
+        {"user_id": user_id, "channel": channel, "event_type": event_type, "payload": body}
+        for channel in channels
+    )
+
+@event.listens_for(Session, "before_commit")
+def _insert_pending_outbox(session):
+    rows = session.info.pop("pending_outbox", None)
+    if rows:
+        # One multi-row INSERT; the ORM would insert row by row to learn each id
+        session.execute(insert(OutboxMessage), rows)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_outbox(session):
+    session.info.pop("pending_outbox", None)
+
+def outbox_counts(db: Session):
+    counts = {status.value: 0 for status in OutboxStatus}
+    counts.update({status.value: count for status, count in db.query(
+        OutboxMessage.status, func.count(OutboxMessage.id)
+    ).group_by(OutboxMessage.status)})
+    oldest = db.query(func.min(OutboxMessage.created_at)).filter(
+        OutboxMessage.status.in_([OutboxStatus.PENDING, OutboxStatus.SENDING])
+    ).scalar()
+    return {
+        **counts,
+        "oldest_unsent_seconds": (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+    }
+
+class NotificationError(Exception):
+    pass
+
+class StubSender:
+    """Logs and keeps the last `keep` notifications instead of sending them.
+
+    The default sender for every channel. A real sender needs the same
+    `channel`, `concurrency` and `send(notification)`, raising on failure.
+    `fail_times` makes the first N sends raise, for exercising retries.
+    """
+
+    def __init__(self, channel, concurrency=4, fail_times=0, keep=1000):
+        self.channel = channel
+        self.concurrency = concurrency
+        self.fail_times = fail_times
+        self.sent = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def send(self, notification):
+        with self._lock:
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise NotificationError(f"{self.channel} stub failure")
+            self.sent.append(notification)
+        logger.info("%s to %s: %s", self.channel, notification["recipient"], notification["event_type"])
+
+def default_senders():
+    return {channel: StubSender(channel) for channel in ("email", "sms", "webhook")}
+
+class NotificationDispatcher:
+    """Sends `outbox_messages` rows through per-channel senders.
+
+    One thread claims due rows in batches with SELECT ... FOR UPDATE SKIP
+    LOCKED, so several processes can dispatch without claiming a row twice.
+    A claim is a lease: a row whose dispatcher dies mid-send is claimed again
+    after NOTIFICATION_CLAIM_SECONDS. Delivery is therefore at least once, and
+    receivers should dedupe on the notification id. Each channel has a thread
+    pool sized to its sender's concurrency, so the gateway limits hold however
+    large the batch. Failures are retried with exponential backoff and marked
+    FAILED after `max_attempts`.
+    """
+
+    def __init__(self, senders=None, session_factory=SessionLocal, batch_size=NOTIFICATION_BATCH_SIZE,
+                 poll_interval=NOTIFICATION_POLL_INTERVAL, max_attempts=NOTIFICATION_MAX_ATTEMPTS,
+                 retry_base=NOTIFICATION_RETRY_BASE, retry_max=NOTIFICATION_RETRY_MAX):
+        self.senders = senders if senders is not None else default_senders()
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._stop = threading.Event()
+        self._thread = None
+        self._pools = {}
+
+    @property
+    def running(self):
+        return self._thread is not None and not self._stop.is_set()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        for pool in self._pools.values():
+            pool.shutdown(wait=False)
+        self._pools = {}
+
+    def claim_batch(self):
+        """Lease up to `batch_size` due rows; returns them as notification dicts."""
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            rows = db.query(OutboxMessage).filter(
+                OutboxMessage.status.in_([OutboxStatus.PENDING, OutboxStatus.SENDING]),
+                OutboxMessage.next_attempt_at <= now
+            ).order_by(OutboxMessage.id).limit(self.batch_size).with_for_update(skip_locked=True).all()
+            if not rows:
+                db.commit()
+                return []
+
+            db.query(OutboxMessage).filter(OutboxMessage.id.in_([row.id for row in rows])).update({
+                OutboxMessage.status: OutboxStatus.SENDING,
+                OutboxMessage.next_attempt_at: now + timedelta(seconds=NOTIFICATION_CLAIM_SECONDS)
+            }, synchronize_session=False)
+            users = {user.id: user for user in db.query(User.id, User.email, User.phone).filter(
+                User.id.in_({row.user_id for row in rows})
+            )}
+            notifications = []
+            for row in rows:
+                field = RECIPIENT_FIELDS.get(row.channel)
+                user = users.get(row.user_id)
+                notifications.append({
+                    "id": row.id,
+                    "channel": row.channel,
+                    "event_type": row.event_type,
+                    "user_id": row.user_id,
+                    "recipient": getattr(user, field) if field and user else None,
+                    "payload": json.loads(row.payload),
+                    "attempts": row.attempts
+                })
+            db.commit()
+            return notifications
+        finally:
+            db.close()
+
+    def send_batch(self, notifications):
+        # Every channel sends in parallel, each within its sender's concurrency
+        pending = []
+        outcomes = []
+        for notification in notifications:
+            sender = self.senders.get(notification["channel"])
+            if sender is None:
+                outcomes.append((notification, f"No sender for channel {notification['channel']}"))
+            else:
+                pending.append((notification, self._pool(notification["channel"]).submit(sender.send, notification)))
+        for notification, future in pending:
+            try:
+                future.result()
+                outcomes.append((notification, None))
+            except Exception as e:
+                outcomes.append((notification, str(e) or type(e).__name__))
+        return self.record(outcomes)
+
+    def record(self, outcomes):
+        """Mark sent rows SENT and reschedule or fail the rest; returns counts."""
+        now = datetime.utcnow()
+        counts = {"sent": 0, "retrying": 0, "failed": 0}
+        db = self.session_factory()
+        try:
+            sent = [notification["id"] for notification, error in outcomes if error is None]
+            if sent:
+                db.query(OutboxMessage).filter(OutboxMessage.id.in_(sent)).update({
+                    OutboxMessage.status: OutboxStatus.SENT,
+                    OutboxMessage.sent_at: now,
+                    OutboxMessage.attempts: OutboxMessage.attempts + 1
+                }, synchronize_session=False)
+                counts["sent"] = len(sent)
+            for notification, error in outcomes:
+                if error is None:
+                    continue
+                attempts = notification["attempts"] + 1
+                values = {OutboxMessage.attempts: attempts, OutboxMessage.last_error: error[:255]}
+                if attempts >= self.max_attempts:
+                    values[OutboxMessage.status] = OutboxStatus.FAILED
+                    counts["failed"] += 1
+                    logger.warning("Notification %s failed after %s attempts: %s", notification["id"], attempts, error)
+                else:
+                    values[OutboxMessage.status] = OutboxStatus.PENDING
+                    values[OutboxMessage.next_attempt_at] = now + timedelta(seconds=self.backoff(attempts))
+                    counts["retrying"] += 1
+                db.query(OutboxMessage).filter(OutboxMessage.id == notification["id"]).update(
+                    values, synchronize_session=False
+                )
+            db.commit()
+            return counts
+        finally:
+            db.close()
+
+    def backoff(self, attempts):
+        # Jitter spreads out the retries of a batch that failed together
+        return min(self.retry_max, self.retry_base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+    def dispatch_once(self):
+        notifications = self.claim_batch()
+        if notifications:
+            self.send_batch(notifications)
+        return len(notifications)
+
+    def _pool(self, channel):
+        pool = self._pools.get(channel)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=max(1, self.senders[channel].concurrency),
+                                      thread_name_prefix=f"notify-{channel}")
+            self._pools[channel] = pool
+        return pool
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self.dispatch_once()
+            except Exception:
+                logger.exception("Notification dispatch failed")
+                claimed = 0
+            # A full batch suggests more are due; otherwise wait for new rows
+            if claimed < self.batch_size:
+                self._stop.wait(self.poll_interval)
@@ -0,0 +1,269 @@
+"""On-demand profiles of single requests, for admins chasing a slow endpoint.
+
+An admin adds `X-Profile: 1` (or `?profile=1`) to a request. That one request
+is then sampled at PROFILE_SAMPLE_HZ, and its SQL statements are timed. The
+result is stored under PROFILE_DIR, and the response carries the profile id
+in `X-Profile-Id`. Profiles are JSON. Their `folded` member is in the
+collapsed-stack format that flamegraph.pl, inferno and speedscope read.
+
+Only the event loop thread is sampled, where the async routes run, and
+only frames below the request's own middleware call count. While the request
+is suspended the sample is `(awaiting)`; that covers I/O, other requests and
+work handed to the thread pool. SQL is timed wherever it runs, since the
+profile follows the request's context into threads.
+
+Requests without the flag only pay for a header scan. The sampler thread and
+the SQL listeners exist only while a profiled request is running.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_DIR = os.environ.get("SMARTBANK_PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_HZ = int(os.environ.get("SMARTBANK_PROFILE_SAMPLE_HZ", "200"))
+PROFILE_RETENTION_HOURS = float(os.environ.get("SMARTBANK_PROFILE_RETENTION_HOURS", "24"))
+PROFILE_MAX_FILES = int(os.environ.get("SMARTBANK_PROFILE_MAX_FILES", "200"))
+# Bounds for long-running requests such as event streams
+PROFILE_MAX_SECONDS = 60
+PROFILE_MAX_QUERIES = 2000
+PROFILE_STATEMENT_CHARS = 2000
+
+# Samples taken while the request's task was not running on the event loop
+IDLE_FRAME = "(awaiting)"
+
+_current = ContextVar("smartbank_profile", default=None)
+
+class Profile:
+    """Samples of one request's stack and the SQL it ran."""
+
+    def __init__(self, method, path, sample_hz=PROFILE_SAMPLE_HZ):
+        self.profile_id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.sample_hz = sample_hz
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.status_code = None
+        self.stacks = {}
+        self.queries = []
+        self.running_query = None
+        self.marker = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self, thread_id, marker):
+        """Sample `thread_id`, keeping the frames called from `marker`."""
+        self.marker = marker
+        self._sampler = threading.Thread(target=self._sample, args=(thread_id,), name="profile-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _sample(self, thread_id):
+        interval = 1.0 / max(self.sample_hz, 1)
+        deadline = self.started + PROFILE_MAX_SECONDS
+        while not self._stop.wait(interval) and time.perf_counter() < deadline:
+            stack = self._stack(sys._current_frames().get(thread_id))
+            if not self._stop.is_set():  # else it may be a sample of stop() itself
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def _stack(self, frame):
+        names = []
+        while frame is not None and frame is not self.marker:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        if frame is None:
+            # The loop is running another task, or this one is waiting on I/O or a thread
+            return IDLE_FRAME
+        names.reverse()
+        query = self.running_query
+        if query is not None and names:
+            names.append("SQL " + " ".join(query.split())[:80])
+        return ";".join(name.replace(";", ",") for name in names) or IDLE_FRAME
+
+    def folded(self):
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(self.stacks.items()))
+
+    def as_dict(self):
+        return {
+            "profile_id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "sample_hz": self.sample_hz,
+            "samples": sum(self.stacks.values()),
+            "query_count": len(self.queries),
+            "query_ms": round(sum(query["duration_ms"] for query in self.queries), 3),
+            "queries": self.queries,
+            "folded": self.folded()
+        }
+
+# SQL timing. The listeners are installed while at least one profile runs
+# and only record statements executed in a profiled request's context.
+_listeners_lock = threading.Lock()
+_active_profiles = 0
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is not None and context is not None:
+        context._profile_started = time.perf_counter()
+        profile.running_query = statement
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = getattr(context, "_profile_started", None)
+    if profile is None or started is None:
+        return
+    profile.running_query = None
+    if len(profile.queries) < PROFILE_MAX_QUERIES:
+        profile.queries.append({
+            "statement": statement[:PROFILE_STATEMENT_CHARS],
+            "offset_ms": round((started - profile.started) * 1000, 3),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "rows": cursor.rowcount,
+            "executemany": executemany
+        })
+
+def _listen():
+    global _active_profiles
+    with _listeners_lock:
+        if _active_profiles == 0:
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _active_profiles += 1
+
+def _unlisten():
+    global _active_profiles
+    with _listeners_lock:
+        _active_profiles -= 1
+        if _active_profiles == 0:
+            event.remove(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.remove(Engine, "after_cursor_execute", _after_cursor_execute)
+
+def listening():
+    return _active_profiles > 0
+
+class ProfileStore:
+    """Profiles as JSON files, dropped after `retention_hours` or past `max_files`."""
+
+    def __init__(self, path=PROFILE_DIR, retention_hours=PROFILE_RETENTION_HOURS, max_files=PROFILE_MAX_FILES):
+        self.path = path
+        self.retention_hours = retention_hours
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def save(self, profile: Profile):
+        os.makedirs(self.path, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "w") as output:
+            json.dump(profile.as_dict(), output)
+        os.replace(temp_path, os.path.join(self.path, profile.profile_id + ".json"))
+        self.prune()
+
+    def get(self, profile_id):
+        # Ids are uuid hex; anything else could walk out of the directory
+        if len(profile_id) != 32 or not all(c in "0123456789abcdef" for c in profile_id):
+            return None
+        try:
+            with open(os.path.join(self.path, profile_id + ".json")) as source:
+                return json.load(source)
+        except FileNotFoundError:
+            return None
+
+    def list(self):
+        """Summaries of the stored profiles, newest first."""
+        summaries = []
+        for _, path in self._entries():
+            try:
+                with open(path) as source:
+                    profile = json.load(source)
+            except (FileNotFoundError, ValueError):
+                continue
+            profile.pop("queries")
+            profile.pop("folded")
+            summaries.append(profile)
+        return summaries
+
+    def prune(self):
+        cutoff = time.time() - self.retention_hours * 3600
+        with self._lock:
+            for index, (modified, path) in enumerate(self._entries()):
+                if index >= self.max_files or modified < cutoff:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def _entries(self):
+        try:
+            with os.scandir(self.path) as scan:
+                entries = [(entry.stat().st_mtime, entry.path) for entry in scan
+                           if entry.is_file() and entry.name.endswith(".json")]
+        except FileNotFoundError:
+            return []
+        return sorted(entries, reverse=True)
+
+profiles = ProfileStore()
+
+def wants_profile(scope):
+    for name, value in scope.get("headers", ()):
+        if name == b"x-profile":
+            return value.strip().lower() in (b"1", b"true", b"yes")
+    query = scope.get("query_string", b"")
+    if b"profile=" in query:
+        return parse_qs(query.decode("latin-1")).get("profile", [""])[-1].lower() in ("1", "true", "yes")
+    return False
+
+class ProfilingMiddleware:
+    """Profiles requests that ask for it, once `authorize(scope)` accepts the caller.
+
+    `authorize` is a coroutine returning True for admins. A flag from anyone
+    else is ignored and the request runs unprofiled.
+    """
+
+    def __init__(self, app, authorize):
+        self.app = app
+        self.authorize = authorize
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not wants_profile(scope) or not await self.authorize(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"])
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile.profile_id.encode())]
+            await send(message)
+
+        token = _current.set(profile)
+        _listen()
+        # This coroutine's frame is on the loop thread's stack whenever the request is running
+        profile.start(threading.get_ident(), sys._getframe())
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.stop()
+            _unlisten()
+            _current.reset(token)
+            profiles.save(profile)
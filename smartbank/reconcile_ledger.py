@@ -0,0 +1,175 @@
+"""Nightly proof that every balance equals the sum of its ledger postings.
+
+    python reconcile_ledger.py [--chunk-size 500000] [--report mismatches.csv]
+
+For each account, balance (plus any balance stripes) must equal completed
+credits minus completed debits in `transactions` and its archived months,
+plus the legs of cross-shard transfers applied on this database. Postings are streamed in primary-key
+chunks and summed per account id with NumPy in integer paise, so memory is
+bounded by the number of accounts, not the number of transactions. Every read
+happens inside one transaction, so balances and postings come from the same
+snapshot. Exits with status 1 when anything does not match.
+"""
+import argparse
+import csv
+import sys
+import time
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import BigInteger, cast, create_engine, func, select
+
+from database import SQLALCHEMY_DATABASE_URL
+from models import Account, AccountBalanceStripe, ArchivedPartition, ShardTransferLeg, Transaction
+import archive
+
+# Legs of cross-shard transfers: a debit takes money out, credits and refunds put it in
+LEG_SIGNS = {"debit": -1, "credit": 1, "refund": 1}
+
+def paise(column):
+    # Money leaves the database as an exact integer number of paise
+    return cast(func.round(column * 100), BigInteger)
+
+class Ledger:
+    """Per-account running totals indexed by account id."""
+
+    def __init__(self, size):
+        self.net = np.zeros(size, dtype=np.int64)
+        self.postings = np.zeros(size, dtype=np.int64)
+
+    def grow(self, max_id):
+        if max_id >= len(self.net):
+            extra = max_id + 1 - len(self.net)
+            self.net = np.concatenate([self.net, np.zeros(extra, dtype=np.int64)])
+            self.postings = np.concatenate([self.postings, np.zeros(extra, dtype=np.int64)])
+
+    def post(self, account_ids, amounts):
+        # Id 0 stands for "no account" (deposits have no sender) and is ignored
+        self.grow(int(account_ids.max(initial=0)))
+        np.add.at(self.net, account_ids, amounts)
+        self.postings += np.bincount(account_ids, minlength=len(self.postings))
+
+def stream(conn, statement, key, chunk_size):
+    # Keyset pagination on the primary key; yields one int64 array per chunk
+    last_id = 0
+    while True:
+        rows = conn.execute(statement.where(key > last_id).order_by(key).limit(chunk_size)).all()
+        if not rows:
+            return
+        # Flatten the rows straight into an int64 buffer; np.array(rows) is much slower
+        width = len(rows[0])
+        chunk = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * width).reshape(-1, width)
+        last_id = int(chunk[-1, 0])
+        yield chunk
+
+def reconcile(engine, chunk_size=500_000, log=print):
+    started = time.monotonic()
+    with engine.connect() as conn:
+        if conn.dialect.name == "mysql":
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin():
+            max_id = conn.execute(select(func.max(Account.id))).scalar() or 0
+            balances = np.zeros(max_id + 1, dtype=np.int64)
+            exists = np.zeros(max_id + 1, dtype=bool)
+            for chunk in stream(conn, select(Account.id, paise(func.coalesce(Account.balance, 0))), Account.id, chunk_size):
+                balances[chunk[:, 0]] = chunk[:, 1]
+                exists[chunk[:, 0]] = True
+            for account_id, total in conn.execute(
+                select(AccountBalanceStripe.account_id, paise(func.sum(AccountBalanceStripe.balance)))
+                .group_by(AccountBalanceStripe.account_id)
+            ):
+                balances[account_id] += total
+
+            ledger = Ledger(max_id + 1)
+            transactions = 0
+            # Archived months are whole; rows of those months still in the hot
+            # table (an archive run mid-delete) are skipped below
+            boundary = None
+            for month, path in conn.execute(
+                select(ArchivedPartition.month, ArchivedPartition.path)
+                .where(ArchivedPartition.table_name == "transactions")
+                .order_by(ArchivedPartition.month)
+            ):
+                arrays = archive.read_partition(path, ("from_account_id", "to_account_id", "amount", "status"))
+                completed = arrays["status"] == b"completed"
+                ledger.post(arrays["from_account_id"][completed], -arrays["amount"][completed])
+                ledger.post(arrays["to_account_id"][completed], arrays["amount"][completed])
+                transactions += int(completed.sum())
+                boundary = archive.add_months(archive.parse_month(month), 1)
+                log(f"{transactions} postings summed (archive through {month})")
+
+            statement = select(
+                Transaction.id,
+                func.coalesce(Transaction.from_account_id, 0),
+                func.coalesce(Transaction.to_account_id, 0),
+                paise(Transaction.amount)
+            ).where(Transaction.status == "completed")
+            if boundary is not None:
+                statement = statement.where(Transaction.created_at >= boundary)
+            for chunk in stream(conn, statement, Transaction.id, chunk_size):
+                ledger.post(chunk[:, 1], -chunk[:, 3])
+                ledger.post(chunk[:, 2], chunk[:, 3])
+                transactions += len(chunk)
+                elapsed = max(time.monotonic() - started, 1e-9)
+                log(f"{transactions} postings summed ({transactions / elapsed:.0f} rows/s)")
+
+            for leg, sign in LEG_SIGNS.items():
+                for chunk in stream(conn, select(ShardTransferLeg.id, ShardTransferLeg.account_id, paise(ShardTransferLeg.amount))
+                                    .where(ShardTransferLeg.leg == leg), ShardTransferLeg.id, chunk_size):
+                    ledger.post(chunk[:, 1], sign * chunk[:, 2])
+
+            ledger.grow(max_id)
+            ledger.net[0] = 0
+            difference = balances - ledger.net[:max_id + 1]
+            mismatched = np.flatnonzero(exists & (difference != 0))
+            # Postings against ids that are not in `accounts` at all
+            known = np.zeros(len(ledger.postings), dtype=bool)
+            known[:max_id + 1] = exists
+            known[0] = True
+            orphaned = np.flatnonzero((ledger.postings > 0) & ~known)
+
+            numbers = {}
+            for offset in range(0, len(mismatched), 1000):
+                ids = mismatched[offset:offset + 1000].tolist()
+                numbers.update(conn.execute(select(Account.id, Account.account_number).where(Account.id.in_(ids))).all())
+
+    mismatches = [
+        {
+            "account_id": int(account_id),
+            "account_number": numbers.get(int(account_id)),
+            "balance": int(balances[account_id]) / 100,
+            "ledger": int(ledger.net[account_id]) / 100,
+            "difference": int(difference[account_id]) / 100,
+            "postings": int(ledger.postings[account_id])
+        }
+        for account_id in mismatched
+    ]
+    return {
+        "accounts": int(exists.sum()),
+        "transactions": transactions,
+        "mismatches": mismatches,
+        "orphaned_account_ids": [int(account_id) for account_id in orphaned],
+        "seconds": time.monotonic() - started
+    }
+
+def write_report(path, mismatches):
+    with open(path, "w", newline="", encoding="utf-8") as report:
+        writer = csv.DictWriter(report, fieldnames=["account_id", "account_number", "balance", "ledger", "difference", "postings"])
+        writer.writeheader()
+        writer.writerows(mismatches)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile account balances against the transaction ledger")
+    parser.add_argument("--url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--chunk-size", type=int, default=500_000, help="Transactions fetched per query")
+    parser.add_argument("--report", default="mismatches.csv", help="Where to write mismatched accounts")
+    args = parser.parse_args()
+
+    result = reconcile(create_engine(args.url), chunk_size=args.chunk_size)
+    write_report(args.report, result["mismatches"])
+    print(f"{result['accounts']} accounts, {result['transactions']} transactions in {result['seconds']:.1f}s")
+    if result["orphaned_account_ids"]:
+        print(f"Postings reference {len(result['orphaned_account_ids'])} missing accounts: {result['orphaned_account_ids'][:20]}")
+    if result["mismatches"]:
+        print(f"{len(result['mismatches'])} accounts do not match their ledger, see {args.report}")
+    sys.exit(1 if result["mismatches"] or result["orphaned_account_ids"] else 0)
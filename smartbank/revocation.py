@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+
+from models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+# Expected live revocations per process; past this the filter is rebuilt larger
+REVOCATION_CAPACITY = int(os.environ.get("SMARTBANK_REVOCATION_CAPACITY", "100000"))
+REVOCATION_FALSE_POSITIVE_RATE = 0.001
+# How stale another worker's view of the revocation table may be
+REVOCATION_SYNC_SECONDS = float(os.environ.get("SMARTBANK_REVOCATION_SYNC_SECONDS", "2"))
+# Each sync rereads this far behind the last one, to cover commits that land
+# after their revoked_at and clock skew between hosts
+REVOCATION_SYNC_OVERLAP_SECONDS = float(os.environ.get("SMARTBANK_REVOCATION_SYNC_OVERLAP_SECONDS", "60"))
+# How often a worker deletes rows for tokens past their expiry; stream
+# tickets add a row each, so the table grows between restarts without it
+REVOCATION_PURGE_SECONDS = float(os.environ.get("SMARTBANK_REVOCATION_PURGE_SECONDS", "3600"))
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings; no false negatives."""
+
+    def __init__(self, capacity, false_positive_rate=REVOCATION_FALSE_POSITIVE_RATE):
+        self.capacity = max(capacity, 1)
+        self.size = max(8, int(-self.capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        if key in self:
+            # Already there (or a false positive); keeps count close to distinct keys
+            return
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class RevocationList:
+    """Revoked token ids, checked against a Bloom filter before the database.
+
+    A miss in the filter means the token is live, so the usual request never
+    touches `revoked_tokens`. A hit is confirmed with a primary-key lookup.
+    Every REVOCATION_SYNC_SECONDS the filter pulls in rows revoked since the
+    last sync, which is how other worker processes' revocations arrive. The
+    window is by revoked_at, reaching REVOCATION_SYNC_OVERLAP_SECONDS back. It
+    is not by id, because ids become visible in commit order, not id order,
+    and a watermark on them can step over a row that commits late.
+    When it fills up it is rebuilt from the unexpired rows only. Every
+    REVOCATION_PURGE_SECONDS a sync also deletes the expired rows.
+    """
+
+    def __init__(self, capacity=REVOCATION_CAPACITY, sync_seconds=REVOCATION_SYNC_SECONDS,
+                 purge_seconds=REVOCATION_PURGE_SECONDS):
+        self.capacity = capacity
+        self.sync_seconds = sync_seconds
+        self.purge_seconds = purge_seconds
+        self._filter = BloomFilter(capacity)
+        self._synced_through = None
+        self._synced_at = None
+        self._purged_at = None
+        self._lock = threading.Lock()
+
+    def sync(self, db: Session, rebuild=False):
+        with self._lock:
+            if self._purged_at is None or time.monotonic() - self._purged_at >= self.purge_seconds:
+                self._purged_at = time.monotonic()
+                # Its own session: `db` may be a request's, with work of its own to commit
+                purge_db = Session(bind=db.get_bind())
+                try:
+                    purge_expired(purge_db)
+                except Exception:
+                    logger.exception("Purging expired revocations failed")
+                finally:
+                    purge_db.close()
+            now = datetime.utcnow()
+            query = db.query(RevokedToken.jti).filter(RevokedToken.expires_at > now)
+            if rebuild or self._filter.count >= self._filter.capacity:
+                live = query.count()
+                self._filter = BloomFilter(max(self.capacity, 2 * live))
+                self._synced_through = None
+            if self._synced_through is not None:
+                query = query.filter(
+                    RevokedToken.revoked_at >= self._synced_through - timedelta(seconds=REVOCATION_SYNC_OVERLAP_SECONDS)
+                )
+            for (jti,) in query:
+                self._filter.add(jti)
+            self._synced_through = now
+            self._synced_at = time.monotonic()
+
+    def is_revoked(self, db: Session, jti):
+        if self._synced_at is None or time.monotonic() - self._synced_at >= self.sync_seconds:
+            self.sync(db)
+        if jti not in self._filter:
+            return False
+        return db.query(RevokedToken.id).filter(RevokedToken.jti == jti).first() is not None
+
+    def revoke(self, db: Session, jti, user_id, expires_at):
+        """Record a revocation and commit; False if `jti` was already revoked.
+
+        The insert skips an existing row instead of failing, so of two
+        requests revoking the same token exactly one gets True.
+        """
+        table = RevokedToken.__table__
+        values = {"jti": jti, "user_id": user_id, "expires_at": expires_at, "revoked_at": datetime.utcnow()}
+        if db.get_bind().dialect.name == "mysql":
+            statement = insert(table).prefix_with("IGNORE").values(**values)
+        else:
+            statement = sqlite.insert(table).on_conflict_do_nothing(index_elements=["jti"]).values(**values)
+        inserted = db.execute(statement).rowcount == 1
+        db.commit()
+        with self._lock:
+            self._filter.add(jti)
+        return inserted
+
+def purge_expired(db: Session):
+    # Expired tokens are rejected by their exp claim, so their rows can go
+    deleted = db.query(RevokedToken).filter(RevokedToken.expires_at <= datetime.utcnow()).delete()
+    db.commit()
+    return deleted
+
+revocations = RevocationList()
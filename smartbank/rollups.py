@@ -0,0 +1,265 @@
+"""Per-account daily and monthly rollups behind the balance and spend charts.
+
+    python rollups.py [--days 35] [--chunk-size 1000]
+
+Each `account_rollups` row holds one account's debits, credits, transaction
+count and closing balance for a day or a month. Transfers, standing
+instructions and account opening add to the current day and month rows in
+the same transaction, with one multi-row upsert at commit. History requests
+then read one row per point (a few for weeks) instead of the ledger.
+
+The command rebuilds the rows from the ledger for the last `--days` days.
+Closing balances are worked backwards from the current balance. Run it
+after interest accrual and other bulk jobs that post ledger rows directly,
+and to pick up striped accounts. Their live credits skip the rollups so the
+rollup row does not become the hot row striping removed. Rebuilds are
+idempotent, and safe alongside live traffic. Each chunk locks its accounts
+before reading the ledger. Live writers hold those locks when their rollups
+are upserted, so each one either lands in the rebuilt totals or waits and
+adds to them.
+"""
+import argparse
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import and_, delete, event, func, insert, or_
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Account, AccountRollup, Transaction
+import archive
+import striping
+
+GRANULARITIES = ("day", "week", "month")
+# Points per history request when no start date is given
+DEFAULT_POINTS = {"day": 30, "week": 26, "month": 12}
+HISTORY_MAX_POINTS = 400
+
+def month_start(day):
+    return day.replace(day=1)
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+def bucket_start(day, granularity):
+    if granularity == "month":
+        return month_start(day)
+    if granularity == "week":
+        return week_start(day)
+    return day
+
+def next_bucket(start, granularity):
+    if granularity == "month":
+        return (start.replace(year=start.year + 1, month=1) if start.month == 12
+                else start.replace(month=start.month + 1))
+    return start + timedelta(days=7 if granularity == "week" else 1)
+
+def record(db: Session, account_id, debits=0, credits=0, closing_balance=None, count=1, on=None):
+    """Add a balance change to `account_id`'s rollups when the session commits."""
+    day = (on or datetime.utcnow()).date()
+    pending = db.info.setdefault("pending_rollups", {})
+    for period, start in (("day", day), ("month", month_start(day))):
+        row = pending.setdefault((account_id, period, start), {
+            "account_id": account_id, "period": period, "period_start": start,
+            "debits": Decimal("0"), "credits": Decimal("0"), "transaction_count": 0, "closing_balance": None
+        })
+        row["debits"] += Decimal(debits)
+        row["credits"] += Decimal(credits)
+        row["transaction_count"] += count
+        if closing_balance is not None:
+            row["closing_balance"] = closing_balance
+
+def upsert(db: Session, rows):
+    # Adds to existing rows; a closing balance replaces the old one
+    table = AccountRollup.__table__
+    if db.get_bind().dialect.name == "mysql":
+        statement = mysql.insert(table).values(rows)
+        new = statement.inserted
+        merge = statement.on_duplicate_key_update
+    else:
+        statement = sqlite.insert(table).values(rows)
+        new = statement.excluded
+        merge = lambda **values: statement.on_conflict_do_update(
+            index_elements=["account_id", "period", "period_start"], set_=values
+        )
+    db.execute(merge(
+        debits=table.c.debits + new.debits,
+        credits=table.c.credits + new.credits,
+        transaction_count=table.c.transaction_count + new.transaction_count,
+        closing_balance=func.coalesce(new.closing_balance, table.c.closing_balance)
+    ))
+
+@event.listens_for(Session, "before_commit")
+def _upsert_pending_rollups(session):
+    rows = session.info.pop("pending_rollups", None)
+    if rows:
+        # Sorted so concurrent commits take the row locks in the same order
+        upsert(session, [rows[key] for key in sorted(rows)])
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_rollups(session):
+    session.info.pop("pending_rollups", None)
+
+def history(db: Session, account: Account, granularity, start=None, end=None, today=None):
+    """Points from `start` to `end` (dates, inclusive), one per day, week or month.
+
+    Reads day rows for day and week points and month rows for month points,
+    so the work is proportional to the number of points. A point's closing
+    balance carries forward over periods without activity; it is None
+    before the account's first rollup.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularity must be one of {', '.join(GRANULARITIES)}")
+    end = end or today or datetime.utcnow().date()
+    first = bucket_start(end, granularity)
+    if start is None:
+        for _ in range(DEFAULT_POINTS[granularity] - 1):
+            first = bucket_start(first - timedelta(days=1), granularity)
+    else:
+        first = bucket_start(start, granularity)
+    if first > end:
+        raise ValueError("start must not be after end")
+    buckets = [first]
+    while next_bucket(buckets[-1], granularity) <= end:
+        buckets.append(next_bucket(buckets[-1], granularity))
+        if len(buckets) > HISTORY_MAX_POINTS:
+            raise ValueError(f"History covers at most {HISTORY_MAX_POINTS} points")
+
+    period = "month" if granularity == "month" else "day"
+    rows = db.query(AccountRollup).filter(
+        AccountRollup.account_id == account.id,
+        AccountRollup.period == period,
+        AccountRollup.period_start >= first,
+        AccountRollup.period_start <= end
+    ).order_by(AccountRollup.period_start).all()
+    closing = db.query(AccountRollup.closing_balance).filter(
+        AccountRollup.account_id == account.id,
+        AccountRollup.period == period,
+        AccountRollup.period_start < first,
+        AccountRollup.closing_balance != None
+    ).order_by(AccountRollup.period_start.desc()).limit(1).scalar()
+
+    points = {bucket: {"debits": Decimal("0"), "credits": Decimal("0"), "transaction_count": 0, "closing_balance": None}
+              for bucket in buckets}
+    for row in rows:
+        point = points[bucket_start(row.period_start, granularity)]
+        point["debits"] += row.debits
+        point["credits"] += row.credits
+        point["transaction_count"] += row.transaction_count
+        if row.closing_balance is not None:
+            point["closing_balance"] = row.closing_balance
+
+    result = []
+    for bucket in buckets:
+        point = points[bucket]
+        closing = point["closing_balance"] if point["closing_balance"] is not None else closing
+        result.append({
+            "period_start": bucket,
+            "debits": float(point["debits"]),
+            "credits": float(point["credits"]),
+            "transaction_count": point["transaction_count"],
+            "closing_balance": float(closing) if closing is not None else None
+        })
+    return result
+
+def as_date(value):
+    # func.date gives a date on MySQL and an ISO string on SQLite
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+def backfill(session_factory=SessionLocal, days=35, chunk_size=1000, log=print, today=None):
+    """Rebuild day and month rows from the ledger for the last `days` days; returns rows written."""
+    today = today or datetime.utcnow().date()
+    since = today - timedelta(days=days - 1)
+    db = session_factory()
+    try:
+        boundary = archive.archive_boundary(db, "transactions")
+        if boundary is not None and since < boundary.date():
+            # Archived months are no longer in the ledger; their rollups are kept as they are
+            since = boundary.date()
+            log(f"Archived months are kept; rebuilding from {since}")
+        since_at = datetime.combine(since, datetime.min.time())
+        first_month = month_start(since)
+
+        low = db.query(func.min(Account.id)).scalar() or 0
+        max_id = db.query(func.max(Account.id)).scalar() or 0
+        # Each chunk's reads must start after its locks are taken, not here
+        db.commit()
+        written = 0
+        while low <= max_id:
+            high = low + chunk_size
+            # The range lock also holds off accounts opened into the chunk
+            accounts = db.query(Account.id, Account.balance, Account.stripe_count).filter(
+                Account.id >= low, Account.id < high
+            ).order_by(Account.id).with_for_update().all()
+            flows = defaultdict(lambda: [Decimal("0"), Decimal("0"), 0])  # debits, credits, count
+            for side, column in ((0, Transaction.from_account_id), (1, Transaction.to_account_id)):
+                day = func.date(Transaction.created_at)
+                for account_id, posted_on, total, count in db.query(
+                    column, day, func.sum(Transaction.amount), func.count(Transaction.id)
+                ).filter(
+                    column >= low, column < high,
+                    Transaction.created_at >= since_at,
+                    Transaction.status == "completed"
+                ).group_by(column, day):
+                    flow = flows[(account_id, as_date(posted_on))]
+                    flow[side] += Decimal(total)
+                    flow[2] += count
+
+            striped = striping.striped_balances(db, [a.id for a in accounts if a.stripe_count])
+            account_days = defaultdict(list)
+            for account_id, posted_on in flows:
+                account_days[account_id].append(posted_on)
+
+            day_rows = []
+            for account in accounts:
+                # Walk back from today's balance, undoing one day's net flow at a time
+                closing = Decimal(account.balance or 0) + striped.get(account.id, Decimal("0"))
+                for posted_on in sorted(account_days.get(account.id, ()), reverse=True):
+                    debits, credits, count = flows[(account.id, posted_on)]
+                    day_rows.append({
+                        "account_id": account.id, "period": "day", "period_start": posted_on,
+                        "debits": debits, "credits": credits, "transaction_count": count, "closing_balance": closing
+                    })
+                    closing -= credits - debits
+
+            db.execute(delete(AccountRollup).where(
+                AccountRollup.account_id >= low, AccountRollup.account_id < high,
+                or_(and_(AccountRollup.period == "day", AccountRollup.period_start >= since),
+                    and_(AccountRollup.period == "month", AccountRollup.period_start >= first_month))
+            ))
+            if day_rows:
+                db.execute(insert(AccountRollup), day_rows)
+
+            # Months from their day rows, including days before `since` kept from earlier runs
+            months = {}
+            for row in db.query(AccountRollup).filter(
+                AccountRollup.account_id >= low, AccountRollup.account_id < high,
+                AccountRollup.period == "day", AccountRollup.period_start >= first_month
+            ).order_by(AccountRollup.account_id, AccountRollup.period_start):
+                month = months.setdefault((row.account_id, month_start(row.period_start)), {
+                    "account_id": row.account_id, "period": "month", "period_start": month_start(row.period_start),
+                    "debits": Decimal("0"), "credits": Decimal("0"), "transaction_count": 0, "closing_balance": None
+                })
+                month["debits"] += row.debits
+                month["credits"] += row.credits
+                month["transaction_count"] += row.transaction_count
+                if row.closing_balance is not None:
+                    month["closing_balance"] = row.closing_balance
+            if months:
+                db.execute(insert(AccountRollup), list(months.values()))
+            db.commit()
+            written += len(day_rows) + len(months)
+            log(f"Accounts < {high}: {written} rollup rows written")
+            low = high
+        return written
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild account rollups from the ledger")
+    parser.add_argument("--days", type=int, default=35, help="Days back from today to rebuild")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Account ids per transaction")
+    args = parser.parse_args()
+    backfill(days=args.days, chunk_size=args.chunk_size)
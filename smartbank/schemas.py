@@ -66,6 +66,17 @@ class UserResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class UserSearchResult(BaseModel):
+    user: UserResponse
+    score: float
+
+class UserSearchResponse(BaseModel):
+    query: str
+    page: int
+    page_size: int
+    has_more: bool
+    results: List[UserSearchResult]
+
 class KYCDocumentResponse(BaseModel):
     id: int
     document_type: str
@@ -76,6 +87,37 @@ class KYCDocumentResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class DashboardAccount(BaseModel):
+    id: int
+    account_number: str
+    account_type: str
+    balance: float
+    daily_limit: float
+    is_active: bool
+
+class DashboardTransaction(BaseModel):
+    transaction_id: str
+    transaction_type: str
+    direction: str  # debit, credit or internal, from the user's side
+    from_account: Optional[str] = None
+    to_account: Optional[str] = None
+    amount: float
+    description: Optional[str] = None
+    status: str
+    created_at: datetime
+
+class KYCSummary(BaseModel):
+    status: str  # not_started, pending, approved, rejected
+    documents: List[KYCDocumentResponse]
+
+class DashboardResponse(BaseModel):
+    profile: UserResponse
+    accounts: List[DashboardAccount]
+    total_balance: float
+    recent_transactions: List[DashboardTransaction]
+    transactions_today: int
+    kyc: KYCSummary
+
 class UserLogin(BaseModel):
     email: str
     password: str
@@ -83,6 +125,13 @@ class UserLogin(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
 
 class TokenData(BaseModel):
     email: Optional[str] = None
@@ -0,0 +1,366 @@
+import logging
+import os
+import random
+import socket
+import sys
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import create_engine, or_
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Account, ShardTransfer, ShardTransferLeg, ShardTransferStatus, Transaction, TransactionType
+from transfers import TransferError
+import versions
+from versions import accounts_key
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated list of shard database URLs, e.g.
+# SMARTBANK_SHARD_URLS="sqlite:///./shard0.db,sqlite:///./shard1.db"
+SHARD_DATABASE_URLS = [url for url in os.environ.get("SMARTBANK_SHARD_URLS", "").split(",") if url]
+
+# Transfers younger than this are assumed to still be in flight during recovery
+RECOVERY_GRACE_PERIOD = timedelta(seconds=30)
+# How long a claim on a transfer keeps other processes from driving it
+RECOVERY_LEASE = timedelta(minutes=5)
+
+class ShardTransferError(TransferError):
+    pass
+
+class ShardedSessionFactory:
+    """Routes sessions to one of N databases holding `accounts` and their ledgers.
+
+    Users are placed by `user_id % N` and their account numbers are generated so
+    that hashing the account number lands on the same shard, so either key can
+    be used to route. Shard 0 additionally hosts the cross-shard coordinator log.
+    """
+
+    def __init__(self, urls):
+        if not urls:
+            raise ValueError("At least one shard URL is required")
+        self.engines = []
+        for url in urls:
+            connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+            self.engines.append(create_engine(url, connect_args=connect_args))
+        self.sessionmakers = [
+            sessionmaker(autocommit=False, autoflush=False, bind=engine)
+            for engine in self.engines
+        ]
+        self.process_id = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    @property
+    def shard_count(self):
+        return len(self.engines)
+
+    def create_all(self):
+        for engine in self.engines:
+            Base.metadata.create_all(bind=engine)
+
+    def shard_for_user(self, user_id):
+        return user_id % self.shard_count
+
+    def shard_for_account(self, account_number):
+        return zlib.crc32(account_number.encode()) % self.shard_count
+
+    def session(self, shard):
+        return self.sessionmakers[shard]()
+
+    def session_for_user(self, user_id):
+        return self.session(self.shard_for_user(user_id))
+
+    def session_for_account(self, account_number):
+        return self.session(self.shard_for_account(account_number))
+
+    def coordinator_session(self):
+        return self.session(0)
+
+    def get_db(self, shard):
+        # FastAPI dependency equivalent of database.get_db for a single shard
+        db = self.session(shard)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def new_account_number(self, user_id):
+        # Draw numbers until one hashes onto the user's shard (N tries on average)
+        shard = self.shard_for_user(user_id)
+        while True:
+            account_number = f"SB{random.randint(100000000000, 999999999999)}"
+            if self.shard_for_account(account_number) == shard:
+                return account_number
+
+    # Transfers
+
+    def transfer(self, from_account, to_account, amount, description="", user_id=None):
+        amount = Decimal(str(amount)).quantize(Decimal("0.01"))
+        if amount <= 0:
+            raise ShardTransferError(400, "Amount must be greater than 0")
+
+        if self.shard_for_account(from_account) == self.shard_for_account(to_account):
+            return self._local_transfer(from_account, to_account, amount, user_id, description)
+
+        # Record the intent durably before touching any balance
+        transfer_id = f"XS{uuid.uuid4().hex}"
+        coordinator = self.coordinator_session()
+        try:
+            coordinator.add(ShardTransfer(
+                transfer_id=transfer_id,
+                from_account=from_account,
+                to_account=to_account,
+                amount=amount,
+                description=description,
+                user_id=user_id,
+                status=ShardTransferStatus.PENDING,
+                claimed_by=self.process_id,
+                claimed_until=datetime.utcnow() + RECOVERY_LEASE
+            ))
+            coordinator.commit()
+        finally:
+            coordinator.close()
+
+        return self._drive(transfer_id)
+
+    def recover_in_doubt_transfers(self, grace_period=RECOVERY_GRACE_PERIOD):
+        """Finish or roll back cross-shard transfers interrupted by a crash.
+
+        Every worker runs this at startup. Each transfer is claimed first, so
+        only one process drives it. A transfer that fails with an unexpected
+        error is logged and counted as "error", and it keeps its claim until
+        the lease runs out. The other transfers are still recovered.
+        """
+        cutoff = datetime.utcnow() - grace_period
+        coordinator = self.coordinator_session()
+        try:
+            transfer_ids = [row.transfer_id for row in coordinator.query(ShardTransfer.transfer_id).filter(
+                ShardTransfer.status.in_([ShardTransferStatus.PENDING, ShardTransferStatus.DEBITED]),
+                ShardTransfer.updated_at <= cutoff
+            ).order_by(ShardTransfer.id).all()]
+        finally:
+            coordinator.close()
+
+        outcomes = {}
+        for transfer_id in transfer_ids:
+            try:
+                if not self._claim(transfer_id, cutoff):
+                    continue
+                record = self._drive(transfer_id, recovering=True)
+                status = record["status"]
+            except ShardTransferError:
+                status = ShardTransferStatus.FAILED.value
+            except Exception:
+                logger.exception("Recovery of cross-shard transfer %s failed", transfer_id)
+                status = "error"
+            outcomes[status] = outcomes.get(status, 0) + 1
+        return outcomes
+
+    def _claim(self, transfer_id, cutoff):
+        # One conditional UPDATE: of several recovering processes, exactly one matches
+        now = datetime.utcnow()
+        coordinator = self.coordinator_session()
+        try:
+            claimed = coordinator.query(ShardTransfer).filter(
+                ShardTransfer.transfer_id == transfer_id,
+                ShardTransfer.status.in_([ShardTransferStatus.PENDING, ShardTransferStatus.DEBITED]),
+                ShardTransfer.updated_at <= cutoff,
+                or_(ShardTransfer.claimed_until.is_(None), ShardTransfer.claimed_until < now)
+            ).update({
+                ShardTransfer.claimed_by: self.process_id,
+                ShardTransfer.claimed_until: now + RECOVERY_LEASE
+            }, synchronize_session=False)
+            coordinator.commit()
+            return claimed == 1
+        finally:
+            coordinator.close()
+
+    def _drive(self, transfer_id, recovering=False):
+        # Advance a transfer through PENDING -> DEBITED -> COMPLETED. Every step
+        # checks its leg row first, so re-running after a crash is safe.
+        transfer = self._load_transfer(transfer_id)
+
+        if transfer.status == ShardTransferStatus.PENDING:
+            if recovering:
+                # Only a debit that actually committed may be carried forward
+                debited = self._has_leg(transfer.from_account, transfer_id, "debit")
+                if not debited:
+                    self._set_status(transfer_id, ShardTransferStatus.FAILED, "Abandoned before debit")
+                    raise ShardTransferError(409, "Transfer abandoned before debit")
+            else:
+                try:
+                    self._apply_debit(transfer)
+                except ShardTransferError as e:
+                    self._set_status(transfer_id, ShardTransferStatus.FAILED, e.detail)
+                    raise
+            self._set_status(transfer_id, ShardTransferStatus.DEBITED)
+            transfer.status = ShardTransferStatus.DEBITED
+
+        if transfer.status == ShardTransferStatus.DEBITED:
+            try:
+                self._apply_leg(transfer.to_account, transfer_id, "credit", transfer.amount)
+                self._set_status(transfer_id, ShardTransferStatus.COMPLETED)
+                transfer.status = ShardTransferStatus.COMPLETED
+            except ShardTransferError as e:
+                # Saga compensation: give the money back to the sender
+                self._apply_leg(transfer.from_account, transfer_id, "refund", transfer.amount)
+                self._set_status(transfer_id, ShardTransferStatus.COMPENSATED, e.detail)
+                transfer.status = ShardTransferStatus.COMPENSATED
+
+        return {
+            "transfer_id": transfer_id,
+            "status": transfer.status.value,
+            "amount": float(transfer.amount),
+            "from_account": transfer.from_account,
+            "to_account": transfer.to_account
+        }
+
+    def _local_transfer(self, from_account, to_account, amount, user_id, description=""):
+        db = self.session_for_account(from_account)
+        try:
+            sender = self._lock_account(db, from_account, user_id)
+            if sender is None:
+                raise ShardTransferError(404, "Sender account not found")
+            receiver = self._lock_account(db, to_account)
+            if receiver is None:
+                raise ShardTransferError(404, "Receiver account not found")
+            if sender.balance < amount:
+                raise ShardTransferError(400, "Insufficient funds")
+
+            sender.balance -= amount
+            receiver.balance += amount
+            db.add(Transaction(
+                transaction_id=f"TXN{uuid.uuid4().hex}",
+                from_account_id=sender.id,
+                to_account_id=receiver.id,
+                amount=amount,
+                transaction_type=TransactionType.TRANSFER,
+                description=description
+            ))
+            versions.bump_after_commit(db, accounts_key(sender.user_id), accounts_key(receiver.user_id))
+            db.commit()
+            return {
+                "transfer_id": None,
+                "status": ShardTransferStatus.COMPLETED.value,
+                "amount": float(amount),
+                "from_account": from_account,
+                "to_account": to_account
+            }
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _apply_debit(self, transfer):
+        db = self.session_for_account(transfer.from_account)
+        try:
+            if self._find_leg(db, transfer.transfer_id, "debit"):
+                return
+            sender = self._lock_account(db, transfer.from_account, transfer.user_id)
+            if sender is None:
+                raise ShardTransferError(404, "Sender account not found")
+            if sender.balance < transfer.amount:
+                raise ShardTransferError(400, "Insufficient funds")
+
+            sender.balance -= transfer.amount
+            db.add(ShardTransferLeg(
+                transfer_id=transfer.transfer_id,
+                leg="debit",
+                account_id=sender.id,
+                amount=transfer.amount
+            ))
+            versions.bump_after_commit(db, accounts_key(sender.user_id))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _apply_leg(self, account_number, transfer_id, leg, amount):
+        # Credit-style leg (credit or refund); the leg row and the balance change
+        # commit together on the owning shard
+        db = self.session_for_account(account_number)
+        try:
+            if self._find_leg(db, transfer_id, leg):
+                return
+            # A refund returns money already taken, so it goes through even if
+            # the sender was deactivated after the debit
+            account = self._lock_account(db, account_number, active_only=leg != "refund")
+            if account is None:
+                owner = "Sender" if leg == "refund" else "Receiver"
+                raise ShardTransferError(404, f"{owner} account not found")
+
+            account.balance += amount
+            db.add(ShardTransferLeg(
+                transfer_id=transfer_id,
+                leg=leg,
+                account_id=account.id,
+                amount=amount
+            ))
+            versions.bump_after_commit(db, accounts_key(account.user_id))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _lock_account(self, db, account_number, user_id=None, active_only=True):
+        query = db.query(Account).filter(Account.account_number == account_number)
+        if active_only:
+            query = query.filter(Account.is_active == True)
+        if user_id is not None:
+            query = query.filter(Account.user_id == user_id)
+        return query.with_for_update().first()
+
+    def _find_leg(self, db, transfer_id, leg):
+        return db.query(ShardTransferLeg).filter(
+            ShardTransferLeg.transfer_id == transfer_id,
+            ShardTransferLeg.leg == leg
+        ).first()
+
+    def _has_leg(self, account_number, transfer_id, leg):
+        db = self.session_for_account(account_number)
+        try:
+            return self._find_leg(db, transfer_id, leg) is not None
+        finally:
+            db.close()
+
+    def _load_transfer(self, transfer_id):
+        coordinator = self.coordinator_session()
+        try:
+            transfer = coordinator.query(ShardTransfer).filter(
+                ShardTransfer.transfer_id == transfer_id
+            ).first()
+            coordinator.expunge(transfer)
+            return transfer
+        finally:
+            coordinator.close()
+
+    def _set_status(self, transfer_id, status, error=None):
+        coordinator = self.coordinator_session()
+        try:
+            transfer = coordinator.query(ShardTransfer).filter(
+                ShardTransfer.transfer_id == transfer_id
+            ).first()
+            transfer.status = status
+            transfer.error = error
+            coordinator.commit()
+        finally:
+            coordinator.close()
+
+if __name__ == "__main__":
+    # python sharding.py [create|recover]
+    if not SHARD_DATABASE_URLS:
+        print("Set SMARTBANK_SHARD_URLS to a comma-separated list of shard URLs")
+        sys.exit(1)
+    shards = ShardedSessionFactory(SHARD_DATABASE_URLS)
+    command = sys.argv[1] if len(sys.argv) > 1 else "recover"
+    if command == "create":
+        shards.create_all()
+        print(f"Created tables on {shards.shard_count} shards")
+    else:
+        print(f"Recovered transfers: {shards.recover_in_doubt_transfers()}")
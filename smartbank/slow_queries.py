@@ -0,0 +1,161 @@
+"""Slow-query log: which statements are slow, how often, and their plans.
+
+Every statement slower than SLOW_QUERY_MS is normalised into a fingerprint.
+Literals and placeholders become `?`, and IN lists and VALUES rows collapse
+to one. Each fingerprint keeps its count and its total and max time. The
+table holds SLOW_QUERY_FINGERPRINTS entries; when it is full, the entry with
+the least total time goes, so the worst offenders stay. The first time a
+fingerprint is seen, its EXPLAIN is captured on a background thread with
+a separate connection, so the slow request is not held up further.
+
+The timing listeners are on the Engine class, so they cover every engine,
+shards included. They cost two clock reads per statement.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_LOG = os.environ.get("SMARTBANK_SLOW_QUERY_LOG", "1") == "1"
+SLOW_QUERY_MS = float(os.environ.get("SMARTBANK_SLOW_QUERY_MS", "100"))
+SLOW_QUERY_FINGERPRINTS = int(os.environ.get("SMARTBANK_SLOW_QUERY_FINGERPRINTS", "500"))
+SLOW_QUERY_EXPLAIN = os.environ.get("SMARTBANK_SLOW_QUERY_EXPLAIN", "1") == "1"
+SLOW_QUERY_STATEMENT_CHARS = 2000
+ORDERS = ("total_ms", "max_ms", "count")
+
+EXPLAIN_PREFIXES = {"sqlite": "EXPLAIN QUERY PLAN ", "mysql": "EXPLAIN ", "postgresql": "EXPLAIN "}
+# Statements whose plan EXPLAIN shows without running them
+EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDERS = re.compile(r"%\(\w+\)s|%s|(?<![:\w]):\w+|\$\d+|\?")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROWS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_SPACE = re.compile(r"\s+")
+
+def normalize(statement):
+    statement = _STRINGS.sub("?", statement)
+    statement = _PLACEHOLDERS.sub("?", statement)
+    statement = _NUMBERS.sub("?", statement)
+    statement = _LISTS.sub("(...)", statement)
+    statement = _ROWS.sub("(...)", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+class SlowQueryLog:
+    """Per-fingerprint timings of slow statements, bounded to `capacity` entries."""
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, capacity=SLOW_QUERY_FINGERPRINTS, explain=SLOW_QUERY_EXPLAIN):
+        self.threshold_ms = threshold_ms
+        self.capacity = capacity
+        self.explain = explain
+        self.evicted = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._explainer = None
+
+    def record(self, engine, statement, parameters, elapsed_ms, executemany=False):
+        normalized = normalize(statement)
+        key = fingerprint(normalized)
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._entries.get(key)
+            new = entry is None
+            if new:
+                if len(self._entries) >= self.capacity:
+                    del self._entries[min(self._entries, key=lambda k: self._entries[k]["total_ms"])]
+                    self.evicted += 1
+                entry = self._entries[key] = {
+                    "fingerprint": key, "statement": normalized, "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "example": None, "first_seen": now, "last_seen": now, "explain": None
+                }
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["last_seen"] = now
+            if elapsed_ms >= entry["max_ms"]:
+                entry["max_ms"] = elapsed_ms
+                entry["example"] = statement[:SLOW_QUERY_STATEMENT_CHARS]
+        if new and self.explain and statement.lstrip()[:6].upper().startswith(EXPLAINABLE):
+            if executemany:
+                parameters = parameters[0] if parameters else ()
+            with self._lock:
+                if self._explainer is None:
+                    self._explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+                self._explainer.submit(self._explain, engine, key, statement, parameters)
+
+    def _explain(self, engine, key, statement, parameters):
+        prefix = EXPLAIN_PREFIXES.get(engine.dialect.name, "EXPLAIN ")
+        try:
+            with engine.connect() as conn:
+                plan = [" | ".join(str(value) for value in row)
+                        for row in conn.exec_driver_sql(prefix + statement, parameters)]
+        except Exception as e:
+            plan = [f"EXPLAIN failed: {e}"]
+            logger.warning("EXPLAIN of slow query %s failed: %s", key, e)
+        with self._lock:
+            if key in self._entries:
+                self._entries[key]["explain"] = plan
+
+    def top(self, order="total_ms", limit=20):
+        if order not in ORDERS:
+            raise ValueError(f"Order must be one of {', '.join(ORDERS)}")
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda entry: entry[order], reverse=True)[:limit]
+            result = []
+            for entry in entries:
+                entry = dict(entry)
+                entry["mean_ms"] = entry["total_ms"] / entry["count"]
+                result.append(entry)
+        return result
+
+    def __len__(self):
+        return len(self._entries)
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self.evicted = 0
+
+    def wait(self):
+        """Block until the EXPLAINs submitted so far have been captured."""
+        explainer = self._explainer
+        if explainer is not None:
+            explainer.submit(lambda: None).result()
+
+    def shutdown(self):
+        with self._lock:
+            explainer, self._explainer = self._explainer, None
+        if explainer is not None:
+            explainer.shutdown(wait=True)
+
+recorder = SlowQueryLog()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._slow_query_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_slow_query_started", None)
+    if started is None:
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    # Our own EXPLAINs are not what anyone is looking for
+    if elapsed_ms >= recorder.threshold_ms and not statement.startswith("EXPLAIN"):
+        recorder.record(conn.engine, statement, parameters, elapsed_ms, executemany)
+
+def install():
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
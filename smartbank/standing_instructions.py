@@ -0,0 +1,252 @@
+"""Recurring transfers (rent, SIPs, EMIs) executed in bulk.
+
+    python standing_instructions.py [--at 2025-02-01T00:00] [--batch-size 500]
+
+Due instructions are claimed by the (status, next_run_at) index in batches,
+with SKIP LOCKED so several schedulers can share the work. A batch runs in
+one transaction. Its accounts are locked in id order, and its instructions
+are replayed oldest first against the locked balances, so each account pays
+in schedule order and a credit earlier in the batch can fund a later debit.
+Then everything is written set-based. All balance changes go in one UPDATE,
+the ledger rows in one INSERT, and the schedules in one UPDATE per group of
+instructions that move to the same time.
+
+An occurrence the account cannot cover is retried INSTRUCTION_RETRY_HOURS
+later, up to INSTRUCTION_MAX_RETRIES times, and then skipped. Instructions
+whose accounts are gone, inactive or over their daily limit are paused.
+"""
+import argparse
+import calendar
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Account, InstructionFrequency, InstructionStatus, StandingInstruction, Transaction, TransactionType
+from transfers import TransferError, to_amount
+import notifications
+import rollups
+import striping
+import versions
+from versions import accounts_key
+
+INSTRUCTION_BATCH_SIZE = 500
+INSTRUCTION_MAX_RETRIES = int(os.environ.get("SMARTBANK_INSTRUCTION_MAX_RETRIES", "3"))
+INSTRUCTION_RETRY_HOURS = int(os.environ.get("SMARTBANK_INSTRUCTION_RETRY_HOURS", "6"))
+
+def advance(due_at, frequency, anchor_day):
+    """The occurrence after `due_at`; monthly ones keep `anchor_day` where the month has it."""
+    if frequency == InstructionFrequency.DAILY:
+        return due_at + timedelta(days=1)
+    if frequency == InstructionFrequency.WEEKLY:
+        return due_at + timedelta(weeks=1)
+    year, month = (due_at.year + 1, 1) if due_at.month == 12 else (due_at.year, due_at.month + 1)
+    return due_at.replace(year=year, month=month, day=min(anchor_day, calendar.monthrange(year, month)[1]))
+
+def create_instruction(db: Session, user_id, from_account, to_account, amount, frequency,
+                       start_at, end_at=None, description=""):
+    amount = to_amount(amount)
+    if amount <= 0:
+        raise TransferError(400, "Amount must be greater than 0")
+    if from_account == to_account:
+        raise TransferError(400, "Cannot transfer to the same account")
+    try:
+        frequency = InstructionFrequency(frequency)
+    except ValueError:
+        raise TransferError(400, "Frequency must be daily, weekly or monthly")
+    if end_at is not None and end_at < start_at:
+        raise TransferError(400, "End date must not be before the start date")
+    sender = db.query(Account).filter(Account.account_number == from_account, Account.user_id == user_id).first()
+    if sender is None:
+        raise TransferError(404, "Sender account not found")
+    receiver = db.query(Account).filter(Account.account_number == to_account).first()
+    if receiver is None or not receiver.is_active:
+        raise TransferError(404, "Receiver account not found")
+
+    instruction = StandingInstruction(
+        user_id=user_id, from_account=from_account, to_account=to_account, amount=amount,
+        description=description, frequency=frequency, start_at=start_at, end_at=end_at,
+        due_at=start_at, next_run_at=start_at
+    )
+    db.add(instruction)
+    db.commit()
+    db.refresh(instruction)
+    return instruction
+
+def claim_due(db: Session, now, batch_size):
+    return db.query(StandingInstruction).filter(
+        StandingInstruction.status == InstructionStatus.ACTIVE,
+        StandingInstruction.next_run_at <= now
+    ).order_by(StandingInstruction.next_run_at, StandingInstruction.id).limit(batch_size).with_for_update(
+        skip_locked=True
+    ).all()
+
+def execute_batch(db: Session, instructions, now):
+    """Pay, retry, skip or pause each instruction; the caller commits. Returns counts."""
+    numbers = {i.from_account for i in instructions} | {i.to_account for i in instructions}
+    accounts = {row.account_number: row for row in db.execute(
+        select(Account.id, Account.account_number, Account.user_id, Account.balance, Account.daily_limit,
+               Account.is_active, Account.stripe_count)
+        .where(Account.account_number.in_(numbers)).order_by(Account.id).with_for_update()
+    )}
+    striped = striping.striped_balances(db, [a.id for a in accounts.values() if a.stripe_count])
+    balances = {a.account_number: Decimal(a.balance or 0) + striped.get(a.id, Decimal("0")) for a in accounts.values()}
+
+    deltas = defaultdict(Decimal)
+    flows = defaultdict(lambda: [Decimal("0"), Decimal("0"), 0])  # debits, credits, count
+    ledger = []
+    schedules = defaultdict(list)  # (status, due_at, next_run_at, retries, error, paid) -> instruction ids
+    counts = {"executed": 0, "retrying": 0, "skipped": 0, "paused": 0}
+    retry_at = now + timedelta(hours=INSTRUCTION_RETRY_HOURS)
+
+    def next_occurrence(instruction, paid, error=None):
+        due_at = advance(instruction.due_at, instruction.frequency, instruction.start_at.day)
+        if instruction.end_at is not None and due_at > instruction.end_at:
+            key = (InstructionStatus.COMPLETED, instruction.due_at, instruction.next_run_at, 0, error, paid)
+        else:
+            key = (InstructionStatus.ACTIVE, due_at, due_at, 0, error, paid)
+        schedules[key].append(instruction.id)
+
+    for instruction in sorted(instructions, key=lambda i: (i.due_at, i.id)):
+        sender = accounts.get(instruction.from_account)
+        receiver = accounts.get(instruction.to_account)
+        amount = Decimal(instruction.amount)
+        if sender is None or sender.user_id != instruction.user_id:
+            error = "Sender account not found"
+        elif receiver is None or not receiver.is_active:
+            error = "Receiver account not found or inactive"
+        elif amount > sender.daily_limit:
+            error = "Amount exceeds daily limit"
+        else:
+            error = None
+        if error:
+            schedules[(InstructionStatus.PAUSED, instruction.due_at, instruction.next_run_at, instruction.retries,
+                       error, False)].append(instruction.id)
+            counts["paused"] += 1
+            continue
+
+        if balances[sender.account_number] < amount:
+            if instruction.retries < INSTRUCTION_MAX_RETRIES:
+                schedules[(InstructionStatus.ACTIVE, instruction.due_at, retry_at, instruction.retries + 1,
+                           "Insufficient funds", False)].append(instruction.id)
+                counts["retrying"] += 1
+            else:
+                next_occurrence(instruction, False, f"Skipped {instruction.due_at:%Y-%m-%d}: insufficient funds")
+                counts["skipped"] += 1
+            continue
+
+        balances[sender.account_number] -= amount
+        balances[receiver.account_number] += amount
+        deltas[sender.account_number] -= amount
+        deltas[receiver.account_number] += amount
+        flows[sender.account_number][0] += amount
+        flows[receiver.account_number][1] += amount
+        flows[sender.account_number][2] += 1
+        flows[receiver.account_number][2] += 1
+        ledger.append({
+            # One id per occurrence, so a payment can never be posted twice
+            "transaction_id": f"SI{instruction.id}-{instruction.due_at:%Y%m%d%H%M}",
+            "from_account_id": sender.id,
+            "to_account_id": receiver.id,
+            "amount": amount,
+            "transaction_type": TransactionType.TRANSFER,
+            "description": instruction.description or "Standing instruction",
+            "created_at": now
+        })
+        notifications.notify(db, sender.user_id, "transfer.debit", {
+            "transaction_id": ledger[-1]["transaction_id"],
+            "account_number": sender.account_number,
+            "amount": float(amount),
+            "balance": float(balances[sender.account_number])
+        })
+        notifications.notify(db, receiver.user_id, "transfer.credit", {
+            "transaction_id": ledger[-1]["transaction_id"],
+            "account_number": receiver.account_number,
+            "amount": float(amount)
+        })
+        next_occurrence(instruction, True)
+        counts["executed"] += 1
+
+    # Net balance changes: one CASE update for plain accounts, stripes for striped ones
+    plain = {accounts[number].id: delta for number, delta in deltas.items()
+             if delta and not accounts[number].stripe_count}
+    if plain:
+        db.execute(
+            update(Account).where(Account.id.in_(list(plain)))
+            .values(balance=Account.balance + case(plain, value=Account.id))
+            .execution_options(synchronize_session=False)
+        )
+    for number, delta in deltas.items():
+        account = accounts[number]
+        if delta and account.stripe_count:
+            if delta > 0:
+                striping.credit(db, account, delta)
+            elif striping.debit(db, account, -delta) is None:
+                # A concurrent debit drained the stripes after they were summed
+                raise RuntimeError(f"Stripes of {number} changed during the batch")
+    if ledger:
+        db.execute(insert(Transaction), ledger)
+    for number, (debits, credits, count) in flows.items():
+        if not accounts[number].stripe_count:
+            rollups.record(db, accounts[number].id, debits, credits, balances[number], count, on=now)
+
+    for (status, due_at, next_run_at, retries, error, paid), ids in schedules.items():
+        values = {
+            "status": status, "due_at": due_at, "next_run_at": next_run_at,
+            "retries": retries, "last_error": error, "last_run_at": now
+        }
+        if paid:
+            values["runs"] = StandingInstruction.runs + 1
+        db.execute(
+            update(StandingInstruction).where(StandingInstruction.id.in_(ids)).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+    touched = {accounts[number].user_id for number in deltas}
+    if touched:
+        versions.bump_after_commit(db, *[accounts_key(user_id) for user_id in touched])
+    return counts
+
+def run_due_instructions(session_factory=SessionLocal, now=None, batch_size=INSTRUCTION_BATCH_SIZE, log=print):
+    """Run everything due at `now`, batch by batch; returns counts and the rate."""
+    now = now or datetime.utcnow()
+    totals = {"executed": 0, "retrying": 0, "skipped": 0, "paused": 0}
+    started = time.monotonic()
+    # Until nothing is due; a catch-up run can leave an instruction due again
+    while True:
+        db = session_factory()
+        try:
+            instructions = claim_due(db, now, batch_size)
+            if not instructions:
+                db.commit()
+                break
+            counts = execute_batch(db, instructions, now)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        for key, count in counts.items():
+            totals[key] += count
+        processed = sum(totals.values())
+        log(f"{processed} instructions processed ({processed / max(time.monotonic() - started, 1e-9):.0f}/s)")
+
+    elapsed = time.monotonic() - started
+    processed = sum(totals.values())
+    totals["instructions_per_second"] = processed / elapsed if processed else 0.0
+    log(f"{totals['executed']} executed, {totals['retrying']} to retry, {totals['skipped']} skipped, "
+        f"{totals['paused']} paused in {elapsed:.1f}s ({totals['instructions_per_second']:.0f} instructions/s)")
+    return totals
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Execute due standing instructions")
+    parser.add_argument("--at", type=datetime.fromisoformat, default=None, help="Run as of this time (default: now, UTC)")
+    parser.add_argument("--batch-size", type=int, default=INSTRUCTION_BATCH_SIZE, help="Instructions per transaction")
+    args = parser.parse_args()
+    run_due_instructions(now=args.at, batch_size=args.batch_size)
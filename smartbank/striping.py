@@ -0,0 +1,115 @@
+import random
+from decimal import Decimal
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from models import Account, AccountBalanceStripe
+
+MAX_STRIPES = 64
+
+def set_stripe_count(db: Session, account: Account, stripes: int):
+    """Stripe `account` across `stripes` sub-balances, or fold it back with 0."""
+    if stripes < 0 or stripes > MAX_STRIPES:
+        raise ValueError(f"Stripe count must be between 0 and {MAX_STRIPES}")
+
+    account = db.query(Account).filter(Account.id == account.id).with_for_update().one()
+    existing = db.query(AccountBalanceStripe).filter(
+        AccountBalanceStripe.account_id == account.id
+    ).with_for_update().all()
+    total = Decimal(account.balance or 0) + sum((stripe.balance for stripe in existing), Decimal("0"))
+
+    for stripe in existing:
+        db.delete(stripe)
+    db.flush()
+
+    if stripes:
+        # Everything starts on stripe 0; credits spread it out from there
+        db.add_all([
+            AccountBalanceStripe(account_id=account.id, stripe=index, balance=total if index == 0 else 0)
+            for index in range(stripes)
+        ])
+        account.balance = 0
+    else:
+        account.balance = total
+    account.stripe_count = stripes
+    db.commit()
+    return total
+
+def credit(db: Session, account: Account, amount):
+    """Credit one random stripe, so concurrent credits rarely share a row lock.
+
+    `account.stripe_count` may be stale: it can come from the account
+    directory, or the account may have been restriped since. If the chosen
+    stripe is gone, the count is re-read under the account's row lock, which
+    set_stripe_count also takes, and the credit goes to a stripe that exists
+    or to the account row itself.
+    """
+    if _credit_stripe(db, account.id, random.randrange(account.stripe_count), amount):
+        return
+    stripe_count = db.query(Account.stripe_count).filter(Account.id == account.id).with_for_update().scalar()
+    if stripe_count is None:
+        raise ValueError(f"Account {account.id} not found")
+    if stripe_count:
+        if not _credit_stripe(db, account.id, random.randrange(stripe_count), amount):
+            raise RuntimeError(f"Stripes of account {account.id} are missing")
+        return
+    db.execute(
+        update(Account).where(Account.id == account.id).values(balance=Account.balance + amount)
+        .execution_options(synchronize_session=False)
+    )
+
+def _credit_stripe(db: Session, account_id, stripe, amount):
+    return db.execute(
+        update(AccountBalanceStripe)
+        .where(AccountBalanceStripe.account_id == account_id, AccountBalanceStripe.stripe == stripe)
+        .values(balance=AccountBalanceStripe.balance + amount)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+def debit(db: Session, account: Account, amount):
+    # Debits lock the account row, then every stripe in a fixed order, and drain
+    # the row before the stripes. The row holds credits made while a stale
+    # stripe count said the account was unstriped; like balance_of, the funds
+    # are row plus stripes. Returns the new total, or None when they fall short.
+    amount = Decimal(str(amount))
+    row_balance = Decimal(
+        db.query(Account.balance).filter(Account.id == account.id).with_for_update().scalar() or 0
+    )
+    stripes = db.query(AccountBalanceStripe).filter(
+        AccountBalanceStripe.account_id == account.id
+    ).order_by(AccountBalanceStripe.stripe).with_for_update().all()
+
+    total = row_balance + sum((stripe.balance for stripe in stripes), Decimal("0"))
+    if total < amount:
+        return None
+
+    remaining = amount
+    taken = min(max(row_balance, Decimal("0")), remaining)
+    if taken:
+        db.execute(
+            update(Account).where(Account.id == account.id).values(balance=Account.balance - taken)
+            .execution_options(synchronize_session=False)
+        )
+        remaining -= taken
+    for stripe in stripes:
+        if remaining <= 0:
+            break
+        taken = min(stripe.balance, remaining)
+        stripe.balance -= taken
+        remaining -= taken
+    return total - amount
+
+def balance_of(db: Session, account: Account):
+    if not account.stripe_count:
+        return account.balance
+    return Decimal(account.balance or 0) + striped_balances(db, [account.id]).get(account.id, Decimal("0"))
+
+def striped_balances(db: Session, account_ids):
+    # One aggregate query for a batch of striped accounts
+    if not account_ids:
+        return {}
+    rows = db.query(AccountBalanceStripe.account_id, func.sum(AccountBalanceStripe.balance)).filter(
+        AccountBalanceStripe.account_id.in_(account_ids)
+    ).group_by(AccountBalanceStripe.account_id).all()
+    return {account_id: Decimal(total or 0) for account_id, total in rows}
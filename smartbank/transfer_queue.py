@@ -0,0 +1,305 @@
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import QueuedTransfer, QueuedTransferStatus
+from transfers import TransferError, perform_transfer, to_amount
+
+logger = logging.getLogger(__name__)
+
+# Number of worker threads draining the queue; 0 disables asynchronous transfers
+TRANSFER_QUEUE_WORKERS = int(os.environ.get("SMARTBANK_TRANSFER_WORKERS", "0"))
+TRANSFER_QUEUE_BATCH_SIZE = 200
+TRANSFER_QUEUE_POLL_INTERVAL = 0.2
+# A PROCESSING row whose pool has not sent a heartbeat for this long is queued again
+TRANSFER_QUEUE_LEASE_SECONDS = int(os.environ.get("SMARTBANK_TRANSFER_LEASE_SECONDS", "60"))
+
+class TransferQueueMetrics:
+    """Process-local counters for the transfer queue."""
+
+    def __init__(self, window_seconds=60, sample_size=1000):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._completions = deque()
+        self._latencies = deque(maxlen=sample_size)
+        self.enqueued = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_latency = 0.0
+
+    def record_enqueued(self):
+        with self._lock:
+            self.enqueued += 1
+
+    def record_done(self, latency, succeeded):
+        now = time.monotonic()
+        with self._lock:
+            if succeeded:
+                self.completed += 1
+            else:
+                self.failed += 1
+            self._completions.append(now)
+            self._latencies.append(latency)
+            self.max_latency = max(self.max_latency, latency)
+            self._trim(now)
+
+    def _trim(self, now):
+        while self._completions and self._completions[0] < now - self.window_seconds:
+            self._completions.popleft()
+
+    def snapshot(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            latencies = sorted(self._latencies)
+            processed = len(self._completions)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            "enqueued": self.enqueued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "throughput_per_second": processed / self.window_seconds,
+            "queue_latency_p50_seconds": percentile(0.50),
+            "queue_latency_p95_seconds": percentile(0.95),
+            "queue_latency_max_seconds": self.max_latency
+        }
+
+metrics = TransferQueueMetrics()
+
+def enqueue_transfer(db: Session, user_id, from_account, to_account, amount, description=""):
+    amount = to_amount(amount)
+    if amount <= 0:
+        raise TransferError(400, "Amount must be greater than 0")
+    queued = QueuedTransfer(
+        user_id=user_id,
+        from_account=from_account,
+        to_account=to_account,
+        amount=amount,
+        description=description,
+        status=QueuedTransferStatus.QUEUED
+    )
+    db.add(queued)
+    db.commit()
+    db.refresh(queued)
+    metrics.record_enqueued()
+    return queued
+
+def queue_depth(db: Session):
+    return db.query(QueuedTransfer).filter(
+        QueuedTransfer.status == QueuedTransferStatus.QUEUED
+    ).count()
+
+class TransferWorkerPool:
+    """Drains `queued_transfers` with a dispatcher and N worker threads.
+
+    The dispatcher claims batches in id order and hands every transfer for a
+    given sender account to the same worker, so transfers from one account run
+    in submission order and never contend with each other for its row lock.
+
+    A claim is a lease held by `pool_id`. A heartbeat thread renews the leases
+    of this pool's rows and queues again the rows of pools that stopped
+    renewing theirs, so a crashed process's transfers are retried while those
+    still running in other processes are left alone.
+    """
+
+    def __init__(self, workers=TRANSFER_QUEUE_WORKERS, session_factory=SessionLocal,
+                 batch_size=TRANSFER_QUEUE_BATCH_SIZE, poll_interval=TRANSFER_QUEUE_POLL_INTERVAL,
+                 lease_seconds=TRANSFER_QUEUE_LEASE_SECONDS):
+        self.workers = workers
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.pool_id = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._queues = [queue.Queue() for _ in range(workers)]
+        self._threads = []
+
+    @property
+    def running(self):
+        return bool(self._threads) and not self._stop.is_set()
+
+    def start(self):
+        self.requeue_interrupted()
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._dispatch, name="transfer-dispatcher", daemon=True),
+            threading.Thread(target=self._heartbeat, name="transfer-heartbeat", daemon=True)
+        ]
+        for index in range(self.workers):
+            self._threads.append(threading.Thread(
+                target=self._work, args=(index,), name=f"transfer-worker-{index}", daemon=True
+            ))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        for worker_queue in self._queues:
+            worker_queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def requeue_interrupted(self):
+        # A transfer's status is committed together with its balance changes, so
+        # a PROCESSING row whose lease expired never ran and can be retried
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        db = self.session_factory()
+        try:
+            count = db.query(QueuedTransfer).filter(
+                QueuedTransfer.status == QueuedTransferStatus.PROCESSING,
+                func.coalesce(QueuedTransfer.heartbeat_at, QueuedTransfer.started_at) < cutoff
+            ).update({
+                QueuedTransfer.status: QueuedTransferStatus.QUEUED,
+                QueuedTransfer.claimed_by: None
+            }, synchronize_session=False)
+            db.commit()
+            if count:
+                logger.warning("Requeued %s transfers whose lease expired", count)
+            return count
+        finally:
+            db.close()
+
+    def renew_leases(self):
+        db = self.session_factory()
+        try:
+            count = db.query(QueuedTransfer).filter(
+                QueuedTransfer.status == QueuedTransferStatus.PROCESSING,
+                QueuedTransfer.claimed_by == self.pool_id
+            ).update({QueuedTransfer.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    def claim_batch(self):
+        db = self.session_factory()
+        try:
+            batch = db.query(QueuedTransfer.id, QueuedTransfer.from_account).filter(
+                QueuedTransfer.status == QueuedTransferStatus.QUEUED
+            ).order_by(QueuedTransfer.id).limit(self.batch_size).with_for_update(skip_locked=True).all()
+            if not batch:
+                db.commit()
+                return {}
+
+            now = datetime.utcnow()
+            db.query(QueuedTransfer).filter(
+                QueuedTransfer.id.in_([row.id for row in batch])
+            ).update({
+                QueuedTransfer.status: QueuedTransferStatus.PROCESSING,
+                QueuedTransfer.claimed_by: self.pool_id,
+                QueuedTransfer.started_at: now,
+                QueuedTransfer.heartbeat_at: now
+            }, synchronize_session=False)
+            db.commit()
+
+            groups = {}
+            for row in batch:
+                groups.setdefault(row.from_account, []).append(row.id)
+            return groups
+        finally:
+            db.close()
+
+    def process_group(self, transfer_ids):
+        # Runs one sender's transfers in order on a single session
+        db = self.session_factory()
+        try:
+            for transfer_id in transfer_ids:
+                self._process_one(db, transfer_id)
+        finally:
+            db.close()
+
+    def _claimed(self, db, transfer_id):
+        # Locked until the outcome commits, so an expired lease cannot be requeued mid-transfer
+        return db.query(QueuedTransfer).filter(
+            QueuedTransfer.id == transfer_id,
+            QueuedTransfer.status == QueuedTransferStatus.PROCESSING,
+            QueuedTransfer.claimed_by == self.pool_id
+        ).with_for_update().first()
+
+    def _process_one(self, db, transfer_id):
+        queued = self._claimed(db, transfer_id)
+        if queued is None:
+            # Our lease expired and the row was requeued; whoever holds it now runs it
+            db.rollback()
+            return
+        try:
+            result = perform_transfer(
+                db, queued.user_id, queued.from_account, queued.to_account,
+                queued.amount, queued.description or "", commit=False
+            )
+            queued.status = QueuedTransferStatus.COMPLETED
+            queued.new_balance = result["new_balance"]
+            queued.completed_at = datetime.utcnow()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            if not isinstance(e, TransferError):
+                logger.exception("Queued transfer %s failed", transfer_id)
+            # If this fails too the row stays PROCESSING and is retried once the lease expires
+            queued = self._claimed(db, transfer_id)
+            if queued is None:
+                db.rollback()
+                return
+            queued.status = QueuedTransferStatus.FAILED
+            queued.error = (e.detail if isinstance(e, TransferError) else f"Transfer failed: {e}")[:255]
+            queued.completed_at = datetime.utcnow()
+            db.commit()
+        metrics.record_done(
+            (queued.completed_at - queued.created_at).total_seconds(),
+            queued.status == QueuedTransferStatus.COMPLETED
+        )
+
+    def _dispatch(self):
+        while not self._stop.is_set():
+            try:
+                groups = self.claim_batch()
+            except Exception:
+                logger.exception("Failed to claim queued transfers")
+                groups = {}
+            if not groups:
+                self._stop.wait(self.poll_interval)
+                continue
+            for from_account, transfer_ids in groups.items():
+                index = zlib.crc32(from_account.encode()) % self.workers
+                self._queues[index].put(transfer_ids)
+            # Wait for this batch to finish so a later batch cannot overtake it
+            for worker_queue in self._queues:
+                worker_queue.join()
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.renew_leases()
+                self.requeue_interrupted()
+            except Exception:
+                logger.exception("Failed to renew transfer leases")
+
+    def _work(self, index):
+        worker_queue = self._queues[index]
+        while True:
+            transfer_ids = worker_queue.get()
+            try:
+                if transfer_ids is None:
+                    return
+                self.process_group(transfer_ids)
+            except Exception:
+                logger.exception("Transfer worker %s failed", index)
+            finally:
+                worker_queue.task_done()
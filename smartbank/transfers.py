@@ -0,0 +1,195 @@
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import Account, Transaction, TransactionType
+import account_directory
+import events
+import fraud
+import load_shedding
+import notifications
+import rollups
+import striping
+import versions
+from versions import accounts_key
+
+CENTS = Decimal("0.01")
+
+class TransferError(Exception):
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def to_amount(value):
+    # Money is a Decimal rounded to paise from the request to the database
+    try:
+        return Decimal(str(value)).quantize(CENTS)
+    except InvalidOperation:
+        raise TransferError(400, "Invalid amount")
+
+# Built once; executed on the session's connection, bypassing the ORM
+DEBIT = (
+    update(Account.__table__)
+    .where(Account.id == bindparam("account_id"), Account.balance >= bindparam("amount"),
+           Account.daily_limit >= bindparam("amount"))
+    .values(balance=Account.balance - bindparam("amount"))
+)
+CREDIT = (
+    update(Account.__table__)
+    .where(Account.id == bindparam("account_id"))
+    .values(balance=Account.balance + bindparam("amount"))
+)
+DEBIT_RETURNING = DEBIT.returning(Account.balance)
+CREDIT_RETURNING = CREDIT.returning(Account.balance)
+BALANCE = select(Account.balance).where(Account.id == bindparam("account_id"))
+BALANCE_AND_LIMIT = select(Account.balance, Account.daily_limit).where(Account.id == bindparam("account_id"))
+INSERT_TRANSACTION = insert(Transaction.__table__)
+
+def debit(db: Session, account_id: int, amount: Decimal):
+    """Debit an unstriped account in one conditional UPDATE; returns the new balance.
+
+    The balance and daily limit are checked by the WHERE clause, so the row is
+    locked only for the statement itself and nothing is read beforehand. When
+    no row matches, one extra SELECT works out which check failed.
+    """
+    conn = db.connection()
+    params = {"account_id": account_id, "amount": amount}
+    if conn.dialect.update_returning:
+        new_balance = conn.execute(DEBIT_RETURNING, params).scalar_one_or_none()
+        if new_balance is not None:
+            return Decimal(new_balance)
+    elif conn.execute(DEBIT, params).rowcount == 1:
+        return Decimal(conn.execute(BALANCE, params).scalar_one())
+
+    row = conn.execute(BALANCE_AND_LIMIT, params).one()
+    if amount > row.daily_limit:
+        raise TransferError(400, "Amount exceeds daily limit")
+    raise TransferError(400, "Insufficient funds")
+
+def credit(db: Session, account_id: int, amount: Decimal):
+    # Credit an unstriped account; returns the new balance for the rollups
+    conn = db.connection()
+    params = {"account_id": account_id, "amount": amount}
+    if conn.dialect.update_returning:
+        return Decimal(conn.execute(CREDIT_RETURNING, params).scalar_one())
+    conn.execute(CREDIT, params)
+    return Decimal(conn.execute(BALANCE, params).scalar_one())
+
+def perform_transfer(
+    db: Session,
+    user_id: int,
+    from_account: str,
+    to_account: str,
+    amount,
+    description: str = "",
+    commit: bool = True
+):
+    # Shared by /api/transfer and the transfer queue workers. With commit=False
+    # the caller owns the transaction and commits alongside its own changes.
+    amount = to_amount(amount)
+    if amount <= 0:
+        raise TransferError(400, "Amount must be greater than 0")
+
+    # Both accounts come from the shared account directory (DB only on a miss)
+    sender_account = account_directory.directory.lookup(from_account, db)
+    if not sender_account or sender_account.user_id != user_id:
+        raise TransferError(404, "Sender account not found")
+
+    if from_account == to_account:
+        raise TransferError(400, "Cannot transfer to the same account")
+
+    receiver_account = account_directory.directory.lookup(to_account, db)
+    if not receiver_account:
+        raise TransferError(404, "Receiver account not found")
+    if not receiver_account.is_active:
+        raise TransferError(400, "Receiver account is inactive")
+
+    # In-memory velocity and amount checks; no extra queries
+    decision = fraud.scorer.evaluate(sender_account.id, receiver_account.id, float(amount))
+    if decision.blocked:
+        raise TransferError(403, f"Transfer blocked: {', '.join(decision.reasons)}")
+
+    try:
+        # Update balances
+        if sender_account.stripe_count:
+            daily_limit = db.execute(select(Account.daily_limit).where(Account.id == sender_account.id)).scalar_one()
+            if amount > daily_limit:
+                raise TransferError(400, "Amount exceeds daily limit")
+            new_balance = striping.debit(db, sender_account, amount)
+            if new_balance is None:
+                raise TransferError(400, "Insufficient funds")
+        else:
+            new_balance = debit(db, sender_account.id, amount)
+
+        if receiver_account.stripe_count:
+            striping.credit(db, receiver_account, amount)
+        else:
+            receiver_balance = credit(db, receiver_account.id, amount)
+
+        # Ledger entry
+        transaction_id = f"TXN{uuid.uuid4().hex}"
+        db.connection().execute(INSERT_TRANSACTION, {
+            "transaction_id": transaction_id,
+            "from_account_id": sender_account.id,
+            "to_account_id": receiver_account.id,
+            "amount": amount,
+            "transaction_type": TransactionType.TRANSFER,
+            "description": description
+        })
+
+        # Live balance updates for both parties once the transfer commits
+        events.publish_after_commit(db, sender_account.user_id, "balance", {
+            "account_number": from_account,
+            "balance": float(new_balance)
+        })
+        events.publish_after_commit(db, receiver_account.user_id, "balance", {
+            "account_number": to_account,
+            "balance": None
+        })
+        versions.bump_after_commit(db, accounts_key(sender_account.user_id), accounts_key(receiver_account.user_id))
+        # Chart rollups; striped accounts are left to the backfill (see rollups.py)
+        if not sender_account.stripe_count:
+            rollups.record(db, sender_account.id, debits=amount, closing_balance=new_balance)
+        if not receiver_account.stripe_count:
+            rollups.record(db, receiver_account.id, credits=amount, closing_balance=receiver_balance)
+
+        # SMS/email go out from the outbox after the commit, never inline
+        notifications.notify(db, sender_account.user_id, "transfer.debit", {
+            "transaction_id": transaction_id,
+            "account_number": from_account,
+            "amount": float(amount),
+            "balance": float(new_balance)
+        })
+        notifications.notify(db, receiver_account.user_id, "transfer.credit", {
+            "transaction_id": transaction_id,
+            "account_number": to_account,
+            "amount": float(amount)
+        })
+
+        if commit:
+            db.commit()
+        else:
+            db.flush()
+        fraud.scorer.record(sender_account.id, receiver_account.id, float(amount))
+
+        return {
+            "message": "Transfer successful",
+            "transaction_id": transaction_id,
+            "amount": float(amount),
+            "from_account": from_account,
+            "to_account": to_account,
+            "new_balance": float(new_balance)
+        }
+
+    except TransferError:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        if load_shedding.cut_short(e):
+            # Not a failed transfer: the middleware answers 503 with Retry-After
+            raise
+        raise TransferError(500, f"Transfer failed: {str(e)}")
@@ -0,0 +1,158 @@
+"""Indexed search over users by email, phone and name.
+
+SQLite: an external-content FTS5 table with the trigram tokenizer, kept in
+step with `users` by triggers. MySQL: a FULLTEXT index with the ngram parser.
+Both match substrings of three (SQLite) or two (MySQL, ngram_token_size)
+characters and up; shorter queries fall back to a prefix lookup on the
+unique email and phone indexes.
+
+The index returns at most RANK_CANDIDATES matches in index order and only
+those are ranked. Index-side ranking (bm25, MATCH score) has to score every
+match, which for a term like "gmail" is most of the table.
+"""
+import re
+
+from sqlalchemy import event, or_, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from models import User
+
+SEARCH_COLUMNS = ("email", "phone", "first_name", "last_name")
+RANK_CANDIDATES = 1000
+MYSQL_INDEX = "ft_users_search"
+MIN_TOKEN = {"sqlite": 3, "mysql": 2}
+
+SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS users_search USING fts5(
+        {", ".join(SEARCH_COLUMNS)}, content='users', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS users_search_insert AFTER INSERT ON users BEGIN
+        INSERT INTO users_search(rowid, {", ".join(SEARCH_COLUMNS)})
+        VALUES (new.id, {", ".join("new." + c for c in SEARCH_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS users_search_delete AFTER DELETE ON users BEGIN
+        INSERT INTO users_search(users_search, rowid, {", ".join(SEARCH_COLUMNS)})
+        VALUES ('delete', old.id, {", ".join("old." + c for c in SEARCH_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS users_search_update AFTER UPDATE OF {", ".join(SEARCH_COLUMNS)} ON users BEGIN
+        INSERT INTO users_search(users_search, rowid, {", ".join(SEARCH_COLUMNS)})
+        VALUES ('delete', old.id, {", ".join("old." + c for c in SEARCH_COLUMNS)});
+        INSERT INTO users_search(rowid, {", ".join(SEARCH_COLUMNS)})
+        VALUES (new.id, {", ".join("new." + c for c in SEARCH_COLUMNS)});
+    END""",
+]
+
+def ensure_index(conn, rebuild=False):
+    """Create the search index if it is missing; safe to call on every start."""
+    if conn.dialect.name == "sqlite":
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_search'"
+        )).first()
+        try:
+            for statement in SQLITE_DDL:
+                conn.execute(text(statement))
+        except OperationalError:
+            return False  # SQLite built without FTS5; search falls back to LIKE
+        if rebuild or not exists:
+            conn.execute(text("INSERT INTO users_search(users_search) VALUES ('rebuild')"))
+        return True
+
+    if conn.dialect.name == "mysql":
+        exists = conn.execute(text(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'users' AND index_name = :name"
+        ), {"name": MYSQL_INDEX}).first()
+        if not exists:
+            conn.execute(text(
+                f"ALTER TABLE users ADD FULLTEXT INDEX {MYSQL_INDEX} ({', '.join(SEARCH_COLUMNS)}) WITH PARSER ngram"
+            ))
+        return True
+    return False
+
+def drop_index(conn):
+    # For bulk loads: maintaining the index row by row is far slower than one rebuild
+    if conn.dialect.name == "sqlite":
+        for trigger in ("users_search_insert", "users_search_delete", "users_search_update"):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        conn.execute(text("DROP TABLE IF EXISTS users_search"))
+    elif conn.dialect.name == "mysql":
+        if conn.execute(text(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'users' AND index_name = :name"
+        ), {"name": MYSQL_INDEX}).first():
+            conn.execute(text(f"ALTER TABLE users DROP INDEX {MYSQL_INDEX}"))
+
+@event.listens_for(User.__table__, "after_create")
+def _create_index(target, connection, **kw):
+    ensure_index(connection, rebuild=True)
+
+@event.listens_for(User.__table__, "before_drop")
+def _drop_index(target, connection, **kw):
+    drop_index(connection)
+
+def tokens(query, min_length):
+    # Quote every token so user input is never parsed as query syntax
+    return [token for token in re.split(r"[\s\"]+", query) if len(token) >= min_length]
+
+def score(row, query, terms):
+    """Exact beats prefix beats substring, email and phone outweigh names, and more fields beat fewer."""
+    query = query.lower()
+    email, phone, first_name, last_name = (value.lower() for value in row)
+    total = 0
+    if query in (email, phone):
+        total += 100
+    elif email.startswith(query) or phone.startswith(query):
+        total += 50
+    for term in (term.lower() for term in terms):
+        for value, weight in ((email, 2), (phone, 2), (first_name, 1), (last_name, 1)):
+            if value == term:
+                total += 10 * weight
+            elif value.startswith(term):
+                total += 5 * weight
+            elif term in value:
+                total += 2 * weight
+    return total
+
+def search_users(db: Session, query: str, limit=20, offset=0):
+    """Users matching `query`, best first. Returns up to `limit` (User, score) pairs."""
+    query = query.strip()
+    dialect = db.get_bind().dialect.name
+    terms = tokens(query, MIN_TOKEN.get(dialect, 1))
+    candidates_wanted = max(RANK_CANDIDATES, offset + limit)
+
+    candidates = None
+    if terms and dialect == "sqlite":
+        match = " ".join('"' + term + '"' for term in terms)
+        try:
+            candidates = db.execute(text(
+                f"SELECT rowid, {', '.join(SEARCH_COLUMNS)} FROM users_search "
+                "WHERE users_search MATCH :match LIMIT :candidates"
+            ), {"match": match, "candidates": candidates_wanted}).all()
+        except OperationalError:
+            candidates = None
+    elif terms and dialect == "mysql":
+        match = " ".join('+"' + term + '"' for term in terms)
+        columns = ", ".join(SEARCH_COLUMNS)
+        candidates = db.execute(text(
+            f"SELECT id, {columns} FROM users "
+            f"WHERE MATCH({columns}) AGAINST (:match IN BOOLEAN MODE) LIMIT :candidates"
+        ), {"match": match, "candidates": candidates_wanted}).all()
+
+    if candidates is None:
+        # Too short for the n-gram index (or no index): prefix match on the
+        # unique email/phone indexes, plus substring LIKE when there is no index
+        escaped = re.sub(r"([\\%_])", r"\\\1", query)
+        conditions = [User.email.like(f"{escaped}%", escape="\\"), User.phone.like(f"{escaped}%", escape="\\")]
+        if terms:
+            conditions += [getattr(User, column).like(f"%{escaped}%", escape="\\") for column in SEARCH_COLUMNS]
+        candidates = db.query(User.id, *[getattr(User, column) for column in SEARCH_COLUMNS]).filter(
+            or_(*conditions)
+        ).order_by(User.id).limit(candidates_wanted).all()
+
+    ranked = sorted(
+        ((row[0], score(row[1:], query, terms or [query])) for row in candidates),
+        key=lambda item: (-item[1], item[0])
+    )[offset:offset + limit]
+    users = {user.id: user for user in db.query(User).filter(User.id.in_([user_id for user_id, _ in ranked]))}
+    return [(users[user_id], float(points)) for user_id, points in ranked if user_id in users]
@@ -0,0 +1,146 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import socket
+import struct
+import tempfile
+import threading
+import zlib
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Counters are per host: a change committed by a server on another host does
+# not bump them. Run every writer on one host, or set SMARTBANK_ETAGS=0.
+ETAGS = os.environ.get("SMARTBANK_ETAGS", "1") == "1"
+# Shared by every worker process on the host, like the account directory
+VERSIONS_PATH = os.environ.get(
+    "SMARTBANK_VERSIONS_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "smartbank-versions")
+)
+VERSION_SLOTS = 1 << 16
+# In every ETag, so one host's ETag never matches on another host
+HOST_ID = hashlib.blake2b(socket.gethostname().encode(), digest_size=4).hexdigest()
+
+MAGIC = b"SBVER001"
+# magic, slot count, epoch (random per file, so a recreated file never repeats an ETag)
+HEADER = struct.Struct("<8sQQ")
+HEADER_SIZE = 64
+COUNTER = struct.Struct("<Q")
+
+# Resource keys; "all" counters are bumped by bulk jobs that touch every user
+ACCOUNTS_ALL = "accounts"
+KYC_ALL = "kyc"
+KYC_PENDING = "kyc:pending"
+
+def accounts_key(user_id):
+    return f"accounts:{user_id}"
+
+def kyc_key(user_id):
+    return f"kyc:{user_id}"
+
+class VersionCounters:
+    """Per-resource change counters in a memory-mapped file.
+
+    Keys hash into a fixed array of 64-bit counters. Two keys that share a
+    slot just invalidate each other's ETags, which costs a full response,
+    never a stale one. Bumps take an flock; reads are a single unpack.
+
+    Only changes committed on this host are counted. ETags name the host, so
+    behind a load balancer a client moving between hosts gets full
+    responses, but a change written on another host goes unnoticed here.
+    """
+
+    def __init__(self, path=VERSIONS_PATH, slots=VERSION_SLOTS, host=HOST_ID):
+        self.path = path
+        self.slots = slots
+        self.host = host
+        self._mm = None
+        self._fd = None
+        self._open_lock = threading.Lock()
+
+    def _open(self):
+        with self._open_lock:
+            if self._mm is not None:
+                return
+            size = HEADER_SIZE + self.slots * COUNTER.size
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size != size:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                mm = mmap.mmap(fd, size)
+                magic, slots, _ = HEADER.unpack_from(mm, 0)
+                if magic != MAGIC or slots != self.slots:
+                    mm[:size] = bytes(size)
+                    HEADER.pack_into(mm, 0, MAGIC, self.slots, int.from_bytes(os.urandom(4), "little"))
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._fd = fd
+            self._mm = mm
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            os.close(self._fd)
+            self._mm = None
+            self._fd = None
+
+    def _offset(self, key):
+        return HEADER_SIZE + (zlib.crc32(key.encode()) % self.slots) * COUNTER.size
+
+    @property
+    def epoch(self):
+        if self._mm is None:
+            self._open()
+        return HEADER.unpack_from(self._mm, 0)[2]
+
+    def get(self, key):
+        if self._mm is None:
+            self._open()
+        return COUNTER.unpack_from(self._mm, self._offset(key))[0]
+
+    def bump(self, *keys):
+        if self._mm is None:
+            self._open()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            for offset in {self._offset(key) for key in keys}:
+                COUNTER.pack_into(self._mm, offset, COUNTER.unpack_from(self._mm, offset)[0] + 1)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def etag(self, name, *keys):
+        """Weak ETag for a response built from the resources under `keys`."""
+        counters = "-".join(str(self.get(key)) for key in keys)
+        return f'W/"{name}-{self.host}{self.epoch:08x}-{counters}"'
+
+versions = VersionCounters()
+
+def bump_after_commit(db: Session, *keys):
+    # Like events.publish_after_commit: a rolled back change bumps nothing
+    db.info.setdefault("pending_versions", set()).update(keys)
+
+@event.listens_for(Session, "after_commit")
+def _bump_pending_versions(session):
+    keys = session.info.pop("pending_versions", None)
+    if keys:
+        versions.bump(*keys)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_versions(session):
+    session.info.pop("pending_versions", None)
+
+def matches(if_none_match, etag):
+    # Weak comparison (RFC 9110 13.1.2): the W/ prefix is ignored on both sides
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    return any(
+        (candidate[2:] if candidate.startswith("W/") else candidate) == wanted
+        for candidate in (part.strip() for part in if_none_match.split(","))
+    )
@@ -1,5 +1,5 @@
 import pytest
-from models import Account
+from models import Account, Transaction, TransactionType
 
 class TestAccountCreation:
     def test_create_savings_account(self, client, auth_headers):
@@ -81,3 +81,11 @@ class TestAccountCreation:
             account_number = response.json()["account_number"]
             assert account_number not in account_numbers
             account_numbers.add(account_number)
+
+    def test_initial_deposit_is_posted_to_ledger(self, client, auth_headers, db_session):
+        response = client.post("/api/accounts/create", data={"account_type": "SAVINGS", "initial_deposit": 2500.0}, headers=auth_headers)
+        assert response.status_code == 200
+        account = db_session.query(Account).filter(Account.account_number == response.json()["account_number"]).first()
+        deposit = db_session.query(Transaction).filter(Transaction.to_account_id == account.id).one()
+        assert deposit.transaction_type == TransactionType.DEPOSIT
+        assert float(deposit.amount) == 2500.0
@@ -0,0 +1,150 @@
+import pytest
+import struct
+import time
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Account, AccountType, User
+from account_directory import AccountDirectory, DirectoryEntry, VERSION_OFFSET
+from transfers import TransferError, perform_transfer
+from auth import get_password_hash
+
+@pytest.fixture
+def directory_path(tmp_path):
+    return str(tmp_path / "accounts.dir")
+
+@pytest.fixture
+def directory_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/directory.db")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    user = User(
+        email="directory@example.com",
+        phone="4444444444",
+        password_hash=get_password_hash("password123"),
+        first_name="Directory",
+        last_name="User",
+        date_of_birth=datetime(1990, 1, 1),
+        address="Directory Address"
+    )
+    session.add(user)
+    session.commit()
+    session.add_all([
+        Account(account_number="SB300000000001", user_id=user.id, account_type="SAVINGS", balance=1000),
+        Account(account_number="SB300000000002", user_id=user.id, account_type="CURRENT", balance=0)
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+class TestAccountDirectory:
+    def test_publish_and_get(self, directory_path):
+        directory = AccountDirectory(directory_path, capacity=64)
+        account = Account(id=7, account_number="SB000000000007", user_id=3, account_type="CURRENT", is_active=True)
+        directory.publish(account)
+
+        assert directory.get("SB000000000007") == DirectoryEntry(7, 3, True, AccountType.CURRENT, 0)
+        assert directory.get("SB000000000008") is None
+        assert len(directory) == 1
+
+    def test_writes_are_visible_to_other_mappings(self, directory_path):
+        writer = AccountDirectory(directory_path, capacity=64)
+        reader = AccountDirectory(directory_path, capacity=64)
+        account = Account(id=1, account_number="SB000000000001", user_id=1, account_type="SAVINGS", is_active=True)
+        writer.publish(account)
+        assert reader.get("SB000000000001").is_active
+
+        # Deactivation bumps the version, so the reader's local cache is dropped
+        version = reader.version
+        account.is_active = False
+        writer.publish(account)
+        assert reader.version > version
+        assert not reader.get("SB000000000001").is_active
+
+    def test_lookup_falls_back_to_database(self, directory_path, directory_db):
+        directory = AccountDirectory(directory_path, capacity=64)
+        entry = directory.lookup("SB300000000002", directory_db)
+        assert entry.account_type == AccountType.CURRENT
+        assert directory.get("SB300000000002") == entry
+        assert directory.lookup("SB399999999999", directory_db) is None
+
+    def test_load_and_clear(self, directory_path, directory_db):
+        directory = AccountDirectory(directory_path, capacity=64)
+        assert directory.load(directory_db) == 2
+        assert directory.get("SB300000000001") is not None
+        directory.clear()
+        assert len(directory) == 0
+        assert directory.get("SB300000000001") is None
+
+    def test_collisions_probe_linearly(self, directory_path):
+        directory = AccountDirectory(directory_path, capacity=16)
+        for i in range(12):
+            directory.publish(Account(id=i, account_number=f"SB{i:012d}", user_id=i, account_type="FD", is_active=True))
+        assert all(directory.get(f"SB{i:012d}").id == i for i in range(12))
+
+    def test_lookup_is_fast(self, directory_path):
+        directory = AccountDirectory(directory_path, capacity=1024)
+        for i in range(500):
+            directory.publish(Account(id=i, account_number=f"SB{i:012d}", user_id=i, account_type="SAVINGS", is_active=True))
+        start = time.perf_counter()
+        for _ in range(20):
+            for i in range(500):
+                directory.get(f"SB{i:012d}")
+        assert (time.perf_counter() - start) / 10000 < 0.00002
+
+    def test_write_interrupted_by_a_crash(self, directory_path, directory_db):
+        directory = AccountDirectory(directory_path, capacity=64)
+        directory.publish(Account(id=9, account_number="SB000000000009", user_id=1, account_type="FD", is_active=True))
+        # A writer died holding the version odd
+        struct.pack_into("<Q", directory._mm, VERSION_OFFSET, directory.version + 1)
+
+        # Readers give up instead of spinning, and lookups use the database
+        assert directory.get("SB000000000009") is None
+        assert directory.lookup("SB300000000001", directory_db).account_type == AccountType.SAVINGS
+        assert directory.version % 2 == 0
+        assert directory.get("SB000000000009") is None
+        assert len(directory) == 1
+
+        # A process mapping the file later repairs it too
+        struct.pack_into("<Q", directory._mm, VERSION_OFFSET, directory.version + 1)
+        reopened = AccountDirectory(directory_path, capacity=64)
+        assert reopened.version % 2 == 0
+        assert len(reopened) == 0
+
+    def test_file_from_another_database_is_reset(self, directory_path):
+        directory = AccountDirectory(directory_path, capacity=64, identity=1)
+        directory.publish(Account(id=5, account_number="SB000000000005", user_id=1, account_type="FD", is_active=True))
+        assert AccountDirectory(directory_path, capacity=64, identity=1).get("SB000000000005") is not None
+        assert AccountDirectory(directory_path, capacity=64, identity=2).get("SB000000000005") is None
+
+    def test_check_clears_after_restore(self, directory_path, directory_db):
+        directory = AccountDirectory(directory_path, capacity=64)
+        directory.load(directory_db)
+        assert not directory.check(directory_db)
+        assert len(directory) == 2
+
+        # The database went back to a backup without the newest account
+        directory.publish(Account(id=99, account_number="SB000000000099", user_id=1, account_type="FD", is_active=True))
+        assert directory.check(directory_db)
+        assert len(directory) == 0
+        assert directory.get("SB000000000099") is None
+
+    def test_non_power_of_two_capacity(self, directory_path):
+        with pytest.raises(ValueError):
+            AccountDirectory(directory_path, capacity=100)
+
+class TestDirectoryTransfers:
+    def test_transfer_to_deactivated_account(self, directory_db, fresh_account_directory):
+        receiver = directory_db.query(Account).filter(Account.account_number == "SB300000000002").first()
+        receiver.is_active = False
+        directory_db.commit()
+        fresh_account_directory.publish(receiver)
+
+        with pytest.raises(TransferError) as exc:
+            perform_transfer(directory_db, receiver.user_id, "SB300000000001", "SB300000000002", 100)
+        assert exc.value.detail == "Receiver account is inactive"
+
+    def test_transfer_to_same_account(self, directory_db):
+        with pytest.raises(TransferError) as exc:
+            perform_transfer(directory_db, 1, "SB300000000001", "SB300000000001", 100)
+        assert exc.value.status_code == 400
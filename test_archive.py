@@ -0,0 +1,156 @@
+import os
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Account, ArchivedPartition, AuditLog, Transaction, TransactionType, User
+from archive import Archiver, archive_boundary
+from reconcile_ledger import reconcile
+from statements import statement_range, statement_rows
+from auth import create_access_token
+
+NOW = datetime(2025, 6, 15)
+
+@pytest.fixture
+def archive_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/archive.db")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    user = User(email="a@example.com", phone="5550000001", password_hash="-", first_name="A", last_name="B",
+                date_of_birth=datetime(1990, 1, 1), address="Somewhere")
+    db.add(user)
+    db.commit()
+    alice = Account(account_number="SB000000000001", user_id=user.id, account_type="SAVINGS", balance=0)
+    bob = Account(account_number="SB000000000002", user_id=user.id, account_type="SAVINGS", balance=0)
+    db.add_all([alice, bob])
+    db.commit()
+    yield engine, factory, db, alice, bob
+    db.close()
+
+def post(db, from_account, to_account, amount, created_at):
+    # Keeps balances in step so the ledger reconciles
+    if from_account:
+        from_account.balance -= Decimal(amount)
+    to_account.balance += Decimal(amount)
+    db.add(Transaction(
+        transaction_id=f"TXN{uuid.uuid4().hex}",
+        from_account_id=from_account.id if from_account else None,
+        to_account_id=to_account.id,
+        amount=amount,
+        transaction_type=TransactionType.DEPOSIT if from_account is None else TransactionType.TRANSFER,
+        description=None if from_account is None else "Rent",
+        created_at=created_at
+    ))
+    db.commit()
+
+def fill(db, alice, bob):
+    post(db, None, alice, "1000.00", datetime(2025, 1, 5))
+    post(db, alice, bob, "100.25", datetime(2025, 1, 31, 23, 59))
+    post(db, alice, bob, "50.00", datetime(2025, 2, 10))
+    post(db, bob, alice, "20.00", datetime(2025, 5, 1))
+    post(db, alice, bob, "10.00", datetime(2025, 6, 2))
+    db.add(AuditLog(action="login", timestamp=datetime(2025, 1, 2)))
+    db.commit()
+
+class TestArchiver:
+    def test_moves_months_past_retention(self, archive_db, tmp_path):
+        engine, factory, db, alice, bob = archive_db
+        fill(db, alice, bob)
+        archiver = Archiver(factory, directory=str(tmp_path / "cold"), retention_months=2, log=lambda message: None, now=NOW)
+        assert archiver.run() == {"transactions": ["2025-01", "2025-02"], "audit_logs": ["2025-01"]}
+
+        assert db.query(Transaction).count() == 2
+        assert db.query(AuditLog).count() == 0
+        assert os.path.exists(tmp_path / "cold" / "transactions" / "2025-01.npz")
+        partitions = db.query(ArchivedPartition).order_by(ArchivedPartition.id).all()
+        assert [(p.table_name, p.month, p.row_count) for p in partitions] == [
+            ("transactions", "2025-01", 2), ("transactions", "2025-02", 1), ("audit_logs", "2025-01", 1)
+        ]
+        assert all(p.completed_at for p in partitions)
+        assert archive_boundary(db, "transactions") == datetime(2025, 3, 1)
+        # Nothing new is old enough
+        assert archiver.run() == {"transactions": [], "audit_logs": []}
+
+    def test_interrupted_run_finishes_deletes(self, archive_db, tmp_path):
+        engine, factory, db, alice, bob = archive_db
+        fill(db, alice, bob)
+        archiver = Archiver(factory, directory=str(tmp_path / "cold"), retention_months=2, log=lambda message: None, now=NOW)
+        def crash(*args):
+            raise KeyboardInterrupt  # after the file and partition row are written, before any delete
+        archiver._purge = crash
+        with pytest.raises(KeyboardInterrupt):
+            archiver.archive_table("transactions")
+        assert db.query(Transaction).count() == 5
+
+        # Hot leftovers of an archived month count once, not twice
+        result = reconcile(engine, log=lambda message: None)
+        assert result["mismatches"] == [] and result["transactions"] == 5
+
+        Archiver(factory, directory=str(tmp_path / "cold"), retention_months=2, log=lambda message: None, now=NOW).run()
+        assert db.query(Transaction).count() == 2
+        assert db.query(ArchivedPartition).filter(ArchivedPartition.completed_at == None).count() == 0
+
+class TestArchivedReads:
+    def test_reconcile_includes_archive(self, archive_db, tmp_path):
+        engine, factory, db, alice, bob = archive_db
+        fill(db, alice, bob)
+        Archiver(factory, directory=str(tmp_path / "cold"), retention_months=2, log=lambda message: None, now=NOW).run()
+        result = reconcile(engine, log=lambda message: None)
+        assert result["mismatches"] == []
+        assert result["transactions"] == 5
+
+    def test_statement_spans_archive_and_hot(self, archive_db, tmp_path):
+        engine, factory, db, alice, bob = archive_db
+        fill(db, alice, bob)
+        before = statement_rows(db, alice, datetime(2025, 1, 1), datetime(2025, 7, 1))
+        Archiver(factory, directory=str(tmp_path / "cold"), retention_months=2, log=lambda message: None, now=NOW).run()
+        after = statement_rows(db, alice, datetime(2025, 1, 1), datetime(2025, 7, 1))
+        assert after == before
+        assert [(e["direction"], e["amount"]) for e in after] == [
+            ("credit", 1000.0), ("debit", 100.25), ("debit", 50.0), ("credit", 20.0), ("debit", 10.0)
+        ]
+        assert after[0]["from_account"] is None and after[0]["description"] is None
+        assert after[1]["to_account"] == "SB000000000002"
+        assert after[1]["created_at"] == datetime(2025, 1, 31, 23, 59)
+
+        january = statement_rows(db, alice, datetime(2025, 1, 10), datetime(2025, 2, 1))
+        assert [e["amount"] for e in january] == [100.25]
+
+class TestStatementRange:
+    def test_defaults_to_last_30_days(self):
+        assert statement_range(None, None, now=NOW) == (datetime(2025, 5, 16), NOW)
+
+    def test_end_date_is_inclusive(self):
+        assert statement_range(date(2025, 1, 1), date(2025, 1, 31)) == (datetime(2025, 1, 1), datetime(2025, 2, 1))
+
+    def test_rejects_long_or_backwards_ranges(self):
+        with pytest.raises(ValueError):
+            statement_range(date(2024, 1, 1), date(2025, 6, 1))
+        with pytest.raises(ValueError):
+            statement_range(date(2025, 2, 1), date(2025, 1, 1))
+
+class TestStatementEndpoints:
+    def test_json_and_csv(self, client, db_session, test_account, auth_headers):
+        post(db_session, None, test_account, "250.00", datetime(2025, 3, 3))
+        params = {"start": "2025-03-01", "end": "2025-03-31"}
+        data = client.get(f"/api/accounts/{test_account.account_number}/statement", params=params, headers=auth_headers).json()
+        assert [t["amount"] for t in data["transactions"]] == [250.0]
+
+        export = client.get(f"/api/accounts/{test_account.account_number}/statement/export", params=params, headers=auth_headers)
+        assert export.status_code == 200
+        assert export.headers["content-type"].startswith("text/csv")
+        lines = export.text.strip().splitlines()
+        assert lines[0].startswith("created_at,transaction_id")
+        assert len(lines) == 2 and ",250.0," in lines[1]
+
+    def test_other_users_accounts_are_hidden(self, client, db_session, test_account):
+        stranger = User(email="stranger@example.com", phone="5550000009", password_hash="-", first_name="S",
+                        last_name="T", date_of_birth=datetime(1990, 1, 1), address="Elsewhere")
+        db_session.add(stranger)
+        db_session.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': stranger.email})}"}
+        response = client.get(f"/api/accounts/{test_account.account_number}/statement", headers=headers)
+        assert response.status_code == 404
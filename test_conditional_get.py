@@ -0,0 +1,115 @@
+from sqlalchemy import event
+from models import Account, User, UserRole
+from auth import get_password_hash, create_access_token
+import versions
+from versions import VersionCounters, matches
+
+def get_with_etag(client, path, headers, etag=None):
+    if etag:
+        headers = {**headers, "If-None-Match": etag}
+    return client.get(path, headers=headers)
+
+def make_admin(db):
+    admin = User(email="admin@example.com", phone="5550000001", password_hash=get_password_hash("password123"),
+                 first_name="Ad", last_name="Min", date_of_birth="1990-01-01", address="HQ", role=UserRole.ADMIN)
+    db.add(admin)
+    db.commit()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': admin.email})}"}
+
+class TestVersionCounters:
+    def test_bump_changes_etag(self, tmp_path):
+        counters = VersionCounters(str(tmp_path / "v"), slots=64)
+        before = counters.etag("accounts-1", "accounts:1")
+        counters.bump("accounts:2")
+        counters.bump("accounts:1")
+        assert counters.etag("accounts-1", "accounts:1") != before
+
+    def test_counters_are_shared_through_the_file(self, tmp_path):
+        first, second = VersionCounters(str(tmp_path / "v"), slots=64), VersionCounters(str(tmp_path / "v"), slots=64)
+        first.bump("kyc:7")
+        assert second.get("kyc:7") == 1
+        assert first.etag("x", "kyc:7") == second.etag("x", "kyc:7")
+
+    def test_etags_name_the_host(self, tmp_path):
+        here = VersionCounters(str(tmp_path / "v"), slots=64, host="0000aaaa")
+        there = VersionCounters(str(tmp_path / "v"), slots=64, host="0000bbbb")
+        assert here.get("kyc:7") == there.get("kyc:7")
+        assert here.etag("x", "kyc:7") != there.etag("x", "kyc:7")
+
+    def test_weak_comparison(self):
+        assert matches('W/"a-1"', 'W/"a-1"')
+        assert matches('"b", "a-1"', 'W/"a-1"')
+        assert matches("*", 'W/"a-1"')
+        assert not matches('W/"a-2"', 'W/"a-1"')
+        assert not matches(None, 'W/"a-1"')
+
+class TestConditionalGet:
+    def test_etags_can_be_turned_off(self, client, test_account, auth_headers, monkeypatch):
+        monkeypatch.setattr(versions, "ETAGS", False)
+        response = client.get("/api/accounts", headers={**auth_headers, "If-None-Match": "*"})
+        assert response.status_code == 200
+        assert "ETag" not in response.headers
+
+    def test_accounts_304_until_a_transfer(self, client, db_session, test_user, test_account, auth_headers):
+        other = Account(account_number="SB000000000002", user_id=test_user.id, account_type="SAVINGS", balance=0)
+        db_session.add(other)
+        db_session.commit()
+
+        first = client.get("/api/accounts", headers=auth_headers)
+        etag = first.headers["ETag"]
+        assert get_with_etag(client, "/api/accounts", auth_headers, etag).status_code == 304
+
+        response = client.post("/api/transfer", data={
+            "from_account": test_account.account_number, "to_account": other.account_number, "amount": "10"
+        }, headers=auth_headers)
+        assert response.status_code == 200
+        refreshed = get_with_etag(client, "/api/accounts", auth_headers, etag)
+        assert refreshed.status_code == 200
+        assert refreshed.headers["ETag"] != etag
+
+    def test_304_skips_the_query(self, client, db_session, test_user, test_account, auth_headers):
+        etag = client.get("/api/accounts", headers=auth_headers).headers["ETag"]
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+        try:
+            assert get_with_etag(client, "/api/accounts", auth_headers, etag).status_code == 304
+        finally:
+            event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+        assert not any("FROM accounts" in statement for statement in statements)
+
+    def test_kyc_decision_invalidates_status_and_pending(self, client, db_session, test_user, auth_headers):
+        admin_headers = make_admin(db_session)
+        upload = client.post("/api/kyc/upload", data={"document_type": "pan", "document_number": "ABCDE1234F"},
+                             files={"document_file": ("pan.pdf", b"%PDF-1.4", "application/pdf")}, headers=auth_headers)
+        assert upload.status_code == 200
+        status_etag = client.get("/api/kyc/status", headers=auth_headers).headers["ETag"]
+        pending_etag = client.get("/api/admin/kyc/pending", headers=admin_headers).headers["ETag"]
+        assert get_with_etag(client, "/api/admin/kyc/pending", admin_headers, pending_etag).status_code == 304
+
+        document_id = upload.json()["document_id"]
+        assert client.put(f"/api/admin/kyc/{document_id}/approve", headers=admin_headers).status_code == 200
+        assert get_with_etag(client, "/api/kyc/status", auth_headers, status_etag).status_code == 200
+        pending = get_with_etag(client, "/api/admin/kyc/pending", admin_headers, pending_etag)
+        assert pending.status_code == 200 and pending.json() == []
+
+    def test_users_do_not_share_etags(self, client, db_session, test_user, auth_headers):
+        admin_headers = make_admin(db_session)
+        etag = client.get("/api/accounts", headers=auth_headers).headers["ETag"]
+        assert get_with_etag(client, "/api/accounts", admin_headers, etag).status_code == 200
+
+class TestCompression:
+    def test_large_json_is_compressed(self, client, db_session):
+        admin_headers = make_admin(db_session)
+        for n in range(40):
+            db_session.add(User(email=f"bulk{n}@example.com", phone=f"55510{n:05d}", password_hash="-",
+                                first_name="Bulk", last_name=f"User{n}", date_of_birth="1990-01-01", address="Somewhere"))
+        db_session.commit()
+        response = client.get("/api/admin/users", headers={**admin_headers, "Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers.get("content-encoding") in ("gzip", "br")
+        assert len(response.json()) == 41
+
+    def test_small_responses_are_not(self, client, test_user, auth_headers):
+        response = client.get("/api/kyc/status", headers={**auth_headers, "Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
@@ -0,0 +1,79 @@
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from models import Account, KYCDocument, KYCStatus, Transaction, TransactionType
+
+def add_account(db, user, number, balance=1000.00):
+    account = Account(account_number=number, user_id=user.id, account_type="SAVINGS", balance=balance)
+    db.add(account)
+    db.commit()
+    return account
+
+def add_transaction(db, from_account, to_account, amount, created_at=None):
+    db.add(Transaction(
+        transaction_id=str(uuid.uuid4()),
+        from_account_id=from_account.id if from_account else None,
+        to_account_id=to_account.id if to_account else None,
+        amount=amount,
+        transaction_type=TransactionType.TRANSFER,
+        description="Rent",
+        created_at=created_at or datetime.utcnow()
+    ))
+    db.commit()
+
+def count_statements(client, db_session, headers):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        response = client.get("/api/dashboard", headers=headers)
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+    assert response.status_code == 200
+    return len(statements)
+
+class TestDashboard:
+    def test_aggregates_everything_in_one_response(self, client, db_session, test_user, test_account, auth_headers):
+        other = add_account(db_session, test_user, "SB000000000002", balance=500.00)
+        stranger = add_account(db_session, test_user, "SB000000000003")
+        stranger.user_id = test_user.id + 1000
+        db_session.add(KYCDocument(user_id=test_user.id, document_type="pan", document_number="ABCDE1234F",
+                                   status=KYCStatus.PENDING))
+        db_session.commit()
+        add_transaction(db_session, test_account, stranger, 100, datetime.utcnow() - timedelta(days=2))
+        add_transaction(db_session, stranger, other, 50)
+        add_transaction(db_session, test_account, other, 25)
+
+        data = client.get("/api/dashboard", headers=auth_headers).json()
+        assert data["profile"]["email"] == test_user.email
+        assert [a["account_number"] for a in data["accounts"]] == ["SB123456789012", "SB000000000002"]
+        assert data["total_balance"] == 10500.00
+        assert [t["direction"] for t in data["recent_transactions"]] == ["internal", "credit", "debit"]
+        assert data["recent_transactions"][1]["from_account"] == "SB000000000003"
+        assert data["transactions_today"] == 2
+        assert data["kyc"]["status"] == "pending"
+        assert len(data["kyc"]["documents"]) == 1
+
+    def test_new_user_without_accounts(self, client, test_user, auth_headers):
+        data = client.get("/api/dashboard", headers=auth_headers).json()
+        assert data["accounts"] == [] and data["recent_transactions"] == []
+        assert data["kyc"]["status"] == "not_started"
+
+    def test_recent_transactions_are_capped(self, client, db_session, test_user, test_account, auth_headers):
+        other = add_account(db_session, test_user, "SB000000000002")
+        for n in range(15):
+            add_transaction(db_session, test_account, other, n + 1, datetime.utcnow() - timedelta(seconds=n))
+        data = client.get("/api/dashboard", headers=auth_headers).json()
+        assert [t["amount"] for t in data["recent_transactions"]] == [float(n + 1) for n in range(10)]
+        assert data["transactions_today"] == 15
+
+    def test_query_count_does_not_grow_with_data(self, client, db_session, test_user, test_account, auth_headers):
+        baseline = count_statements(client, db_session, auth_headers)
+        for n in range(3):
+            account = add_account(db_session, test_user, f"SB00000000001{n}")
+            for _ in range(5):
+                add_transaction(db_session, test_account, account, 10)
+            db_session.add(KYCDocument(user_id=test_user.id, document_type="pan", document_number=f"ABCDE123{n}F"))
+        db_session.commit()
+        assert count_statements(client, db_session, auth_headers) == baseline
+        assert 0 < baseline <= 6
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from events import EventBroker, publish_after_commit
+import events
+
+class TestEventBroker:
+    def test_publish_reaches_subscriber(self):
+        async def scenario():
+            broker = EventBroker()
+            queue = broker.subscribe(1)
+            other = broker.subscribe(2)
+            broker.publish(1, "balance", {"balance": 10})
+            assert other.empty()
+            return await queue.get()
+
+        assert asyncio.run(scenario()) == {"type": "balance", "data": {"balance": 10}}
+
+    def test_queue_is_bounded_and_drops_oldest(self):
+        async def scenario():
+            broker = EventBroker(queue_size=2)
+            queue = broker.subscribe(1)
+            for i in range(5):
+                broker.publish(1, "balance", {"seq": i})
+            return [queue.get_nowait()["data"]["seq"] for _ in range(queue.qsize())]
+
+        assert asyncio.run(scenario()) == [3, 4]
+
+    def test_publish_from_worker_thread(self):
+        async def scenario():
+            broker = EventBroker()
+            queue = broker.subscribe(1)
+            thread = threading.Thread(target=broker.publish, args=(1, "kyc", {"status": "approved"}))
+            thread.start()
+            thread.join()
+            return await asyncio.wait_for(queue.get(), timeout=1)
+
+        assert asyncio.run(scenario())["data"] == {"status": "approved"}
+
+    def test_stream_formats_events_and_unsubscribes(self):
+        async def scenario():
+            broker = EventBroker()
+            stream = broker.stream(1, heartbeat=0.01)
+            assert await stream.__anext__() == "retry: 5000\n\n"
+            assert await stream.__anext__() == ": keep-alive\n\n"
+            broker.publish(1, "kyc", {"status": "rejected"})
+            chunk = await stream.__anext__()
+            await stream.aclose()
+            return chunk, broker.connection_count()
+
+        chunk, connections = asyncio.run(scenario())
+        assert chunk == 'event: kyc\ndata: {"status": "rejected"}\n\n'
+        assert connections == 0
+
+class TestPublishAfterCommit:
+    @pytest.fixture
+    def session(self):
+        engine = create_engine("sqlite://")
+        session = sessionmaker(bind=engine)()
+        yield session
+        session.close()
+
+    def test_published_only_on_commit(self, session, monkeypatch):
+        published = []
+        monkeypatch.setattr(events.broker, "publish", lambda *args: published.append(args))
+
+        publish_after_commit(session, 1, "balance", {"balance": 5})
+        assert published == []
+        session.commit()
+        assert published == [(1, "balance", {"balance": 5})]
+
+    def test_discarded_on_rollback(self, session, monkeypatch):
+        published = []
+        monkeypatch.setattr(events.broker, "publish", lambda *args: published.append(args))
+
+        session.connection()
+        publish_after_commit(session, 1, "balance", {"balance": 5})
+        session.rollback()
+        session.commit()
+        assert published == []
+
+class TestStreamTickets:
+    @pytest.fixture
+    def finite_stream(self, monkeypatch):
+        streamed = []
+
+        async def stream(user_id):
+            streamed.append(user_id)
+            yield "retry: 5000\n\n"
+
+        monkeypatch.setattr(events.broker, "stream", stream)
+        return streamed
+
+    def test_ticket_opens_one_stream(self, client, test_user, auth_headers, finite_stream):
+        user_id = test_user.id  # The route closes the shared test session
+        ticket = client.post("/api/events/ticket", headers=auth_headers).json()["ticket"]
+        response = client.get("/api/events", params={"ticket": ticket})
+        assert response.status_code == 200
+        assert response.text == "retry: 5000\n\n"
+        assert finite_stream == [user_id]
+
+        # Replayed from a log, the same URL is refused
+        assert client.get("/api/events", params={"ticket": ticket}).status_code == 401
+
+    def test_access_token_is_not_a_ticket(self, client, auth_headers, finite_stream):
+        token = auth_headers["Authorization"].split()[1]
+        assert client.get("/api/events", params={"ticket": token}).status_code == 401
+        assert client.get("/api/events", params={"token": token}).status_code == 422
+        assert finite_stream == []
+
+    def test_ticket_is_not_an_access_token(self, client, auth_headers):
+        ticket = client.post("/api/events/ticket", headers=auth_headers).json()["ticket"]
+        assert client.get("/api/accounts", headers={"Authorization": f"Bearer {ticket}"}).status_code == 401
+
+    def test_ticket_needs_authentication(self, client):
+        assert client.post("/api/events/ticket").status_code in (401, 403)
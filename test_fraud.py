@@ -0,0 +1,110 @@
+import pytest
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Transaction, TransactionType
+from fraud import FraudRules, FraudScorer, AccountFeatures
+
+NOW = 1_700_000_000.0
+
+class TestFraudRules:
+    def test_burst_alone_only_scores(self):
+        scorer = FraudScorer(FraudRules(burst_max_transfers=3))
+        for i in range(10):
+            decision = scorer.evaluate(1, 2, 100, now=NOW + i)
+            assert not decision.blocked
+            scorer.record(1, 2, 100, now=NOW + i)
+        assert decision.score == 0.5
+        assert decision.reasons == ["too many transfers in a short period"]
+
+        decision = scorer.evaluate(1, 3, 30000, now=NOW + 10)
+        assert decision.blocked
+
+    def test_burst_is_blocked(self):
+        scorer = FraudScorer(FraudRules(burst_max_transfers=3, burst_weight=1.0))
+        for i in range(3):
+            assert not scorer.evaluate(1, 2, 100, now=NOW + i).blocked
+            scorer.record(1, 2, 100, now=NOW + i)
+
+        decision = scorer.evaluate(1, 2, 100, now=NOW + 3)
+        assert decision.blocked
+        assert "too many transfers in a short period" in decision.reasons
+
+    def test_burst_window_expires(self):
+        scorer = FraudScorer(FraudRules(burst_max_transfers=3, burst_window_seconds=60))
+        for i in range(3):
+            scorer.record(1, 2, 100, now=NOW + i)
+        assert not scorer.evaluate(1, 2, 100, now=NOW + 200).blocked
+
+    def test_unusual_amount_to_new_payee_is_blocked(self):
+        scorer = FraudScorer(FraudRules(new_payee_min_amount=10000))
+        for i in range(10):
+            scorer.record(1, 2, 500 + i, now=NOW + i * 3600)
+
+        assert not scorer.evaluate(1, 2, 520, now=NOW + 40000).blocked
+        decision = scorer.evaluate(1, 3, 50000, now=NOW + 40000)
+        assert decision.blocked
+        assert set(decision.reasons) == {"unusual amount", "large amount to a new payee"}
+
+    def test_large_amount_to_known_payee_is_allowed(self):
+        scorer = FraudScorer(FraudRules(new_payee_min_amount=10000))
+        scorer.record(1, 2, 40000, now=NOW)
+        assert not scorer.evaluate(1, 2, 40000, now=NOW + 3600).blocked
+
+    def test_disabled_rules_never_block(self):
+        scorer = FraudScorer(FraudRules(enabled=False, burst_max_transfers=1))
+        scorer.record(1, 2, 100, now=NOW)
+        assert not scorer.evaluate(1, 2, 100, now=NOW).blocked
+
+    def test_evaluate_is_fast(self):
+        scorer = FraudScorer()
+        for i in range(1000):
+            scorer.record(i % 50, i % 7, 100 + i, now=NOW + i)
+        start = time.perf_counter()
+        for i in range(1000):
+            scorer.evaluate(i % 50, i % 11, 250, now=NOW + 2000)
+        assert (time.perf_counter() - start) / 1000 < 0.001
+
+class TestAccountFeatures:
+    def test_payee_memory_is_bounded(self):
+        rules = FraudRules(payee_memory=4)
+        features = AccountFeatures()
+        for payee in range(20):
+            features.update(payee, 100, NOW + payee, rules)
+        assert len(features.payees) + len(features.previous_payees) <= 8
+        assert features.knows_payee(19)
+        assert not features.knows_payee(0)
+
+    def test_decayed_mean_tracks_recent_amounts(self):
+        rules = FraudRules(amount_half_life_seconds=3600)
+        features = AccountFeatures()
+        features.update(2, 1000, NOW, rules)
+        for i in range(1, 6):
+            features.update(2, 100, NOW + i * 36000, rules)
+        mean, std = features.amount_stats()
+        assert mean == pytest.approx(100, abs=1)
+
+class TestRebuild:
+    def test_rebuild_from_transactions(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path}/fraud.db")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        now = datetime.utcnow()
+        db.add_all([
+            Transaction(
+                transaction_id=f"TXN{i}",
+                from_account_id=1,
+                to_account_id=2,
+                amount=100,
+                transaction_type=TransactionType.TRANSFER,
+                created_at=now - timedelta(seconds=10 - i)
+            )
+            for i in range(5)
+        ])
+        db.commit()
+
+        scorer = FraudScorer(FraudRules(burst_max_transfers=5, burst_weight=1.0))
+        assert scorer.rebuild(db) == 5
+        assert scorer.evaluate(1, 2, 100).blocked
+        db.close()
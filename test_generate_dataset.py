@@ -0,0 +1,65 @@
+import pytest
+from decimal import Decimal
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from models import Account, KYCDocument, KYCStatus, Transaction, TransactionType, User
+from generate_dataset import DatasetGenerator
+
+SIZES = dict(users=40, accounts=70, transactions=600, hot_accounts=3, hot_share=0.5)
+
+def generate(path, seed=7, **overrides):
+    engine = create_engine(f"sqlite:///{path}")
+    options = {**SIZES, **overrides}
+    DatasetGenerator(engine, seed=seed, log=lambda msg: None, **options).run()
+    return sessionmaker(bind=engine)()
+
+def snapshot(db):
+    return (
+        [(a.account_number, a.user_id, a.account_type, a.balance) for a in db.query(Account).order_by(Account.id)],
+        [(t.from_account_id, t.to_account_id, t.amount, t.created_at) for t in db.query(Transaction).order_by(Transaction.id)],
+        [(k.user_id, k.status) for k in db.query(KYCDocument).order_by(KYCDocument.id)]
+    )
+
+class TestDatasetGenerator:
+    def test_row_counts(self, tmp_path):
+        db = generate(tmp_path / "a.db")
+        assert db.query(User).count() == 40
+        assert db.query(Account).count() == 70
+        assert db.query(Transaction).count() == 70 + 600
+        assert db.query(KYCDocument).count() == 48
+        # Every user owns at least one account
+        assert db.query(func.count(func.distinct(Account.user_id))).scalar() == 40
+        db.close()
+
+    def test_same_seed_same_data(self, tmp_path):
+        first = snapshot(generate(tmp_path / "a.db"))
+        # Write batch size does not change the random streams
+        assert snapshot(generate(tmp_path / "c.db", batch_size=17)) == first
+        assert snapshot(generate(tmp_path / "d.db", seed=8)) != first
+
+    def test_balances_reconcile_with_ledger(self, tmp_path):
+        db = generate(tmp_path / "a.db")
+        credits = dict(db.query(Transaction.to_account_id, func.sum(Transaction.amount)).group_by(Transaction.to_account_id))
+        debits = dict(db.query(Transaction.from_account_id, func.sum(Transaction.amount))
+                      .filter(Transaction.transaction_type == TransactionType.TRANSFER)
+                      .group_by(Transaction.from_account_id))
+        for account in db.query(Account):
+            expected = Decimal(str(credits.get(account.id, 0))) - Decimal(str(debits.get(account.id, 0)))
+            assert account.balance == expected.quantize(Decimal("0.01"))
+            assert account.balance >= 0
+        db.close()
+
+    def test_hot_accounts_and_kyc_skew(self, tmp_path):
+        db = generate(tmp_path / "a.db", users=400, accounts=400, transactions=2000)
+        top = db.query(func.count(Transaction.id)).filter(
+            Transaction.transaction_type == TransactionType.TRANSFER
+        ).group_by(Transaction.to_account_id).order_by(func.count(Transaction.id).desc()).limit(3).all()
+        assert sum(count for (count,) in top) > 2000 * 0.4
+        statuses = dict(db.query(KYCDocument.status, func.count(KYCDocument.id)).group_by(KYCDocument.status))
+        assert statuses[KYCStatus.APPROVED] > statuses[KYCStatus.PENDING] > statuses[KYCStatus.REJECTED]
+        db.close()
+
+    def test_refuses_non_empty_database(self, tmp_path):
+        generate(tmp_path / "a.db").close()
+        with pytest.raises(SystemExit):
+            generate(tmp_path / "a.db")
@@ -0,0 +1,93 @@
+import io
+import json
+import pytest
+from decimal import Decimal
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Account, KYCDocument, KYCStatus, Transaction, User
+from import_customers import CustomerImporter, read_rows, validate_row
+from auth import verify_password
+
+def customer(i, **overrides):
+    row = {
+        "email": f"legacy{i}@example.com",
+        "phone": f"98{i:08d}",
+        "password": "password123",
+        "first_name": "Legacy",
+        "last_name": f"Customer{i}",
+        "date_of_birth": "1985-06-15",
+        "address": "Legacy Address"
+    }
+    row.update(overrides)
+    return row
+
+@pytest.fixture
+def import_session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/import.db")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class TestValidation:
+    def test_uses_registration_rules(self):
+        _, errors = validate_row(customer(1, phone="12345"))
+        assert errors == ["phone: Value error, Phone number must be 10 digits"]
+
+    def test_rejects_unknown_account_type(self):
+        _, errors = validate_row(customer(1, account_type="LOAN"))
+        assert errors[0].startswith("account_type")
+
+    def test_accepts_account_and_kyc(self):
+        parsed, errors = validate_row(customer(1, account_type="savings", opening_balance="2500.5",
+                                               document_type="PAN", document_number="ABCDE1234F"))
+        assert errors == []
+        assert parsed["account"]["opening_balance"] == Decimal("2500.50")
+        assert parsed["kyc"]["document_type"] == "pan"
+
+class TestCustomerImporter:
+    def test_imports_in_chunks(self, import_session_factory):
+        rows = [(i, customer(i, account_type="SAVINGS", opening_balance="1000",
+                             document_type="aadhar", document_number=f"1234{i:08d}")) for i in range(25)]
+        importer = CustomerImporter(import_session_factory, chunk_size=10, workers=2, log=lambda msg: None)
+        assert importer.run(rows) == (25, 0)
+
+        db = import_session_factory()
+        assert db.query(User).count() == 25
+        assert db.query(Account).count() == 25
+        assert db.query(KYCDocument).filter(KYCDocument.status == KYCStatus.PENDING).count() == 25
+        assert db.query(Transaction).count() == 25
+        user = db.query(User).filter(User.email == "legacy3@example.com").first()
+        assert verify_password("password123", user.password_hash)
+        db.close()
+
+    def test_bad_and_duplicate_rows_go_to_reject_file(self, import_session_factory):
+        rejects = io.StringIO()
+        rows = [
+            (2, customer(1)),
+            (3, customer(2, email="not-an-email")),
+            (4, customer(3, email="legacy1@example.com")),
+            (5, customer(4))
+        ]
+        importer = CustomerImporter(import_session_factory, chunk_size=10, workers=1, rejects=rejects, log=lambda msg: None)
+        assert importer.run(rows) == (2, 2)
+
+        rejected = [json.loads(line) for line in rejects.getvalue().splitlines()]
+        assert [r["line"] for r in rejected] == [3, 4]
+        assert rejected[1]["errors"] == ["email: already registered"]
+        assert "password" not in rejected[0]["row"]
+
+    def test_existing_users_are_rejected(self, import_session_factory):
+        CustomerImporter(import_session_factory, workers=1, log=lambda msg: None).run([(1, customer(1))])
+        importer = CustomerImporter(import_session_factory, workers=1, log=lambda msg: None)
+        assert importer.run([(1, customer(1, phone="9000000001")), (2, customer(2))]) == (1, 1)
+
+class TestReadRows:
+    def test_reads_csv_and_ndjson(self, tmp_path):
+        csv_path = tmp_path / "customers.csv"
+        csv_path.write_text("email,phone\na@example.com,1234567890\n")
+        assert list(read_rows(str(csv_path))) == [(2, {"email": "a@example.com", "phone": "1234567890"})]
+
+        ndjson_path = tmp_path / "customers.ndjson"
+        ndjson_path.write_text('{"email": "a@example.com"}\n\nnot json\n')
+        rows = list(read_rows(str(ndjson_path)))
+        assert rows[0] == (1, {"email": "a@example.com"})
+        assert "_error" in rows[1][1]
@@ -0,0 +1,81 @@
+import pytest
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Account, BatchCheckpoint, Transaction, TransactionType, User
+from accrue_interest import accrue_interest, JOB_NAME
+from auth import get_password_hash
+
+RUN_DATE = date(2025, 1, 31)
+
+@pytest.fixture
+def interest_session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/interest.db")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    user = User(
+        email="saver@example.com",
+        phone="3333333333",
+        password_hash=get_password_hash("password123"),
+        first_name="Saver",
+        last_name="User",
+        date_of_birth=datetime(1990, 1, 1),
+        address="Saver Address"
+    )
+    db.add(user)
+    db.commit()
+    db.add_all([
+        Account(account_number="SB400000000001", user_id=user.id, account_type="SAVINGS", balance=365000),
+        Account(account_number="SB400000000002", user_id=user.id, account_type="FD", balance=100000),
+        Account(account_number="SB400000000003", user_id=user.id, account_type="CURRENT", balance=365000),
+        Account(account_number="SB400000000004", user_id=user.id, account_type="SAVINGS", balance=0),
+        Account(account_number="SB400000000005", user_id=user.id, account_type="SAVINGS", balance=365000, is_active=False)
+    ])
+    db.commit()
+    db.close()
+    return factory
+
+def balances(factory):
+    db = factory()
+    try:
+        return {acc.account_number: acc.balance for acc in db.query(Account).all()}
+    finally:
+        db.close()
+
+class TestInterestAccrual:
+    def test_accrues_savings_and_fd(self, interest_session_factory):
+        credited = accrue_interest(interest_session_factory, RUN_DATE, chunk_size=2, sleep_ratio=0, log=lambda msg: None)
+        assert credited == 2
+
+        after = balances(interest_session_factory)
+        assert after["SB400000000001"] == Decimal("365035.00")
+        assert after["SB400000000002"] == Decimal("100018.49")
+        assert after["SB400000000003"] == Decimal("365000.00")
+        assert after["SB400000000004"] == Decimal("0.00")
+        assert after["SB400000000005"] == Decimal("365000.00")
+
+        db = interest_session_factory()
+        ledger = db.query(Transaction).order_by(Transaction.to_account_id).all()
+        assert [t.transaction_type for t in ledger] == [TransactionType.INTEREST] * 2
+        assert ledger[0].transaction_id.startswith("INT20250131-")
+        assert ledger[0].amount == Decimal("35.00")
+        assert ledger[0].from_account_id is None
+        db.close()
+
+    def test_rerun_same_day_is_noop(self, interest_session_factory):
+        accrue_interest(interest_session_factory, RUN_DATE, sleep_ratio=0, log=lambda msg: None)
+        assert accrue_interest(interest_session_factory, RUN_DATE, sleep_ratio=0, log=lambda msg: None) == 0
+        assert balances(interest_session_factory)["SB400000000001"] == Decimal("365035.00")
+
+    def test_resumes_after_checkpoint(self, interest_session_factory):
+        # A previous run crashed after finishing account ids 1 and 2
+        db = interest_session_factory()
+        db.add(BatchCheckpoint(job_name=JOB_NAME, run_key=RUN_DATE.isoformat(), last_id=2))
+        db.commit()
+        db.close()
+
+        assert accrue_interest(interest_session_factory, RUN_DATE, chunk_size=1, sleep_ratio=0, log=lambda msg: None) == 0
+        after = balances(interest_session_factory)
+        assert after["SB400000000001"] == Decimal("365000.00")
@@ -0,0 +1,130 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, KYCDocument, KYCDuplicateFlag, User
+from auth import get_password_hash, create_access_token
+from kyc_duplicates import (
+    check_document_hash_key, document_number_hash, dhash_bands, flag_exact_duplicates, flags_for, record_dhash, dhash_of
+)
+
+def make_user(db, n, role="CUSTOMER"):
+    user = User(
+        email=f"dup{n}@example.com",
+        phone=f"555000{n:04d}",
+        password_hash=get_password_hash("password123"),
+        first_name="Dup",
+        last_name=f"User{n}",
+        date_of_birth=datetime(1990, 1, 1),
+        address="Somewhere",
+        role=role
+    )
+    db.add(user)
+    db.commit()
+    return user
+
+def headers_for(user):
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': user.email})}"}
+
+@pytest.fixture
+def dup_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/dups.db")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+
+def add_document(db, user, number="ABCDE1234F", content_hash=None, dhash=None):
+    document = KYCDocument(user_id=user.id, document_type="pan", document_number=number, content_hash=content_hash)
+    db.add(document)
+    db.flush()
+    flag_exact_duplicates(db, document)
+    db.commit()
+    if dhash is not None:
+        record_dhash(db, document.id, dhash)
+    return document
+
+class TestDocumentNumberHash:
+    def test_normalizes_formatting(self):
+        assert document_number_hash("PAN", "abcde-1234 f") == document_number_hash("pan", "ABCDE1234F")
+        assert document_number_hash("aadhar", "1234 5678 9012") == document_number_hash("aadhar", "123456789012")
+
+    def test_type_is_part_of_the_key(self):
+        assert document_number_hash("pan", "123456789012") != document_number_hash("aadhar", "123456789012")
+
+    def test_missing_key_is_reported(self, monkeypatch, caplog):
+        monkeypatch.delenv("SMARTBANK_DOCUMENT_HASH_KEY", raising=False)
+        with caplog.at_level("WARNING", logger="kyc_duplicates"):
+            assert not check_document_hash_key()
+        assert "SMARTBANK_DOCUMENT_HASH_KEY is not set" in caplog.text
+
+        caplog.clear()
+        monkeypatch.setenv("SMARTBANK_DOCUMENT_HASH_KEY", "dedicated")
+        assert check_document_hash_key()
+        assert caplog.text == ""
+
+class TestDuplicateFlags:
+    def test_flags_same_number_and_file_across_users(self, dup_db):
+        alice, bob = make_user(dup_db, 1), make_user(dup_db, 2)
+        first = add_document(dup_db, alice, content_hash="f" * 64)
+        second = add_document(dup_db, bob, number="abcde 1234f", content_hash="f" * 64)
+
+        flags = dup_db.query(KYCDuplicateFlag).order_by(KYCDuplicateFlag.reason).all()
+        assert [(f.document_id, f.duplicate_of_id, f.reason) for f in flags] == [
+            (second.id, first.id, "content"),
+            (second.id, first.id, "document_number")
+        ]
+
+    def test_same_user_resubmission_is_not_flagged(self, dup_db):
+        alice = make_user(dup_db, 1)
+        add_document(dup_db, alice)
+        add_document(dup_db, alice)
+        assert dup_db.query(KYCDuplicateFlag).count() == 0
+
+    def test_near_duplicate_images(self, dup_db):
+        alice, bob, carol = make_user(dup_db, 1), make_user(dup_db, 2), make_user(dup_db, 3)
+        original = add_document(dup_db, alice, number="AAAAA0000A", dhash=0x0123456789ABCDEF)
+        # Three bits flipped in one band: shares the other three bands
+        near = add_document(dup_db, bob, number="BBBBB0000B", dhash=0x0123456789ABCDEF ^ 0b111)
+        # Every band differs
+        add_document(dup_db, carol, number="CCCCC0000C", dhash=0x0123456789ABCDEF ^ 0x0001000100010001 * 0xFF)
+
+        flags = dup_db.query(KYCDuplicateFlag).all()
+        assert [(f.document_id, f.duplicate_of_id, f.reason, f.distance) for f in flags] == [
+            (near.id, original.id, "perceptual", 3)
+        ]
+        assert dup_db.get(KYCDocument, near.id).dhash_band_0 == dhash_bands(0x0123456789ABCDEF ^ 0b111)[0]
+
+    def test_flags_are_listed_for_both_documents(self, dup_db):
+        alice, bob = make_user(dup_db, 1), make_user(dup_db, 2)
+        first = add_document(dup_db, alice)
+        second = add_document(dup_db, bob)
+        flags = flags_for(dup_db, [first.id, second.id])
+        assert flags[first.id] == [{"document_id": second.id, "reason": "document_number", "distance": None}]
+        assert flags[second.id] == [{"document_id": first.id, "reason": "document_number", "distance": None}]
+
+class TestDuplicateUploads:
+    def test_pending_listing_shows_flags(self, client, db_session):
+        alice, bob = make_user(db_session, 1), make_user(db_session, 2)
+        admin = make_user(db_session, 3, role="ADMIN")
+        for user in (alice, bob):
+            response = client.post(
+                "/api/kyc/upload",
+                data={"document_type": "aadhar", "document_number": "1234 5678 9012"},
+                files={"document_file": (f"scan{user.id}.pdf", b"%PDF-1.4 same scan", "application/pdf")},
+                headers=headers_for(user)
+            )
+            assert response.status_code == 200
+
+        pending = client.get("/api/admin/kyc/pending", headers=headers_for(admin)).json()
+        reasons = {doc["user_id"]: sorted(flag["reason"] for flag in doc["duplicate_flags"]) for doc in pending}
+        assert reasons == {alice.id: ["content", "document_number"], bob.id: ["content", "document_number"]}
+
+class TestPerceptualHash:
+    def test_dhash_is_stable_under_rescaling(self, tmp_path):
+        Image = pytest.importorskip("PIL.Image")
+        gradient = Image.linear_gradient("L").rotate(30).convert("RGB")
+        gradient.save(tmp_path / "big.png")
+        gradient.resize((64, 64)).save(tmp_path / "small.jpg", quality=70)
+        big, small = dhash_of(str(tmp_path / "big.png")), dhash_of(str(tmp_path / "small.jpg"))
+        assert bin(big ^ small).count("1") <= 6
@@ -0,0 +1,116 @@
+import os
+import pytest
+from datetime import datetime
+from models import User, KYCDocument
+from auth import get_password_hash, create_access_token
+from kyc_previews import PreviewCache, PreviewService, content_hash_of
+import kyc_previews
+
+def fake_render(path):
+    # Stands in for Pillow/PyMuPDF; runs in the worker process
+    with open(path, "rb") as source:
+        return b"preview:" + source.read()[:16], ".png"
+
+def failing_render(path):
+    raise ValueError("cannot decode")
+
+@pytest.fixture
+def fake_previews(monkeypatch, tmp_path):
+    service = PreviewService(PreviewCache(str(tmp_path / "previews"), max_bytes=1 << 20), workers=1, renderer=fake_render)
+    monkeypatch.setattr(kyc_previews, "previews", service)
+    yield service
+    service.shutdown()
+
+@pytest.fixture
+def admin_headers(db_session):
+    admin = User(
+        email="previews-admin@example.com",
+        phone="1212121212",
+        password_hash=get_password_hash("admin123"),
+        first_name="Admin",
+        last_name="User",
+        date_of_birth=datetime(1980, 1, 1),
+        address="Admin Address",
+        role="ADMIN"
+    )
+    db_session.add(admin)
+    db_session.commit()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': admin.email})}"}
+
+@pytest.fixture
+def uploaded_document(db_session, test_user, tmp_path):
+    path = tmp_path / "scan.png"
+    path.write_bytes(b"\x89PNG fake scan data")
+    document = KYCDocument(user_id=test_user.id, document_type="pan", document_number="ABCDE1234F", document_path=str(path))
+    db_session.add(document)
+    db_session.commit()
+    return document
+
+class TestPreviewCache:
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = PreviewCache(str(tmp_path), max_bytes=250)
+        for index, name in enumerate(["a", "b", "c"]):
+            os.utime(cache.put(name, b"x" * 100, ".jpg"), (1000 + index, 1000 + index))
+        # Everything fits except the oldest entry
+        assert cache.get("a") is None
+        assert cache.get("b") is not None  # now the most recently used
+        cache.put("d", b"x" * 100, ".jpg")
+        assert cache.get("c") is None
+        assert cache.get("b") is not None and cache.get("d") is not None
+        assert cache.size() == 200
+
+class TestPreviewService:
+    def test_renders_once_then_serves_from_cache(self, tmp_path):
+        source = tmp_path / "doc.png"
+        source.write_bytes(b"original document")
+        service = PreviewService(PreviewCache(str(tmp_path / "cache")), workers=1, renderer=fake_render)
+        try:
+            path = service.ensure("abc", str(source)).result(timeout=30)
+            assert open(path, "rb").read() == b"preview:original documen"
+            source.unlink()
+            assert service.ensure("abc", str(source)).result(timeout=30) == path
+        finally:
+            service.shutdown()
+
+    def test_renderer_errors_surface_on_the_future(self, tmp_path):
+        service = PreviewService(PreviewCache(str(tmp_path / "cache")), workers=1, renderer=failing_render)
+        try:
+            with pytest.raises(ValueError):
+                service.ensure("abc", str(tmp_path / "doc.png")).result(timeout=30)
+        finally:
+            service.shutdown()
+
+    def test_unsupported_without_renderer(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(kyc_previews, "Image", None)
+        service = PreviewService(PreviewCache(str(tmp_path / "cache")), workers=1)
+        assert service.ensure("abc", str(tmp_path / "doc.png")).result(timeout=5) is None
+
+class TestPreviewEndpoint:
+    def test_preview_is_cacheable(self, client, admin_headers, uploaded_document, fake_previews):
+        response = client.get(f"/api/admin/kyc/{uploaded_document.id}/preview", headers=admin_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/png"
+        assert response.content.startswith(b"preview:")
+        etag = response.headers["etag"]
+        assert etag == f'"{content_hash_of(uploaded_document.document_path)}"'
+        assert "immutable" in response.headers["cache-control"]
+
+        response = client.get(f"/api/admin/kyc/{uploaded_document.id}/preview",
+                              headers={**admin_headers, "If-None-Match": etag})
+        assert response.status_code == 304
+
+    def test_preview_requires_admin(self, client, auth_headers, uploaded_document):
+        response = client.get(f"/api/admin/kyc/{uploaded_document.id}/preview", headers=auth_headers)
+        assert response.status_code == 403
+
+    def test_upload_records_content_hash(self, client, auth_headers, db_session):
+        response = client.post(
+            "/api/kyc/upload",
+            data={"document_type": "pan", "document_number": "ABCDE1234F"},
+            files={"document_file": ("scan.pdf", b"%PDF-1.4 content", "application/pdf")},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        document = db_session.get(KYCDocument, response.json()["document_id"])
+        assert document.content_hash == content_hash_of(document.document_path)
+        os.remove(document.document_path)
@@ -0,0 +1,114 @@
+import asyncio
+import time
+import pytest
+from sqlalchemy import create_engine, text
+import fraud
+import load_shedding
+from models import Account
+from load_shedding import CRITICAL, LOW, NORMAL, AdaptiveLimiter, DeadlineExceeded, deadline, priority_of
+
+class TestPriorities:
+    def test_routes(self):
+        assert priority_of("POST", "/api/login") == CRITICAL
+        assert priority_of("POST", "/api/transfers") == CRITICAL
+        assert priority_of("GET", "/api/transfers/abc") == NORMAL
+        assert priority_of("GET", "/api/admin/users") == LOW
+        assert priority_of("GET", "/api/accounts/SB1/statement/export") == LOW
+
+class TestAdaptiveLimiter:
+    def test_sheds_low_priority_first_and_queues_critical(self):
+        async def scenario():
+            limiter = AdaptiveLimiter(initial=4, minimum=4)
+            assert [await limiter.acquire(NORMAL) for _ in range(3)] == [True, True, True]
+            # Low may only fill half the limit and never queues
+            assert not await limiter.acquire(LOW)
+            assert await limiter.acquire(CRITICAL)
+            waiting = asyncio.ensure_future(limiter.acquire(CRITICAL))
+            await asyncio.sleep(0)
+            assert limiter.queued() == 1
+            limiter.release(0.01)
+            assert await waiting and limiter.in_flight == 4
+            return limiter
+        limiter = asyncio.run(scenario())
+        assert limiter.shed == [0, 0, 1] and limiter.admitted == 5
+
+    def test_queue_wait_times_out(self, monkeypatch):
+        monkeypatch.setattr(load_shedding, "PRIORITY_QUEUE_SECONDS", (0.01, 0.01, 0.0))
+        async def scenario():
+            limiter = AdaptiveLimiter(initial=1, minimum=1)
+            assert await limiter.acquire(CRITICAL)
+            assert not await limiter.acquire(CRITICAL)
+            return limiter
+        limiter = asyncio.run(scenario())
+        assert limiter.queued() == 0 and limiter.shed[CRITICAL] == 1
+
+    def test_limit_follows_latency(self):
+        limiter = AdaptiveLimiter(initial=20, minimum=4, maximum=100)
+        limiter.in_flight = 20
+        for _ in range(50):
+            limiter.in_flight += 1
+            limiter.release(0.01)
+        grown = limiter.limit
+        assert grown > 20
+        for _ in range(50):
+            limiter.in_flight += 1
+            limiter.release(0.5)
+        assert limiter.limit < grown / 2
+        assert limiter.retry_after() >= 1
+
+class TestDeadlines:
+    def test_statements_stop_at_the_deadline(self, tmp_path):
+        load_shedding.install()
+        engine = create_engine(f"sqlite:///{tmp_path}/deadline.db")
+        endless = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n"
+        with engine.connect() as conn:
+            with deadline(0.05):
+                with pytest.raises(Exception, match="interrupted"):
+                    conn.execute(text(endless))
+            with deadline(-1):
+                with pytest.raises(DeadlineExceeded):
+                    conn.execute(text("SELECT 1"))
+            # Without a deadline the handler lets statements run
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+
+    def test_cut_short(self):
+        assert load_shedding.cut_short(DeadlineExceeded())
+        assert not load_shedding.cut_short(RuntimeError("interrupted"))
+        with deadline(-1):
+            # sqlite3 reports "interrupted", MySQL error 3024; either way the deadline did it
+            assert load_shedding.cut_short(RuntimeError("interrupted"))
+
+class TestLoadSheddingMiddleware:
+    def test_busy_server_sheds_listings_but_admits_login(self, client, fresh_limiter):
+        fresh_limiter.in_flight = fresh_limiter.allowed(LOW)
+        response = client.get("/api/admin/users")
+        assert response.status_code == 503 and int(response.headers["Retry-After"]) >= 1
+        login = client.post("/api/login", json={"email": "nobody@example.com", "password": "x"})
+        assert login.status_code == 401
+        assert fresh_limiter.snapshot()["shed"]["low"] == 1
+
+    def test_expired_deadline_returns_503(self, client, auth_headers, fresh_limiter):
+        response = client.get("/api/accounts", headers={**auth_headers, "X-Request-Timeout-Ms": "0"})
+        assert response.status_code == 503
+        assert response.json()["detail"] == "Request deadline exceeded"
+        assert fresh_limiter.in_flight == 0
+
+    def test_transfer_past_its_deadline_returns_503(self, client, auth_headers, test_account, db_session, monkeypatch):
+        receiver = Account(account_number="SB123456789013", user_id=test_account.user_id, account_type="CURRENT",
+                           balance=0)
+        db_session.add(receiver)
+        db_session.commit()
+        evaluate = fraud.scorer.evaluate
+
+        def slow_evaluate(*args):
+            time.sleep(0.3)
+            return evaluate(*args)
+
+        monkeypatch.setattr(fraud.scorer, "evaluate", slow_evaluate)
+        response = client.post("/api/transfer", headers={**auth_headers, "X-Request-Timeout-Ms": "200"}, data={
+            "from_account": test_account.account_number, "to_account": receiver.account_number, "amount": "10"
+        })
+        # Not a 500 "Transfer failed": the client should retry
+        assert response.status_code == 503
+        assert response.json()["detail"] == "Request deadline exceeded"
+        assert int(response.headers["Retry-After"]) >= 1
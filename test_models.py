@@ -1,7 +1,9 @@
 import pytest
 from datetime import datetime, date
+from sqlalchemy import create_engine, inspect, text
 from models import User, Account, KYCDocument
 from auth import get_password_hash
+from main import add_missing_columns
 
 class TestUserModel:
     def test_create_user(self, db_session):
@@ -195,3 +197,22 @@ class TestModelRelationships:
         doc_types = [doc.document_type for doc in test_user.kyc_documents]
         assert "aadhaar" in doc_types
         assert "pan" in doc_types
+
+class TestSchemaUpgrade:
+    def test_columns_added_to_existing_tables(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        with engine.begin() as conn:
+            # accounts as it was before striping
+            conn.execute(text(
+                "CREATE TABLE accounts (id INTEGER PRIMARY KEY, account_number VARCHAR(20), user_id INTEGER, "
+                "account_type VARCHAR(7), balance NUMERIC(15, 2), daily_limit NUMERIC(10, 2), "
+                "is_active BOOLEAN, created_at DATETIME)"
+            ))
+            conn.execute(text("INSERT INTO accounts (id, account_number, balance) VALUES (1, 'ACC1', 100)"))
+
+        tables = [Account.__table__, KYCDocument.__table__]
+        assert add_missing_columns(engine, tables) == ["accounts.stripe_count"]
+        assert "stripe_count" in {column["name"] for column in inspect(engine).get_columns("accounts")}
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT stripe_count, balance FROM accounts")).one() == (None, 100)
+        assert add_missing_columns(engine, tables) == []
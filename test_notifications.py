@@ -0,0 +1,160 @@
+import pytest
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Account, KYCDocument, OutboxMessage, OutboxStatus, User, UserRole
+from notifications import NotificationDispatcher, StubSender, notify, outbox_counts
+from transfers import TransferError, perform_transfer
+from auth import create_access_token
+
+@pytest.fixture
+def outbox_session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/outbox.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture
+def users(outbox_session_factory):
+    db = outbox_session_factory()
+    alice = User(email="alice@example.com", phone="5550000001", password_hash="-", first_name="Alice",
+                 last_name="A", date_of_birth=datetime(1990, 1, 1), address="Somewhere")
+    bob = User(email="bob@example.com", phone="5550000002", password_hash="-", first_name="Bob",
+               last_name="B", date_of_birth=datetime(1990, 1, 1), address="Elsewhere")
+    db.add_all([alice, bob])
+    db.commit()
+    db.add_all([
+        Account(account_number="SB200000000001", user_id=alice.id, account_type="SAVINGS", balance=1000),
+        Account(account_number="SB200000000002", user_id=bob.id, account_type="SAVINGS", balance=0)
+    ])
+    db.commit()
+    ids = alice.id, bob.id
+    db.close()
+    return ids
+
+def outbox(session_factory):
+    db = session_factory()
+    try:
+        return db.query(OutboxMessage).order_by(OutboxMessage.id).all()
+    finally:
+        db.close()
+
+def make_due(session_factory):
+    db = session_factory()
+    db.query(OutboxMessage).update({OutboxMessage.next_attempt_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    db.close()
+
+class TestOutbox:
+    def test_transfer_writes_outbox_in_same_transaction(self, outbox_session_factory, users):
+        alice, bob = users
+        db = outbox_session_factory()
+        perform_transfer(db, alice, "SB200000000001", "SB200000000002", 100)
+        with pytest.raises(TransferError):
+            perform_transfer(db, alice, "SB200000000001", "SB200000000002", 5000)
+        db.close()
+
+        rows = outbox(outbox_session_factory)
+        assert [(row.user_id, row.channel, row.event_type) for row in rows] == [
+            (alice, "email", "transfer.debit"), (alice, "sms", "transfer.debit"),
+            (bob, "email", "transfer.credit"), (bob, "sms", "transfer.credit")
+        ]
+        assert all(row.status == OutboxStatus.PENDING for row in rows)
+
+    def test_kyc_decision_queues_notification(self, client, db_session, test_user):
+        admin = User(email="admin@example.com", phone="5550000003", password_hash="-", first_name="Admin",
+                     last_name="A", date_of_birth=datetime(1990, 1, 1), address="Office", role=UserRole.ADMIN)
+        document = KYCDocument(user_id=test_user.id, document_type="pan", document_number="ABCDE1234F")
+        db_session.add_all([admin, document])
+        db_session.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': admin.email})}"}
+        assert client.put(f"/api/admin/kyc/{document.id}/approve", headers=headers).status_code == 200
+
+        rows = db_session.query(OutboxMessage).filter(OutboxMessage.user_id == test_user.id).all()
+        assert {(row.channel, row.event_type) for row in rows} == {("email", "kyc.approved"), ("sms", "kyc.approved")}
+        metrics = client.get("/api/admin/notifications/metrics", headers=headers).json()
+        assert metrics["pending"] == 2 and metrics["sent"] == 0
+
+class TestNotificationDispatcher:
+    def test_sends_to_each_channel_recipient(self, outbox_session_factory, users):
+        alice, bob = users
+        db = outbox_session_factory()
+        notify(db, alice, "kyc.approved", {"document_id": 7})
+        db.commit()
+        db.close()
+
+        senders = {"email": StubSender("email"), "sms": StubSender("sms")}
+        dispatcher = NotificationDispatcher(senders=senders, session_factory=outbox_session_factory)
+        assert dispatcher.dispatch_once() == 2
+        assert [n["recipient"] for n in senders["email"].sent] == ["alice@example.com"]
+        assert [n["recipient"] for n in senders["sms"].sent] == ["5550000001"]
+        assert senders["sms"].sent[0]["payload"] == {"document_id": 7}
+        assert all(row.status == OutboxStatus.SENT and row.sent_at for row in outbox(outbox_session_factory))
+        # Nothing is due any more
+        assert dispatcher.dispatch_once() == 0
+
+    def test_failures_back_off_then_fail(self, outbox_session_factory, users):
+        alice, bob = users
+        db = outbox_session_factory()
+        notify(db, alice, "transfer.debit", {}, channels=["email"])
+        db.commit()
+        db.close()
+
+        sender = StubSender("email", fail_times=2)
+        dispatcher = NotificationDispatcher(senders={"email": sender}, session_factory=outbox_session_factory,
+                                            max_attempts=2, retry_base=60)
+        assert dispatcher.send_batch(dispatcher.claim_batch()) == {"sent": 0, "retrying": 1, "failed": 0}
+        row = outbox(outbox_session_factory)[0]
+        assert row.status == OutboxStatus.PENDING and row.attempts == 1
+        assert row.next_attempt_at > datetime.utcnow() + timedelta(seconds=20)
+        assert row.last_error == "email stub failure"
+        assert dispatcher.dispatch_once() == 0  # not due yet
+
+        make_due(outbox_session_factory)
+        assert dispatcher.send_batch(dispatcher.claim_batch()) == {"sent": 0, "retrying": 0, "failed": 1}
+        assert outbox(outbox_session_factory)[0].status == OutboxStatus.FAILED
+
+    def test_expired_claim_is_claimed_again(self, outbox_session_factory, users):
+        alice, bob = users
+        db = outbox_session_factory()
+        notify(db, alice, "transfer.credit", {}, channels=["sms"])
+        db.commit()
+        db.close()
+
+        dispatcher = NotificationDispatcher(senders={"sms": StubSender("sms")}, session_factory=outbox_session_factory)
+        assert len(dispatcher.claim_batch()) == 1  # the process dies before sending
+        assert outbox(outbox_session_factory)[0].status == OutboxStatus.SENDING
+        assert dispatcher.claim_batch() == []
+        make_due(outbox_session_factory)
+        assert dispatcher.dispatch_once() == 1
+        assert outbox(outbox_session_factory)[0].status == OutboxStatus.SENT
+
+    def test_sender_concurrency_is_limited(self, outbox_session_factory, users):
+        alice, bob = users
+        db = outbox_session_factory()
+        for index in range(12):
+            notify(db, bob, "transfer.credit", {"index": index}, channels=["webhook"])
+        db.commit()
+        db.close()
+
+        class SlowSender(StubSender):
+            in_flight = peak = 0
+            lock = threading.Lock()
+
+            def send(self, notification):
+                with self.lock:
+                    SlowSender.in_flight += 1
+                    SlowSender.peak = max(SlowSender.peak, SlowSender.in_flight)
+                time.sleep(0.02)
+                with self.lock:
+                    SlowSender.in_flight -= 1
+                super().send(notification)
+
+        sender = SlowSender("webhook", concurrency=3)
+        dispatcher = NotificationDispatcher(senders={"webhook": sender}, session_factory=outbox_session_factory)
+        assert dispatcher.dispatch_once() == 12
+        dispatcher.stop()
+        assert len(sender.sent) == 12
+        assert 1 < SlowSender.peak <= 3
+        assert outbox_counts(outbox_session_factory())["sent"] == 12
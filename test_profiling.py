@@ -0,0 +1,65 @@
+import os
+import time
+from auth import create_access_token, get_password_hash
+from models import User, UserRole
+import profiling
+from profiling import Profile, ProfileStore, wants_profile
+
+def make_admin(db):
+    admin = User(email="admin@example.com", phone="5550000001", password_hash=get_password_hash("password123"),
+                 first_name="Ad", last_name="Min", date_of_birth="1990-01-01", address="HQ", role=UserRole.ADMIN)
+    db.add(admin)
+    db.commit()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': admin.email})}"}
+
+class TestOptIn:
+    def test_flag_from_header_or_query(self):
+        assert wants_profile({"headers": [(b"x-profile", b"1")], "query_string": b""})
+        assert wants_profile({"headers": [], "query_string": b"granularity=day&profile=true"})
+        assert not wants_profile({"headers": [(b"x-profile", b"0")], "query_string": b""})
+        assert not wants_profile({"headers": [], "query_string": b"profiles=1"})
+
+class TestProfilingMiddleware:
+    def test_admin_request_is_profiled_and_stored(self, client, db_session, fresh_profile_store, monkeypatch):
+        monkeypatch.setattr(profiling, "PROFILE_SAMPLE_HZ", 1000)
+        headers = make_admin(db_session)
+        response = client.get("/api/admin/users", headers={**headers, "X-Profile": "1"})
+        assert response.status_code == 200
+        profile_id = response.headers["X-Profile-Id"]
+        assert not profiling.listening()
+
+        profile = client.get(f"/api/admin/profiles/{profile_id}", headers=headers).json()
+        assert (profile["method"], profile["path"], profile["status_code"]) == ("GET", "/api/admin/users", 200)
+        assert any(query["statement"].startswith("SELECT") for query in profile["queries"])
+        assert profile["query_count"] == len(profile["queries"])
+
+        folded = client.get(f"/api/admin/profiles/{profile_id}", params={"format": "folded"}, headers=headers)
+        assert folded.headers["content-type"].startswith("text/plain")
+        for line in folded.text.splitlines():
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0
+        assert [p["profile_id"] for p in client.get("/api/admin/profiles", headers=headers).json()] == [profile_id]
+
+    def test_flag_is_ignored_without_admin(self, client, auth_headers, fresh_profile_store):
+        response = client.get("/api/accounts", headers={**auth_headers, "X-Profile": "1"})
+        assert response.status_code == 200
+        assert "X-Profile-Id" not in response.headers
+        assert fresh_profile_store.list() == []
+        assert client.get("/api/admin/profiles", headers=auth_headers).status_code == 403
+
+class TestProfileStore:
+    def test_retention_by_age_and_count(self, tmp_path):
+        store = ProfileStore(str(tmp_path), retention_hours=1, max_files=2)
+        saved = []
+        for _ in range(3):
+            profile = Profile("GET", "/api/accounts")
+            profile.stop()
+            store.save(profile)
+            saved.append(profile.profile_id)
+        assert len(store.list()) == 2
+
+        stale = time.time() - 2 * 3600
+        os.utime(tmp_path / f"{saved[2]}.json", (stale, stale))
+        store.prune()
+        assert store.get(saved[2]) is None
+        assert store.get("../../etc/passwd") is None
@@ -0,0 +1,65 @@
+import pytest
+from decimal import Decimal
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Account, AccountBalanceStripe, ShardTransferLeg, Transaction, TransactionType
+from generate_dataset import DatasetGenerator
+from reconcile_ledger import reconcile, write_report
+from transfers import perform_transfer
+import striping
+
+@pytest.fixture
+def ledger_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/ledger.db")
+    DatasetGenerator(engine, seed=3, users=30, accounts=50, transactions=400, log=lambda msg: None).run()
+    return engine
+
+def run(engine):
+    return reconcile(engine, chunk_size=64, log=lambda msg: None)
+
+class TestReconciliation:
+    def test_generated_dataset_reconciles(self, ledger_engine):
+        result = run(ledger_engine)
+        assert result["accounts"] == 50
+        assert result["transactions"] == 450
+        assert result["mismatches"] == []
+        assert result["orphaned_account_ids"] == []
+
+    def test_reports_drifted_balance(self, ledger_engine, tmp_path):
+        db = sessionmaker(bind=ledger_engine)()
+        db.query(Account).filter(Account.id == 7).update({Account.balance: Account.balance + Decimal("0.01")})
+        db.commit()
+        db.close()
+
+        result = run(ledger_engine)
+        assert [(m["account_id"], m["difference"]) for m in result["mismatches"]] == [(7, 0.01)]
+        assert result["mismatches"][0]["account_number"] == "SB100000000007"
+
+        report = tmp_path / "mismatches.csv"
+        write_report(str(report), result["mismatches"])
+        assert report.read_text().splitlines()[1].startswith("7,SB100000000007,")
+
+    def test_transfers_stripes_and_shard_legs_reconcile(self, ledger_engine):
+        db = sessionmaker(autocommit=False, autoflush=False, bind=ledger_engine)()
+        sender = db.get(Account, 1)
+        striping.set_stripe_count(db, db.get(Account, 2), 4)
+        perform_transfer(db, sender.user_id, sender.account_number, "SB100000000002", Decimal("12.34"))
+        # A cross-shard credit applied on this database
+        db.get(Account, 3).balance += Decimal("5.00")
+        db.add(ShardTransferLeg(transfer_id="XS1", leg="credit", account_id=3, amount=Decimal("5.00")))
+        db.commit()
+        db.close()
+        assert run(ledger_engine)["mismatches"] == []
+
+    def test_pending_postings_and_orphans(self, ledger_engine):
+        db = sessionmaker(bind=ledger_engine)()
+        db.add(Transaction(transaction_id="PEND1", to_account_id=4, amount=10,
+                           transaction_type=TransactionType.DEPOSIT, status="pending"))
+        db.add(Transaction(transaction_id="ORPH1", to_account_id=999, amount=10,
+                           transaction_type=TransactionType.DEPOSIT))
+        db.commit()
+        db.close()
+
+        result = run(ledger_engine)
+        assert result["mismatches"] == []
+        assert result["orphaned_account_ids"] == [999]
@@ -0,0 +1,138 @@
+import pytest
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import Delete, Select, create_engine, event
+from sqlalchemy.orm import sessionmaker
+from models import Base, Account, AccountRollup, Transaction, TransactionType, User
+from rollups import backfill, history
+from transfers import perform_transfer
+
+TODAY = datetime.utcnow().date()
+
+@pytest.fixture
+def rollup_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/rollups.db")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    user = User(email="r@example.com", phone="5550000001", password_hash="-", first_name="R", last_name="U",
+                date_of_birth=datetime(1990, 1, 1), address="Somewhere")
+    db.add(user)
+    db.commit()
+    alice = Account(account_number="SB700000000001", user_id=user.id, account_type="SAVINGS", balance=1000)
+    bob = Account(account_number="SB700000000002", user_id=user.id, account_type="SAVINGS", balance=0)
+    db.add_all([alice, bob])
+    db.commit()
+    yield factory, db, user.id, alice, bob
+    db.close()
+
+def rows(db, period="day"):
+    db.expire_all()
+    return {(r.account_id, r.period_start): (r.debits, r.credits, r.transaction_count, r.closing_balance)
+            for r in db.query(AccountRollup).filter(AccountRollup.period == period)}
+
+def post(db, from_account, to_account, amount, created_at):
+    # A ledger row from a bulk job that bypasses the live rollups
+    if from_account:
+        from_account.balance -= Decimal(amount)
+    to_account.balance += Decimal(amount)
+    db.add(Transaction(transaction_id=uuid.uuid4().hex, from_account_id=from_account.id if from_account else None,
+                       to_account_id=to_account.id, amount=amount, transaction_type=TransactionType.TRANSFER,
+                       created_at=created_at))
+    db.commit()
+
+class TestLiveRollups:
+    def test_transfers_update_day_and_month(self, rollup_db):
+        factory, db, user_id, alice, bob = rollup_db
+        perform_transfer(db, user_id, "SB700000000001", "SB700000000002", 100)
+        perform_transfer(db, user_id, "SB700000000001", "SB700000000002", "50.50")
+        perform_transfer(db, user_id, "SB700000000002", "SB700000000001", 20)
+
+        assert rows(db) == {
+            (alice.id, TODAY): (Decimal("150.50"), Decimal("20.00"), 3, Decimal("869.50")),
+            (bob.id, TODAY): (Decimal("20.00"), Decimal("150.50"), 3, Decimal("130.50")),
+        }
+        assert rows(db, "month")[(alice.id, TODAY.replace(day=1))] == rows(db)[(alice.id, TODAY)]
+
+    def test_failed_transfer_leaves_no_rollup(self, rollup_db):
+        factory, db, user_id, alice, bob = rollup_db
+        with pytest.raises(Exception):
+            perform_transfer(db, user_id, "SB700000000001", "SB700000000002", 5000)
+        assert rows(db) == {}
+
+class TestBackfill:
+    def test_rebuilds_closing_balances_from_ledger(self, rollup_db):
+        factory, db, user_id, alice, bob = rollup_db
+        today = date(2025, 3, 10)
+        post(db, None, alice, 500, datetime(2025, 2, 27, 9))
+        post(db, alice, bob, 200, datetime(2025, 3, 1, 12))
+        post(db, alice, bob, 100, datetime(2025, 3, 1, 18))
+        post(db, bob, alice, 50, datetime(2025, 3, 9))
+
+        assert backfill(factory, days=30, log=lambda message: None, today=today) == 8
+        assert rows(db) == {
+            (alice.id, date(2025, 2, 27)): (0, Decimal("500.00"), 1, Decimal("1500.00")),
+            (alice.id, date(2025, 3, 1)): (Decimal("300.00"), 0, 2, Decimal("1200.00")),
+            (alice.id, date(2025, 3, 9)): (0, Decimal("50.00"), 1, Decimal("1250.00")),
+            (bob.id, date(2025, 3, 1)): (0, Decimal("300.00"), 2, Decimal("300.00")),
+            (bob.id, date(2025, 3, 9)): (Decimal("50.00"), 0, 1, Decimal("250.00")),
+        }
+        assert rows(db, "month")[(alice.id, date(2025, 3, 1))] == (Decimal("300.00"), Decimal("50.00"), 3, Decimal("1250.00"))
+        # Idempotent
+        backfill(factory, days=30, log=lambda message: None, today=today)
+        assert len(rows(db)) == 5
+
+    def test_chunks_lock_accounts_before_reading_the_ledger(self, rollup_db):
+        factory, db, user_id, alice, bob = rollup_db
+        post(db, alice, bob, 100, datetime.combine(TODAY, datetime.min.time()))
+        steps = []
+
+        def before_execute(conn, clause, *args):
+            if isinstance(clause, Select) and clause._for_update_arg is not None:
+                steps.append("lock")
+            elif isinstance(clause, Select) and "transactions" in {t.name for t in clause.get_final_froms()}:
+                steps.append("ledger")
+            elif isinstance(clause, Delete):
+                steps.append("delete")
+
+        engine = db.get_bind()
+        event.listen(engine, "before_execute", before_execute)
+        event.listen(engine, "commit", lambda conn: steps.append("commit"))
+        try:
+            backfill(factory, days=1, chunk_size=1, log=lambda message: None, today=TODAY)
+        finally:
+            event.remove(engine, "before_execute", before_execute)
+        steps = [step for i, step in enumerate(steps) if i == 0 or steps[i - 1] != step]
+        # A live upsert committed between a chunk's ledger read and its DELETE would be lost
+        assert steps[:9] == ["commit", "lock", "ledger", "delete", "commit", "lock", "ledger", "delete", "commit"]
+        assert rows(db)[(bob.id, TODAY)] == (0, Decimal("100.00"), 1, Decimal("100.00"))
+
+class TestHistory:
+    def test_downsamples_and_carries_balance_forward(self, rollup_db):
+        factory, db, user_id, alice, bob = rollup_db
+        post(db, None, alice, 500, datetime(2025, 2, 27, 9))
+        post(db, alice, bob, 200, datetime(2025, 3, 4))
+        post(db, alice, bob, 100, datetime(2025, 3, 5))
+        backfill(factory, days=30, log=lambda message: None, today=date(2025, 3, 10))
+
+        days = history(db, alice, "day", date(2025, 2, 26), date(2025, 3, 5))
+        assert [p["closing_balance"] for p in days] == [None, 1500.0, 1500.0, 1500.0, 1500.0, 1500.0, 1300.0, 1200.0]
+        weeks = history(db, alice, "week", date(2025, 2, 24), date(2025, 3, 9))
+        assert [(str(p["period_start"]), p["debits"], p["credits"], p["closing_balance"]) for p in weeks] == [
+            ("2025-02-24", 0.0, 500.0, 1500.0), ("2025-03-03", 300.0, 0.0, 1200.0)
+        ]
+        months = history(db, alice, "month", end=date(2025, 3, 31))
+        assert len(months) == 12
+        assert [(p["transaction_count"], p["closing_balance"]) for p in months[-2:]] == [(1, 1500.0), (2, 1200.0)]
+        with pytest.raises(ValueError):
+            history(db, alice, "hour")
+
+    def test_endpoint(self, client, test_account, auth_headers):
+        response = client.get(f"/api/accounts/{test_account.account_number}/history", params={"granularity": "week"},
+                              headers=auth_headers)
+        assert response.status_code == 200
+        assert len(response.json()["points"]) == 26
+        bad = client.get(f"/api/accounts/{test_account.account_number}/history", params={"granularity": "year"},
+                         headers=auth_headers)
+        assert bad.status_code == 400
@@ -0,0 +1,187 @@
+import pytest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from models import Account, User, ShardTransfer, ShardTransferLeg, ShardTransferStatus
+from sharding import ShardedSessionFactory, ShardTransferError
+from auth import get_password_hash
+
+@pytest.fixture
+def shards(tmp_path):
+    urls = [f"sqlite:///{tmp_path}/shard{i}.db" for i in range(3)]
+    factory = ShardedSessionFactory(urls)
+    factory.create_all()
+    return factory
+
+def make_account(shards, user_id, balance):
+    db = shards.session_for_user(user_id)
+    user = User(
+        id=user_id,
+        email=f"shard{user_id}@example.com",
+        phone=f"{user_id:010d}",
+        password_hash=get_password_hash("password123"),
+        first_name="Shard",
+        last_name="User",
+        date_of_birth=datetime(1990, 1, 1),
+        address="Shard Address"
+    )
+    account = Account(
+        account_number=shards.new_account_number(user_id),
+        user_id=user_id,
+        account_type="SAVINGS",
+        balance=balance
+    )
+    db.add_all([user, account])
+    db.commit()
+    account_number = account.account_number
+    db.close()
+    return account_number
+
+def balance_of(shards, account_number):
+    db = shards.session_for_account(account_number)
+    try:
+        return db.query(Account).filter(Account.account_number == account_number).first().balance
+    finally:
+        db.close()
+
+class TestShardRouting:
+    def test_account_number_routes_to_user_shard(self, shards):
+        for user_id in range(1, 10):
+            account_number = shards.new_account_number(user_id)
+            assert shards.shard_for_account(account_number) == shards.shard_for_user(user_id)
+
+    def test_accounts_stored_on_own_shard(self, shards):
+        account_number = make_account(shards, 4, 100)
+        other = (shards.shard_for_user(4) + 1) % shards.shard_count
+        db = shards.session(other)
+        assert db.query(Account).filter(Account.account_number == account_number).first() is None
+        db.close()
+
+class TestCrossShardTransfer:
+    def test_cross_shard_transfer_completes(self, shards):
+        sender = make_account(shards, 1, 1000)
+        receiver = make_account(shards, 2, 500)
+
+        result = shards.transfer(sender, receiver, 250, user_id=1)
+        assert result["status"] == "completed"
+        assert balance_of(shards, sender) == Decimal("750.00")
+        assert balance_of(shards, receiver) == Decimal("750.00")
+
+    def test_same_shard_transfer(self, shards):
+        sender = make_account(shards, 1, 1000)
+        receiver = make_account(shards, 4, 0)
+
+        result = shards.transfer(sender, receiver, 100, user_id=1)
+        assert result["transfer_id"] is None
+        assert balance_of(shards, receiver) == Decimal("100.00")
+
+    def test_insufficient_funds_marks_failed(self, shards):
+        sender = make_account(shards, 1, 100)
+        receiver = make_account(shards, 2, 0)
+
+        with pytest.raises(ShardTransferError) as exc:
+            shards.transfer(sender, receiver, 500, user_id=1)
+        assert exc.value.status_code == 400
+
+        db = shards.coordinator_session()
+        assert db.query(ShardTransfer).one().status == ShardTransferStatus.FAILED
+        db.close()
+        assert balance_of(shards, sender) == Decimal("100.00")
+
+    def test_missing_receiver_is_compensated(self, shards):
+        sender = make_account(shards, 1, 1000)
+        receiver = shards.new_account_number(2)  # never created
+
+        result = shards.transfer(sender, receiver, 300, user_id=1)
+        assert result["status"] == "compensated"
+        assert balance_of(shards, sender) == Decimal("1000.00")
+
+    def test_refund_reaches_a_deactivated_sender(self, shards):
+        sender = make_account(shards, 1, 1000)
+        receiver = shards.new_account_number(2)  # never created
+        debit = shards._apply_debit
+
+        def debit_then_deactivate(transfer):
+            debit(transfer)
+            db = shards.session_for_account(sender)
+            db.query(Account).filter(Account.account_number == sender).update({Account.is_active: False})
+            db.commit()
+            db.close()
+
+        shards._apply_debit = debit_then_deactivate
+        result = shards.transfer(sender, receiver, 300, user_id=1)
+        assert result["status"] == "compensated"
+        assert balance_of(shards, sender) == Decimal("1000.00")
+
+class TestRecovery:
+    def _log(self, shards, sender, receiver, status):
+        db = shards.coordinator_session()
+        db.add(ShardTransfer(
+            transfer_id="XS-crashed",
+            from_account=sender,
+            to_account=receiver,
+            amount=Decimal("200.00"),
+            user_id=1,
+            status=status,
+            updated_at=datetime.utcnow() - timedelta(minutes=5)
+        ))
+        db.commit()
+        db.close()
+
+    def test_recover_debited_transfer_applies_credit(self, shards):
+        sender = make_account(shards, 1, 800)
+        receiver = make_account(shards, 2, 0)
+        self._log(shards, sender, receiver, ShardTransferStatus.DEBITED)
+
+        # Simulate the debit leg that committed before the crash
+        db = shards.session_for_account(sender)
+        account = db.query(Account).filter(Account.account_number == sender).first()
+        db.add(ShardTransferLeg(transfer_id="XS-crashed", leg="debit", account_id=account.id, amount=Decimal("200.00")))
+        db.commit()
+        db.close()
+
+        assert shards.recover_in_doubt_transfers() == {"completed": 1}
+        assert balance_of(shards, receiver) == Decimal("200.00")
+        # Running recovery again is a no-op
+        assert shards.recover_in_doubt_transfers() == {}
+        assert balance_of(shards, receiver) == Decimal("200.00")
+
+    def test_recovery_skips_transfers_claimed_by_another_process(self, shards):
+        sender = make_account(shards, 1, 800)
+        receiver = make_account(shards, 2, 0)
+        self._log(shards, sender, receiver, ShardTransferStatus.PENDING)
+
+        other = ShardedSessionFactory([str(engine.url) for engine in shards.engines])
+        cutoff = datetime.utcnow()
+        assert other._claim("XS-crashed", cutoff)
+        assert not shards._claim("XS-crashed", cutoff)
+        assert shards.recover_in_doubt_transfers() == {}
+
+    def test_recovery_error_does_not_stop_the_others(self, shards, monkeypatch):
+        sender = make_account(shards, 1, 800)
+        receiver = make_account(shards, 2, 0)
+        self._log(shards, sender, receiver, ShardTransferStatus.PENDING)
+        db = shards.coordinator_session()
+        db.add(ShardTransfer(transfer_id="XS-broken", from_account=sender, to_account=receiver,
+                             amount=Decimal("1.00"), user_id=1, status=ShardTransferStatus.PENDING,
+                             updated_at=datetime.utcnow() - timedelta(minutes=5)))
+        db.commit()
+        db.close()
+
+        has_leg = shards._has_leg
+
+        def flaky_has_leg(account_number, transfer_id, leg):
+            if transfer_id == "XS-broken":
+                raise RuntimeError("shard unreachable")
+            return has_leg(account_number, transfer_id, leg)
+
+        monkeypatch.setattr(shards, "_has_leg", flaky_has_leg)
+        assert shards.recover_in_doubt_transfers() == {"failed": 1, "error": 1}
+
+    def test_recover_pending_without_debit_fails(self, shards):
+        sender = make_account(shards, 1, 800)
+        receiver = make_account(shards, 2, 0)
+        self._log(shards, sender, receiver, ShardTransferStatus.PENDING)
+
+        assert shards.recover_in_doubt_transfers() == {"failed": 1}
+        assert balance_of(shards, sender) == Decimal("800.00")
+        assert balance_of(shards, receiver) == Decimal("0.00")
@@ -0,0 +1,60 @@
+from sqlalchemy import create_engine, text
+from auth import create_access_token, get_password_hash
+from models import User, UserRole
+import slow_queries
+from slow_queries import SlowQueryLog, fingerprint, normalize
+
+def make_admin(db):
+    admin = User(email="admin@example.com", phone="5550000001", password_hash=get_password_hash("password123"),
+                 first_name="Ad", last_name="Min", date_of_birth="1990-01-01", address="HQ", role=UserRole.ADMIN)
+    db.add(admin)
+    db.commit()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': admin.email})}"}
+
+class TestFingerprints:
+    def test_literals_and_lists_collapse(self):
+        assert normalize("SELECT * FROM accounts\n WHERE id IN (?, ?, ?) AND account_number = 'SB1'  LIMIT 10") == \
+            "SELECT * FROM accounts WHERE id IN (...) AND account_number = ? LIMIT ?"
+        assert normalize("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)") == "INSERT INTO t (a, b) VALUES (...)"
+        assert normalize("SELECT users_1.id FROM users AS users_1 WHERE users_1.email = %(email_1)s") == \
+            "SELECT users_1.id FROM users AS users_1 WHERE users_1.email = ?"
+        assert fingerprint(normalize("SELECT 1 WHERE x IN (?)")) == fingerprint(normalize("SELECT 2 WHERE x IN (?, ?)"))
+
+class TestSlowQueryLog:
+    def test_records_fingerprints_and_explains_once(self, tmp_path, fresh_slow_query_log):
+        engine = create_engine(f"sqlite:///{tmp_path}/slow.db")
+        fresh_slow_query_log.threshold_ms = 0
+        slow_queries.install()
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)"))
+            for i in range(3):
+                conn.execute(text("SELECT * FROM items WHERE name = :name"), {"name": f"item {i}"})
+        fresh_slow_query_log.wait()
+
+        [entry] = [e for e in fresh_slow_query_log.top() if e["statement"] == "SELECT * FROM items WHERE name = ?"]
+        assert entry["count"] == 3 and entry["max_ms"] <= entry["total_ms"]
+        assert any("SCAN" in line for line in entry["explain"])
+        assert not any(e["statement"].startswith("EXPLAIN") for e in fresh_slow_query_log.top(limit=100))
+
+    def test_keeps_the_worst_offenders(self):
+        log = SlowQueryLog(threshold_ms=0, capacity=2, explain=False)
+        log.record(None, "SELECT a FROM t", (), 50)
+        log.record(None, "SELECT b FROM t", (), 5)
+        log.record(None, "SELECT c FROM t", (), 20)
+        assert [e["statement"] for e in log.top()] == ["SELECT a FROM t", "SELECT c FROM t"]
+        assert log.evicted == 1
+        assert [e["statement"] for e in log.top("count", limit=1)] == ["SELECT a FROM t"]
+
+class TestSlowQueryEndpoint:
+    def test_admin_sees_top_offenders(self, client, db_session, auth_headers, fresh_slow_query_log):
+        fresh_slow_query_log.threshold_ms = 0
+        headers = make_admin(db_session)
+        client.get("/api/admin/users", headers=headers)
+        report = client.get("/api/admin/slow-queries", params={"order": "count"}, headers=headers).json()
+        assert report["threshold_ms"] == 0 and report["tracked"] > 0
+        assert any("FROM users" in e["statement"] for e in report["fingerprints"])
+
+        assert client.get("/api/admin/slow-queries", params={"order": "rows"}, headers=headers).status_code == 400
+        assert client.get("/api/admin/slow-queries", headers=auth_headers).status_code == 403
+        assert client.delete("/api/admin/slow-queries", headers=headers).status_code == 200
+        assert len(fresh_slow_query_log) == 0
@@ -0,0 +1,137 @@
+import pytest
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from models import (Base, Account, InstructionFrequency, InstructionStatus, StandingInstruction, Transaction,
+                    User)
+import standing_instructions
+from standing_instructions import advance, create_instruction, run_due_instructions
+
+FIRST = datetime(2025, 2, 1)
+
+@pytest.fixture
+def si_session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/instructions.db")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    users = [User(email=f"{name}@example.com", phone=f"555000000{index}", password_hash="-", first_name=name,
+                  last_name="X", date_of_birth=datetime(1990, 1, 1), address="Somewhere")
+             for index, name in enumerate(["alice", "bob", "carol"])]
+    db.add_all(users)
+    db.commit()
+    db.add_all([
+        Account(account_number="SB600000000001", user_id=users[0].id, account_type="SAVINGS", balance=150),
+        Account(account_number="SB600000000002", user_id=users[1].id, account_type="SAVINGS", balance=0),
+        Account(account_number="SB600000000003", user_id=users[2].id, account_type="SAVINGS", balance=0)
+    ])
+    db.commit()
+    yield factory, db, [user.id for user in users]
+    db.close()
+
+def instruct(db, user_id, from_account, to_account, amount, frequency="monthly", start_at=FIRST, end_at=None):
+    return create_instruction(db, user_id, from_account, to_account, amount, frequency, start_at, end_at).id
+
+def balances(db):
+    db.expire_all()
+    return {a.account_number: a.balance for a in db.query(Account).order_by(Account.account_number)}
+
+def run(factory, now):
+    return run_due_instructions(factory, now=now, log=lambda message: None)
+
+class TestSchedule:
+    def test_monthly_keeps_anchor_day(self):
+        due = advance(datetime(2025, 1, 31), InstructionFrequency.MONTHLY, 31)
+        assert due == datetime(2025, 2, 28)
+        assert advance(due, InstructionFrequency.MONTHLY, 31) == datetime(2025, 3, 31)
+        assert advance(datetime(2025, 12, 5), InstructionFrequency.MONTHLY, 5) == datetime(2026, 1, 5)
+        assert advance(datetime(2025, 1, 1), InstructionFrequency.WEEKLY, 1) == datetime(2025, 1, 8)
+
+class TestScheduler:
+    def test_batch_runs_in_order_per_account(self, si_session_factory):
+        factory, db, (alice, bob, carol) = si_session_factory
+        rent = instruct(db, alice, "SB600000000001", "SB600000000002", 100)
+        sip = instruct(db, alice, "SB600000000001", "SB600000000003", 100)
+        # Funded by the rent paid earlier in the same batch
+        onward = instruct(db, bob, "SB600000000002", "SB600000000003", 80)
+
+        result = run(factory, FIRST)
+        assert (result["executed"], result["retrying"]) == (2, 1)
+        assert balances(db) == {"SB600000000001": Decimal("50.00"), "SB600000000002": Decimal("20.00"),
+                                "SB600000000003": Decimal("80.00")}
+        assert {t.transaction_id for t in db.query(Transaction)} == {f"SI{rent}-202502010000", f"SI{onward}-202502010000"}
+
+        db.expire_all()
+        paid, waiting = db.get(StandingInstruction, rent), db.get(StandingInstruction, sip)
+        assert paid.due_at == paid.next_run_at == datetime(2025, 3, 1) and paid.runs == 1
+        assert waiting.due_at == FIRST and waiting.retries == 1 and waiting.last_error == "Insufficient funds"
+        assert waiting.next_run_at == datetime(2025, 2, 1, 6)
+        # Nothing more is due at the same time, so nothing is paid twice
+        assert run(factory, FIRST)["executed"] == 0
+
+    def test_retries_then_skips_the_occurrence(self, si_session_factory, monkeypatch):
+        factory, db, (alice, bob, carol) = si_session_factory
+        monkeypatch.setattr(standing_instructions, "INSTRUCTION_MAX_RETRIES", 1)
+        emi = instruct(db, alice, "SB600000000001", "SB600000000002", 500)
+        assert run(factory, FIRST)["retrying"] == 1
+        assert run(factory, datetime(2025, 2, 1, 6))["skipped"] == 1
+
+        db.expire_all()
+        instruction = db.get(StandingInstruction, emi)
+        assert instruction.due_at == datetime(2025, 3, 1) and instruction.retries == 0 and instruction.runs == 0
+        assert instruction.last_error == "Skipped 2025-02-01: insufficient funds"
+        assert db.query(Transaction).count() == 0
+
+    def test_catch_up_end_date_and_pause(self, si_session_factory):
+        factory, db, (alice, bob, carol) = si_session_factory
+        daily = instruct(db, alice, "SB600000000001", "SB600000000002", 10, "daily",
+                         end_at=datetime(2025, 2, 3))
+        paused = instruct(db, alice, "SB600000000001", "SB600000000003", 10)
+        db.query(Account).filter(Account.account_number == "SB600000000003").update({Account.is_active: False})
+        db.commit()
+
+        result = run(factory, datetime(2025, 2, 5))
+        assert (result["executed"], result["paused"]) == (3, 1)
+        db.expire_all()
+        assert db.get(StandingInstruction, daily).status == InstructionStatus.COMPLETED
+        assert db.get(StandingInstruction, daily).runs == 3
+        assert db.get(StandingInstruction, paused).status == InstructionStatus.PAUSED
+        assert balances(db)["SB600000000002"] == Decimal("30.00")
+
+    def test_statement_count_does_not_grow_with_batch(self, si_session_factory):
+        factory, db, (alice, bob, carol) = si_session_factory
+        for _ in range(3):
+            instruct(db, alice, "SB600000000001", "SB600000000002", 1)
+        statements = []
+        engine = db.get_bind()
+        event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        run(factory, FIRST)
+        small = len(statements)
+
+        for _ in range(30):
+            instruct(db, alice, "SB600000000001", "SB600000000002", 1, start_at=datetime(2025, 3, 1))
+        statements.clear()
+        run(factory, datetime(2025, 3, 1))
+        assert len(statements) == small
+
+class TestStandingInstructionEndpoints:
+    def test_create_list_cancel(self, client, test_account, auth_headers, db_session):
+        payee = Account(account_number="SB600000000009", user_id=test_account.user_id + 1000,
+                        account_type="SAVINGS", balance=0)
+        db_session.add(payee)
+        db_session.commit()
+        form = {"from_account": test_account.account_number, "to_account": "SB600000000009", "amount": "2500",
+                "frequency": "monthly", "start_date": "2099-01-31", "description": "Rent"}
+        response = client.post("/api/standing-instructions", data=form, headers=auth_headers)
+        assert response.status_code == 201
+        created = response.json()
+        assert created["next_due_at"].startswith("2099-01-31") and created["status"] == "active"
+
+        bad = client.post("/api/standing-instructions", data={**form, "frequency": "hourly"}, headers=auth_headers)
+        assert bad.status_code == 400
+        listed = client.get("/api/standing-instructions", headers=auth_headers).json()
+        assert [i["instruction_id"] for i in listed] == [created["instruction_id"]]
+
+        assert client.delete(f"/api/standing-instructions/{created['instruction_id']}", headers=auth_headers).status_code == 200
+        assert client.get("/api/standing-instructions", headers=auth_headers).json()[0]["status"] == "cancelled"
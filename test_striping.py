@@ -0,0 +1,123 @@
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+from decimal import Decimal
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Account, AccountBalanceStripe, User
+from transfers import TransferError, perform_transfer
+from auth import get_password_hash
+import dashboard
+import striping
+import transfers
+
+@pytest.fixture
+def striping_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/striping.db")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    user = User(
+        email="merchant@example.com",
+        phone="7777777777",
+        password_hash=get_password_hash("password123"),
+        first_name="Merchant",
+        last_name="User",
+        date_of_birth=datetime(1990, 1, 1),
+        address="Merchant Address"
+    )
+    session.add(user)
+    session.commit()
+    session.add_all([
+        Account(account_number="SB200000000001", user_id=user.id, account_type="SAVINGS", balance=1000),
+        Account(account_number="SB200000000002", user_id=user.id, account_type="CURRENT", balance=500)
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+def account(db, number):
+    return db.query(Account).filter(Account.account_number == number).first()
+
+class TestBalanceStriping:
+    def test_enable_moves_balance_into_stripes(self, striping_db):
+        hot = account(striping_db, "SB200000000002")
+        striping.set_stripe_count(striping_db, hot, 4)
+
+        assert hot.stripe_count == 4
+        assert float(hot.balance) == 0
+        assert striping_db.query(AccountBalanceStripe).filter(AccountBalanceStripe.account_id == hot.id).count() == 4
+        assert striping.balance_of(striping_db, hot) == Decimal("500.00")
+
+    def test_credits_spread_and_aggregate(self, striping_db):
+        hot = account(striping_db, "SB200000000002")
+        striping.set_stripe_count(striping_db, hot, 8)
+        for _ in range(10):
+            perform_transfer(striping_db, hot.user_id, "SB200000000001", "SB200000000002", 10)
+
+        assert striping.balance_of(striping_db, hot) == Decimal("600.00")
+        assert float(account(striping_db, "SB200000000001").balance) == 900.0
+
+    def test_credit_with_stale_stripe_count_is_not_lost(self, striping_db):
+        hot = account(striping_db, "SB200000000002")
+        striping.set_stripe_count(striping_db, hot, 8)
+        # Puts stripe_count=8 in the account directory
+        perform_transfer(striping_db, hot.user_id, "SB200000000001", "SB200000000002", 10)
+        # Restriped without the directory hearing of it
+        striping.set_stripe_count(striping_db, hot, 2)
+        perform_transfer(striping_db, hot.user_id, "SB200000000001", "SB200000000002", 10)
+        stale = SimpleNamespace(id=hot.id, stripe_count=8)
+        for _ in range(10):
+            striping.credit(striping_db, stale, Decimal("10"))
+        striping_db.commit()
+        striping.set_stripe_count(striping_db, hot, 0)
+        striping.credit(striping_db, stale, Decimal("10"))
+        striping_db.commit()
+
+        striping_db.expire_all()
+        assert striping.balance_of(striping_db, account(striping_db, "SB200000000002")) == Decimal("630.00")
+        assert account(striping_db, "SB200000000001").balance == Decimal("980.00")
+
+    def test_debit_drains_stripes(self, striping_db):
+        hot = account(striping_db, "SB200000000002")
+        striping.set_stripe_count(striping_db, hot, 4)
+        result = perform_transfer(striping_db, hot.user_id, "SB200000000002", "SB200000000001", 450)
+
+        assert result["new_balance"] == 50.0
+        assert striping.balance_of(striping_db, hot) == Decimal("50.00")
+
+    def test_credit_on_the_row_is_spendable_and_shown(self, striping_db):
+        hot = account(striping_db, "SB200000000002")
+        striping.set_stripe_count(striping_db, hot, 4)
+        # A credit made with a stale stripe count of 0 lands on the row
+        transfers.credit(striping_db, hot.id, Decimal("100"))
+        striping_db.commit()
+        striping_db.expire_all()
+
+        user = striping_db.query(User).first()
+        assert dashboard.load_dashboard(striping_db, user)["total_balance"] == 1600.0
+        assert striping.debit(striping_db, hot, Decimal("550")) == Decimal("50.00")
+        striping_db.commit()
+        striping_db.expire_all()
+        assert account(striping_db, "SB200000000002").balance == 0
+        assert striping.balance_of(striping_db, account(striping_db, "SB200000000002")) == Decimal("50.00")
+
+    def test_debit_insufficient_funds(self, striping_db):
+        hot = account(striping_db, "SB200000000002")
+        striping.set_stripe_count(striping_db, hot, 4)
+        with pytest.raises(TransferError) as exc:
+            perform_transfer(striping_db, hot.user_id, "SB200000000002", "SB200000000001", 501)
+        assert exc.value.detail == "Insufficient funds"
+
+    def test_disable_folds_balance_back(self, striping_db):
+        hot = account(striping_db, "SB200000000002")
+        striping.set_stripe_count(striping_db, hot, 4)
+        perform_transfer(striping_db, hot.user_id, "SB200000000001", "SB200000000002", 100)
+        striping.set_stripe_count(striping_db, hot, 0)
+
+        assert hot.stripe_count == 0
+        assert hot.balance == Decimal("600.00")
+        assert striping_db.query(AccountBalanceStripe).count() == 0
+
+    def test_invalid_stripe_count(self, striping_db):
+        with pytest.raises(ValueError):
+            striping.set_stripe_count(striping_db, account(striping_db, "SB200000000002"), striping.MAX_STRIPES + 1)
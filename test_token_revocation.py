@@ -0,0 +1,134 @@
+import pytest
+from datetime import datetime, timedelta
+from jose import jwt
+from sqlalchemy import event
+from models import RevokedToken
+from auth import SECRET_KEY, ALGORITHM, create_access_token, create_refresh_token
+import revocation
+from revocation import BloomFilter, RevocationList
+
+def login(client, test_user):
+    response = client.post("/api/login", json={"email": test_user.email, "password": "password123"})
+    assert response.status_code == 200
+    return response.json()
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+class TestBloomFilter:
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        keys = [f"jti-{n}" for n in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        assert all(key in bloom for key in keys)
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(1000, false_positive_rate=0.01)
+        for n in range(1000):
+            bloom.add(f"jti-{n}")
+        false_positives = sum(f"other-{n}" in bloom for n in range(10000))
+        assert false_positives < 300
+
+class TestRevocationList:
+    def test_live_tokens_skip_the_database(self, db_session, test_user):
+        revocations = RevocationList(capacity=64, sync_seconds=3600)
+        revocations.sync(db_session)
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+        try:
+            assert not revocations.is_revoked(db_session, "never-revoked")
+        finally:
+            event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+        assert statements == []
+
+    def test_other_processes_revocations_arrive_on_sync(self, db_session, test_user):
+        revocations = RevocationList(capacity=64, sync_seconds=0)
+        assert not revocations.is_revoked(db_session, "abc")
+        # Written by another worker, straight to the table
+        db_session.add(RevokedToken(jti="abc", user_id=test_user.id, expires_at=datetime.utcnow() + timedelta(minutes=5)))
+        db_session.commit()
+        assert revocations.is_revoked(db_session, "abc")
+
+    def test_row_committed_late_with_a_lower_id_arrives(self, db_session, test_user):
+        revocations = RevocationList(capacity=64, sync_seconds=0)
+        expires = datetime.utcnow() + timedelta(minutes=5)
+        db_session.add(RevokedToken(id=10, jti="later-id", user_id=test_user.id, expires_at=expires))
+        db_session.commit()
+        assert revocations.is_revoked(db_session, "later-id")
+        # Took its id before id 10 but committed after this worker synced
+        db_session.add(RevokedToken(id=5, jti="earlier-id", user_id=test_user.id, expires_at=expires))
+        db_session.commit()
+        assert revocations.is_revoked(db_session, "earlier-id")
+
+    def test_revoke_reports_whether_it_inserted(self, db_session, test_user):
+        revocations = RevocationList(capacity=64, sync_seconds=3600)
+        expires = datetime.utcnow() + timedelta(minutes=5)
+        assert revocations.revoke(db_session, "once", test_user.id, expires)
+        assert not revocations.revoke(db_session, "once", test_user.id, expires)
+        assert db_session.query(RevokedToken).filter(RevokedToken.jti == "once").count() == 1
+
+    def test_rebuild_when_full_drops_expired(self, db_session, test_user):
+        revocations = RevocationList(capacity=2, sync_seconds=3600)
+        past, future = datetime.utcnow() - timedelta(minutes=1), datetime.utcnow() + timedelta(minutes=5)
+        revocations.revoke(db_session, "old", test_user.id, past)
+        revocations.revoke(db_session, "new", test_user.id, future)
+        revocations.sync(db_session)
+        assert revocations._filter.count == 1
+        assert revocations.is_revoked(db_session, "new")
+
+    def test_sync_purges_expired_rows_periodically(self, db_session, test_user, monkeypatch):
+        revocations = RevocationList(capacity=64, sync_seconds=0, purge_seconds=60)
+        past = datetime.utcnow() - timedelta(minutes=1)
+        clock = [1000.0]
+        monkeypatch.setattr(revocation.time, "monotonic", lambda: clock[0])
+        revocations.sync(db_session)
+        # A stream ticket that expired after the first purge
+        revocations.revoke(db_session, "ticket", test_user.id, past)
+        revocations.sync(db_session)
+        assert db_session.query(RevokedToken).filter(RevokedToken.jti == "ticket").count() == 1
+        clock[0] += 60
+        revocations.sync(db_session)
+        assert db_session.query(RevokedToken).filter(RevokedToken.jti == "ticket").count() == 0
+
+class TestTokens:
+    def test_tokens_carry_jti_and_type(self):
+        access = jwt.decode(create_access_token({"sub": "a@example.com"}), SECRET_KEY, algorithms=[ALGORITHM])
+        refresh = jwt.decode(create_refresh_token({"sub": "a@example.com"}), SECRET_KEY, algorithms=[ALGORITHM])
+        assert access["type"] == "access" and refresh["type"] == "refresh"
+        assert access["jti"] != refresh["jti"]
+
+    def test_refresh_token_is_not_an_access_token(self, client, test_user):
+        tokens = login(client, test_user)
+        assert client.get("/api/kyc/status", headers=bearer(tokens["refresh_token"])).status_code == 401
+
+    def test_logout_revokes_both_tokens(self, client, test_user):
+        tokens = login(client, test_user)
+        headers = bearer(tokens["access_token"])
+        assert client.get("/api/kyc/status", headers=headers).status_code == 200
+        response = client.post("/api/logout", json={"refresh_token": tokens["refresh_token"]}, headers=headers)
+        assert response.status_code == 200
+        assert client.get("/api/kyc/status", headers=headers).status_code == 401
+        assert client.post("/api/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+    def test_refresh_rotates(self, client, test_user):
+        tokens = login(client, test_user)
+        response = client.post("/api/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 200
+        renewed = response.json()
+        assert client.get("/api/kyc/status", headers=bearer(renewed["access_token"])).status_code == 200
+        # The old refresh token was spent
+        assert client.post("/api/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+    def test_refresh_replayed_on_another_worker_is_refused(self, client, test_user, db_session, monkeypatch):
+        tokens = login(client, test_user)
+        # This worker synced before another worker spent the token
+        stale = RevocationList(capacity=64, sync_seconds=3600)
+        stale.sync(db_session)
+        monkeypatch.setattr(revocation, "revocations", stale)
+        claims = jwt.decode(tokens["refresh_token"], SECRET_KEY, algorithms=[ALGORITHM])
+        db_session.add(RevokedToken(jti=claims["jti"], user_id=test_user.id,
+                                    expires_at=datetime.utcnow() + timedelta(days=1)))
+        db_session.commit()
+        assert client.post("/api/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
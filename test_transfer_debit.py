@@ -0,0 +1,95 @@
+import pytest
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from models import Base, Account, Transaction, User, UserRole
+from transfers import TransferError, debit, perform_transfer, to_amount
+from auth import UserRecord, authenticate_user, get_password_hash, user_by_email
+
+@pytest.fixture
+def debit_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/debit.db")
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+@pytest.fixture
+def debit_db(debit_engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=debit_engine)()
+    user = User(
+        email="payer@example.com",
+        phone="6666666666",
+        password_hash=get_password_hash("password123"),
+        first_name="Payer",
+        last_name="User",
+        date_of_birth=datetime(1990, 1, 1),
+        address="Payer Address"
+    )
+    session.add(user)
+    session.commit()
+    session.add_all([
+        Account(account_number="SB500000000001", user_id=user.id, account_type="SAVINGS", balance=Decimal("100.10"), daily_limit=1000),
+        Account(account_number="SB500000000002", user_id=user.id, account_type="CURRENT", balance=0)
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+def balance(db, number):
+    return db.query(Account.balance).filter(Account.account_number == number).scalar()
+
+class TestConditionalDebit:
+    def test_debit_returns_new_balance(self, debit_db):
+        assert debit(debit_db, 1, Decimal("0.10")) == Decimal("100.00")
+        debit_db.commit()
+        assert balance(debit_db, "SB500000000001") == Decimal("100.00")
+
+    def test_insufficient_funds_leaves_balance(self, debit_db):
+        with pytest.raises(TransferError) as exc:
+            debit(debit_db, 1, Decimal("100.11"))
+        assert exc.value.detail == "Insufficient funds"
+        assert balance(debit_db, "SB500000000001") == Decimal("100.10")
+
+    def test_daily_limit_checked_in_statement(self, debit_db):
+        debit_db.query(Account).filter(Account.id == 1).update({Account.balance: 5000})
+        with pytest.raises(TransferError) as exc:
+            debit(debit_db, 1, Decimal("1000.01"))
+        assert exc.value.detail == "Amount exceeds daily limit"
+
+    def test_amounts_are_decimal_paise(self):
+        assert to_amount(0.1 + 0.2) == Decimal("0.30")
+        assert to_amount("12.345") == Decimal("12.34")
+        with pytest.raises(TransferError):
+            to_amount("ten")
+
+class TestTransferRoundTrips:
+    def test_repeated_small_transfers_do_not_drift(self, debit_db):
+        for _ in range(5):
+            perform_transfer(debit_db, 1, "SB500000000001", "SB500000000002", 0.1 + 0.2)
+        assert balance(debit_db, "SB500000000001") == Decimal("98.60")
+        assert balance(debit_db, "SB500000000002") == Decimal("1.50")
+
+    def test_transfer_statement_count(self, debit_engine, debit_db):
+        # Warm the account directory so only the transfer itself is measured
+        perform_transfer(debit_db, 1, "SB500000000001", "SB500000000002", 1)
+        statements = []
+        event.listen(debit_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        perform_transfer(debit_db, 1, "SB500000000001", "SB500000000002", 1)
+        # Debit and credit with RETURNING, ledger insert, then one outbox and one rollup upsert for both parties
+        assert len(statements) == 5
+        assert statements[0].startswith("UPDATE accounts")
+        assert debit_db.query(Transaction).count() == 2
+
+class TestCorePath:
+    def test_transfer_builds_no_orm_instances(self, debit_db):
+        perform_transfer(debit_db, 1, "SB500000000001", "SB500000000002", 1)
+        assert not any(isinstance(obj, Transaction) for obj in debit_db.identity_map.values())
+        assert debit_db.query(Transaction).count() == 1
+
+    def test_user_lookups_return_records(self, debit_db):
+        user = user_by_email(debit_db, "payer@example.com")
+        assert isinstance(user, UserRecord) and not hasattr(user, "__dict__")
+        assert (user.id, user.first_name, user.role) == (1, "Payer", UserRole.CUSTOMER)
+        assert authenticate_user(debit_db, "payer@example.com", "password123").id == 1
+        assert authenticate_user(debit_db, "payer@example.com", "wrong") is False
+        assert user_by_email(debit_db, "nobody@example.com") is None
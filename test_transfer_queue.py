@@ -0,0 +1,181 @@
+import pytest
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Account, User, QueuedTransfer, QueuedTransferStatus
+from transfer_queue import TransferWorkerPool, TransferQueueMetrics, enqueue_transfer, queue_depth
+from transfers import TransferError
+from auth import get_password_hash
+
+@pytest.fixture
+def queue_session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/queue.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture
+def accounts(queue_session_factory):
+    db = queue_session_factory()
+    user = User(
+        email="queue@example.com",
+        phone="1231231234",
+        password_hash=get_password_hash("password123"),
+        first_name="Queue",
+        last_name="User",
+        date_of_birth=datetime(1990, 1, 1),
+        address="Queue Address"
+    )
+    db.add(user)
+    db.commit()
+    db.add_all([
+        Account(account_number="SB100000000001", user_id=user.id, account_type="SAVINGS", balance=1000),
+        Account(account_number="SB100000000002", user_id=user.id, account_type="CURRENT", balance=0)
+    ])
+    db.commit()
+    user_id = user.id
+    db.close()
+    return user_id
+
+def balance_of(session_factory, account_number):
+    db = session_factory()
+    try:
+        return db.query(Account).filter(Account.account_number == account_number).first().balance
+    finally:
+        db.close()
+
+class TestTransferQueue:
+    def test_enqueue_rejects_non_positive_amount(self, queue_session_factory, accounts):
+        db = queue_session_factory()
+        with pytest.raises(TransferError):
+            enqueue_transfer(db, accounts, "SB100000000001", "SB100000000002", 0)
+        db.close()
+
+    def test_group_processed_in_order(self, queue_session_factory, accounts):
+        db = queue_session_factory()
+        ids = [
+            enqueue_transfer(db, accounts, "SB100000000001", "SB100000000002", 600).id,
+            enqueue_transfer(db, accounts, "SB100000000001", "SB100000000002", 600).id
+        ]
+        assert queue_depth(db) == 2
+        db.close()
+
+        pool = TransferWorkerPool(workers=2, session_factory=queue_session_factory)
+        groups = pool.claim_batch()
+        assert groups == {"SB100000000001": ids}
+        pool.process_group(groups["SB100000000001"])
+
+        db = queue_session_factory()
+        first, second = [db.query(QueuedTransfer).get(i) for i in ids]
+        assert first.status == QueuedTransferStatus.COMPLETED
+        assert second.status == QueuedTransferStatus.FAILED
+        assert second.error == "Insufficient funds"
+        db.close()
+        assert balance_of(queue_session_factory, "SB100000000002") == Decimal("600.00")
+
+    def test_interrupted_transfers_are_requeued(self, queue_session_factory, accounts):
+        db = queue_session_factory()
+        enqueue_transfer(db, accounts, "SB100000000001", "SB100000000002", 10)
+        db.close()
+
+        pool = TransferWorkerPool(workers=1, session_factory=queue_session_factory)
+        pool.claim_batch()
+        # Another process starting up leaves a live claim alone
+        other = TransferWorkerPool(workers=1, session_factory=queue_session_factory)
+        assert other.requeue_interrupted() == 0
+
+        db = queue_session_factory()
+        db.query(QueuedTransfer).update({QueuedTransfer.heartbeat_at: datetime.utcnow() - timedelta(minutes=5)})
+        db.commit()
+        db.close()
+        assert other.requeue_interrupted() == 1
+        assert other.claim_batch() == {"SB100000000001": [1]}
+
+        # The pool that lost its lease skips the row instead of running it twice
+        pool.process_group([1])
+        other.process_group([1])
+        assert balance_of(queue_session_factory, "SB100000000002") == Decimal("10.00")
+
+    def test_heartbeat_keeps_lease(self, queue_session_factory, accounts):
+        db = queue_session_factory()
+        enqueue_transfer(db, accounts, "SB100000000001", "SB100000000002", 10)
+        db.close()
+
+        pool = TransferWorkerPool(workers=1, session_factory=queue_session_factory, lease_seconds=60)
+        pool.claim_batch()
+        db = queue_session_factory()
+        db.query(QueuedTransfer).update({QueuedTransfer.heartbeat_at: datetime.utcnow() - timedelta(minutes=5)})
+        db.commit()
+        db.close()
+        assert pool.renew_leases() == 1
+        assert pool.requeue_interrupted() == 0
+
+    def test_unexpected_error_fails_the_transfer(self, queue_session_factory, accounts, monkeypatch):
+        import transfer_queue
+
+        db = queue_session_factory()
+        ids = [
+            enqueue_transfer(db, accounts, "SB100000000001", "SB100000000002", 10).id,
+            enqueue_transfer(db, accounts, "SB100000000001", "SB100000000002", 20).id
+        ]
+        db.close()
+
+        real_transfer = transfer_queue.perform_transfer
+        calls = []
+
+        def flaky_transfer(db, *args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise RuntimeError("connection reset")
+            return real_transfer(db, *args, **kwargs)
+
+        monkeypatch.setattr(transfer_queue, "perform_transfer", flaky_transfer)
+        pool = TransferWorkerPool(workers=1, session_factory=queue_session_factory)
+        pool.process_group(pool.claim_batch()["SB100000000001"])
+
+        db = queue_session_factory()
+        first, second = [db.query(QueuedTransfer).get(i) for i in ids]
+        assert first.status == QueuedTransferStatus.FAILED
+        assert first.error == "Transfer failed: connection reset"
+        assert second.status == QueuedTransferStatus.COMPLETED
+        db.close()
+        assert balance_of(queue_session_factory, "SB100000000002") == Decimal("20.00")
+
+    def test_worker_pool_drains_queue(self, queue_session_factory, accounts):
+        db = queue_session_factory()
+        for _ in range(5):
+            enqueue_transfer(db, accounts, "SB100000000001", "SB100000000002", 100)
+        db.close()
+
+        pool = TransferWorkerPool(workers=2, session_factory=queue_session_factory, poll_interval=0.01)
+        pool.start()
+        try:
+            deadline = time.time() + 5
+            while time.time() < deadline:
+                db = queue_session_factory()
+                remaining = db.query(QueuedTransfer).filter(
+                    QueuedTransfer.status != QueuedTransferStatus.COMPLETED
+                ).count()
+                db.close()
+                if remaining == 0:
+                    break
+                time.sleep(0.05)
+        finally:
+            pool.stop()
+
+        assert remaining == 0
+        assert balance_of(queue_session_factory, "SB100000000001") == Decimal("500.00")
+
+class TestTransferQueueMetrics:
+    def test_snapshot(self):
+        metrics = TransferQueueMetrics()
+        metrics.record_enqueued()
+        metrics.record_done(0.5, True)
+        metrics.record_done(1.5, False)
+        snapshot = metrics.snapshot()
+        assert snapshot["enqueued"] == 1
+        assert snapshot["completed"] == 1
+        assert snapshot["failed"] == 1
+        assert snapshot["queue_latency_max_seconds"] == 1.5
+        assert snapshot["throughput_per_second"] == pytest.approx(2 / 60)
@@ -0,0 +1,91 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, User
+from auth import get_password_hash, create_access_token
+from user_search import search_users
+
+PEOPLE = [
+    ("priya.sharma@example.com", "9876500001", "Priya", "Sharma"),
+    ("rahul_verma@example.com", "9876500002", "Rahul", "Verma"),
+    ("sharmila.iyer@example.com", "9123400003", "Sharmila", "Iyer"),
+    ("anil.kumar@example.org", "9123400004", "Anil", "Sharma"),
+]
+
+def add_people(db, role_for=None):
+    users = []
+    for email, phone, first, last in PEOPLE:
+        user = User(email=email, phone=phone, password_hash="-", first_name=first, last_name=last,
+                    date_of_birth=datetime(1990, 1, 1), address="Somewhere", role=(role_for or {}).get(email, "CUSTOMER"))
+        db.add(user)
+        users.append(user)
+    db.commit()
+    return users
+
+@pytest.fixture
+def search_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/search.db")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    add_people(session)
+    yield session
+    session.close()
+
+def emails(results):
+    return [user.email for user, _ in results]
+
+class TestUserSearch:
+    def test_substring_match_across_columns(self, search_db):
+        assert sorted(emails(search_users(search_db, "sharm"))) == [
+            "anil.kumar@example.org", "priya.sharma@example.com", "sharmila.iyer@example.com"
+        ]
+        assert emails(search_users(search_db, "500002")) == ["rahul_verma@example.com"]
+
+    def test_multiple_terms_must_all_match(self, search_db):
+        assert emails(search_users(search_db, "priya sharma")) == ["priya.sharma@example.com"]
+
+    def test_email_hits_rank_above_name_hits(self, search_db):
+        # "sharma" is in Priya's email and last name but only in Anil's last name
+        assert emails(search_users(search_db, "sharma"))[0] == "priya.sharma@example.com"
+
+    def test_short_query_uses_prefix(self, search_db):
+        assert emails(search_users(search_db, "91")) == ["sharmila.iyer@example.com", "anil.kumar@example.org"]
+        assert emails(search_users(search_db, "ra")) == ["rahul_verma@example.com"]
+
+    def test_pagination(self, search_db):
+        first_page = emails(search_users(search_db, "example", limit=2))
+        second_page = emails(search_users(search_db, "example", limit=2, offset=2))
+        assert len(first_page) == 2 and len(second_page) == 2
+        assert not set(first_page) & set(second_page)
+
+    def test_index_follows_updates_and_deletes(self, search_db):
+        user = search_db.query(User).filter(User.email == "anil.kumar@example.org").one()
+        user.last_name = "Menon"
+        search_db.commit()
+        assert "anil.kumar@example.org" not in emails(search_users(search_db, "sharma"))
+        assert emails(search_users(search_db, "menon")) == ["anil.kumar@example.org"]
+
+        search_db.delete(user)
+        search_db.commit()
+        assert search_users(search_db, "menon") == []
+
+    def test_query_syntax_is_not_interpreted(self, search_db):
+        assert search_users(search_db, 'sharma OR "verma') == []
+        assert search_users(search_db, "_%") == []
+
+class TestUserSearchEndpoint:
+    def test_admin_search(self, client, db_session):
+        add_people(db_session, role_for={"anil.kumar@example.org": "ADMIN"})
+        token = create_access_token(data={"sub": "anil.kumar@example.org"})
+        response = client.get("/api/admin/users/search", params={"q": "iyer", "page_size": 5},
+                              headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["has_more"] is False
+        assert [r["user"]["email"] for r in data["results"]] == ["sharmila.iyer@example.com"]
+        assert "password_hash" not in data["results"][0]["user"]
+
+    def test_requires_admin(self, client, auth_headers):
+        response = client.get("/api/admin/users/search", params={"q": "iyer"}, headers=auth_headers)
+        assert response.status_code == 403